@@ -0,0 +1,67 @@
+"""Gunicorn settings for production.
+
+Usage
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:8000 wsgi:app
+
+The application is imported once in the master (``preload_app``) so pandas,
+openpyxl and the templates are loaded a single time and shared copy-on-write
+by the workers, which also start faster. Engines created before the fork are
+disposed in ``post_fork``: a SQLite connection must never be used by two
+processes.
+
+Workers are ``gthread``: a request waiting on SQLite, the posting writer or
+a client download only blocks its own thread, so an export no longer takes a
+whole worker away from stock-outs. One worker per CPU runs Python code in
+parallel; threads cover the I/O waits. ``scripts/benchmark_gunicorn.py``
+compares these defaults with the previous three sync workers.
+
+Every setting can be overridden from the environment:
+
+    WMS_WORKERS            worker processes (default: CPU count, 2 to 8)
+    WMS_THREADS            threads per worker (default: 4)
+    WMS_WORKER_CLASS       gunicorn worker class (default: gthread)
+    WMS_PRELOAD            1 to import the app in the master (default: 1)
+    WMS_MAX_REQUESTS       requests before a worker is recycled (default: 1000)
+    WMS_TIMEOUT            seconds before a silent worker is restarted (default: 120)
+"""
+
+import multiprocessing
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# One worker per CPU; at least two so a restart never leaves the site down,
+# and at most eight since SQLite still admits a single writer at a time
+workers = _env_int("WMS_WORKERS", min(max(multiprocessing.cpu_count(), 2), 8))
+worker_class = os.getenv("WMS_WORKER_CLASS", "gthread")
+threads = _env_int("WMS_THREADS", 4)
+preload_app = os.getenv("WMS_PRELOAD", "1") == "1"
+
+# Recycle workers to contain memory growth from large exports; the jitter
+# keeps them from all restarting at the same moment
+max_requests = _env_int("WMS_MAX_REQUESTS", 1000)
+max_requests_jitter = max_requests // 10
+
+# Exports run up to the 60 s query budget plus rendering
+timeout = _env_int("WMS_TIMEOUT", 120)
+graceful_timeout = 30
+keepalive = 5
+
+# Heartbeat files on tmpfs so a slow disk cannot get workers killed
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def post_fork(server, worker):
+    from wms import app, db
+    from wms.readonly import dispose_read_engines
+
+    # Drop connections inherited from the master without closing them, which
+    # would also close them for the master
+    with app.app_context():
+        db.engine.dispose(close=False)
+    dispose_read_engines()
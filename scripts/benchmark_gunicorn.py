@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Benchmark gunicorn worker settings under a mix of exports and page loads.
+
+Starts gunicorn with gunicorn.conf.py once per configuration against a
+synthetic database in a temporary directory. ``--heavy`` clients keep
+downloading the records export (cache-busted, so every request is computed)
+while ``--light`` clients load the stock-out page, for ``--duration`` seconds.
+Reports requests per second for both kinds, the latency of the page loads,
+heavy requests turned away by admission control, and the proportional memory
+(PSS) of the master and its workers. Needs gunicorn, which is installed with
+the deployment rather than from requirements.txt.
+
+Each configuration is ``worker_class:workers:threads:preload``.
+
+Usage
+    python scripts/benchmark_gunicorn.py
+    python scripts/benchmark_gunicorn.py --configs sync:3:1:0 gthread:2:4:1
+    python scripts/benchmark_gunicorn.py --receipts 5000 --duration 30
+"""
+
+import argparse
+from http.cookiejar import CookieJar
+from pathlib import Path
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+DEFAULT_CONFIGS = ["sync:3:1:0", "gthread:3:1:1", "gthread:2:4:1", "gthread:4:4:1"]
+
+
+def _populate(workdir: Path, receipts: int, lines: int, seed: int) -> None:
+    """Create the synthetic database in a child process with its own settings."""
+    code = f"""
+import random
+from wms import app, db
+from wms.models import Area, Department, Item, ItemSKU, Receipt, ReceiptType
+from wms.models import Transaction, User, Warehouse
+
+rng = random.Random({seed})
+with app.app_context():
+    db.create_all()
+    user = User(username="bench", nickname="Bench", is_admin=True)
+    user.set_password("bench")
+    warehouse = Warehouse(name="Bench Warehouse", owner=user)
+    areas = [Area(name=f"区域{{i}}") for i in range(10)]
+    departments = [Department(name=f"部门{{i}}") for i in range(10)]
+    skus = [
+        ItemSKU(item=Item(name=f"物品{{i}}"), brand=f"品牌{{i % 7}}", spec=f"规格{{i}}")
+        for i in range(200)
+    ]
+    db.session.add_all([user, warehouse, *areas, *departments, *skus])
+    db.session.flush()
+    for r in range({receipts}):
+        receipt = Receipt(
+            operator=user,
+            warehouse=warehouse,
+            type=ReceiptType.STOCKOUT,
+            area=rng.choice(areas),
+            department=rng.choice(departments),
+            location=f"地点{{r % 13}}",
+        )
+        db.session.add(receipt)
+        for _ in range({lines}):
+            db.session.add(
+                Transaction(
+                    itemSKU=rng.choice(skus),
+                    count=-rng.randint(1, 20),
+                    price=rng.randint(100, 99999) / 100,
+                    receipt=receipt,
+                )
+            )
+        if r % 200 == 0:
+            db.session.flush()
+    db.session.commit()
+"""
+    subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, env=_server_env(workdir), check=True
+    )
+
+
+def _server_env(workdir: Path) -> dict:
+    env = dict(os.environ)
+    env.pop("TESTING", None)
+    env["DATABASE_FILE"] = str(workdir / "bench.db")
+    env["REPORT_CACHE_DIR"] = str(workdir / "cache")
+    env["SECRET_KEY"] = "benchmark"
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    """A logged-in browser session."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar())
+        )
+        page = self.get("/login")[1].decode()
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        form = {"username": "bench", "password": "bench", "remember": "y"}
+        form["csrf_token"] = token.group(1)
+        self.opener.open(
+            base + "/login", urllib.parse.urlencode(form).encode(), timeout=300
+        ).read()
+
+    def get(self, path: str) -> tuple[int, bytes]:
+        try:
+            with self.opener.open(self.base + path, timeout=300) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+def _pss_kib(pid: int) -> int:
+    """Proportional memory of ``pid`` and its children, in KiB."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            rollup = Path(f"/proc/{current}/smaps_rollup").read_text()
+            total += int(re.search(r"^Pss:\s+(\d+)", rollup, re.M).group(1))
+            children = Path(f"/proc/{current}/task/{current}/children").read_text()
+        except (OSError, AttributeError):
+            continue
+        pending.extend(int(child) for child in children.split())
+    return total
+
+
+def _start_server(spec: str, workdir: Path, port: int) -> subprocess.Popen:
+    worker_class, workers, threads, preload = spec.split(":")
+    env = _server_env(workdir)
+    env.update(
+        WMS_WORKER_CLASS=worker_class,
+        WMS_WORKERS=workers,
+        WMS_THREADS=threads,
+        WMS_PRELOAD=preload,
+    )
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            str(ROOT_DIR / "gunicorn.conf.py"),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "wsgi:app",
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(workdir / "gunicorn.log", "a"),
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=5).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn did not start, see {workdir / 'gunicorn.log'}")
+
+
+def _run_load(base: str, heavy: int, light: int, duration: float) -> dict:
+    results = {"heavy": [], "rejected": 0, "light": []}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+    sessions = [Client(base) for _ in range(heavy + light)]
+    for session in sessions:
+        # Consume the login flash; pages with pending flashes bypass the cache
+        session.get("/inventory")
+
+    def heavy_client(session, n):
+        counter = 0
+        while time.monotonic() < stop:
+            counter += 1
+            start = time.perf_counter()
+            status, _ = session.get(f"/records/export?type=stockout&_={n}-{counter}")
+            with lock:
+                if status == 503:
+                    results["rejected"] += 1
+                else:
+                    results["heavy"].append(time.perf_counter() - start)
+
+    def light_client(session):
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            session.get("/stockout")
+            with lock:
+                results["light"].append(time.perf_counter() - start)
+
+    clients = [
+        threading.Thread(target=heavy_client, args=(sessions[i], i))
+        for i in range(heavy)
+    ] + [threading.Thread(target=light_client, args=(s,)) for s in sessions[heavy:]]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return results
+
+
+def _report(spec: str, results: dict, duration: float, pss: int) -> None:
+    light = sorted(results["light"]) or [0.0]
+    p95 = light[min(len(light) - 1, int(len(light) * 0.95))]
+    print(
+        f"{spec:<14} export {len(results['heavy']) / duration:6.2f}/s "
+        f"(503 {results['rejected']:4d})   page {len(light) / duration:7.2f}/s "
+        f"p50 {statistics.median(light) * 1000:7.1f} ms p95 {p95 * 1000:7.1f} ms   "
+        f"pss {pss / 1024:7.1f} MiB"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=10)
+    parser.add_argument("--heavy", type=int, default=2)
+    parser.add_argument("--light", type=int, default=6)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=20250214)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        _populate(workdir, args.receipts, args.lines, args.seed)
+        print(
+            f"cpus={os.cpu_count()} transactions={args.receipts * args.lines} "
+            f"clients={args.heavy} export + {args.light} page, {args.duration:g}s each"
+        )
+        for spec in args.configs:
+            port = _free_port()
+            server = _start_server(spec, workdir, port)
+            try:
+                results = _run_load(
+                    f"http://127.0.0.1:{port}", args.heavy, args.light, args.duration
+                )
+                pss = _pss_kib(server.pid)
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+            _report(spec, results, args.duration, pss)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Benchmark the /records row query and the records export loader.
+
+Compares the previous entity queries (Transaction with five nested joinedloads,
+and per-row dicts plus DataFrame.apply for the export) against the flat
+projections now used by wms.routes.records. Both page queries use the same
+ordering and indexes, so the difference is ORM hydration. Runs against a synthetic in-memory
+database and reports CPU time and peak Python memory per request.
+
+Usage
+    python scripts/benchmark_records.py
+    python scripts/benchmark_records.py --receipts 2000 --lines 20 --repeat 50
+"""
+
+import argparse
+from pathlib import Path
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Use the in-memory database; this never touches data.db
+os.environ["TESTING"] = "True"
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import pandas as pd  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+from wms import app, db  # noqa: E402
+from wms.models import (  # noqa: E402
+    Area,
+    Department,
+    Item,
+    ItemSKU,
+    Receipt,
+    ReceiptType,
+    Transaction,
+    User,
+    Warehouse,
+)
+from wms.routes.records import RecordRow, _record_rows_query  # noqa: E402
+
+PER_PAGE = 20
+
+
+def _populate(receipts: int, lines: int, seed: int) -> None:
+    rng = random.Random(seed)
+    user = User(username="bench", nickname="Bench", is_admin=True)
+    user.set_password("bench")
+    warehouse = Warehouse(name="Bench Warehouse", owner=user)
+    areas = [Area(name=f"区域{i}") for i in range(10)]
+    departments = [Department(name=f"部门{i}") for i in range(10)]
+    skus = []
+    for i in range(200):
+        item = Item(name=f"物品{i}")
+        skus.append(ItemSKU(item=item, brand=f"品牌{i % 7}", spec=f"规格{i}"))
+    db.session.add_all([user, warehouse, *areas, *departments, *skus])
+    db.session.flush()
+
+    for r in range(receipts):
+        receipt = Receipt(
+            operator=user,
+            warehouse=warehouse,
+            type=ReceiptType.STOCKOUT,
+            area=rng.choice(areas),
+            department=rng.choice(departments),
+            location=f"地点{r % 13}",
+            note="bench",
+        )
+        db.session.add(receipt)
+        for _ in range(lines):
+            db.session.add(
+                Transaction(
+                    itemSKU=rng.choice(skus),
+                    count=-rng.randint(1, 20),
+                    price=rng.randint(100, 99999) / 100,
+                    receipt=receipt,
+                )
+            )
+        if r % 200 == 0:
+            db.session.flush()
+    db.session.commit()
+
+
+def _legacy_page(page: int):
+    query = (
+        db.session.query(Transaction)
+        .join(Receipt)
+        .join(Warehouse)
+        .join(ItemSKU)
+        .join(Item)
+        .options(
+            joinedload(Transaction.receipt).joinedload(Receipt.warehouse),
+            joinedload(Transaction.receipt).joinedload(Receipt.operator),
+            joinedload(Transaction.receipt).joinedload(Receipt.area),
+            joinedload(Transaction.receipt).joinedload(Receipt.department),
+            joinedload(Transaction.itemSKU).joinedload(ItemSKU.item),
+        )
+        .order_by(Transaction.date.desc(), Transaction.id.asc())
+    )
+    rows = query.limit(PER_PAGE).offset((page - 1) * PER_PAGE).all()
+    # Touch what the template used to read
+    for t in rows:
+        (t.receipt.warehouse.name, t.receipt.operator.nickname, t.itemSKU.item.name)
+        (t.receipt.area and t.receipt.area.name, t.receipt.department)
+    return rows
+
+
+def _projection_page(page: int):
+    query = _record_rows_query().order_by(Transaction.date.desc(), Transaction.id.asc())
+    rows = query.limit(PER_PAGE).offset((page - 1) * PER_PAGE).all()
+    return [RecordRow(*row) for row in rows]
+
+
+def _export_query():
+    return (
+        db.session.query(
+            Receipt.date,
+            Item.name.label("item_name"),
+            ItemSKU.brand,
+            ItemSKU.spec,
+            Transaction.count,
+            Transaction.price,
+            Warehouse.name.label("warehouse_name"),
+            Receipt.refcode,
+            User.nickname.label("operator_name"),
+            Area.name.label("area_name"),
+            Department.name.label("department_name"),
+            Receipt.location,
+            Receipt.note,
+        )
+        .select_from(Transaction)
+        .join(Receipt, Transaction.receipt_id == Receipt.id)
+        .join(ItemSKU, Transaction.itemSKU_id == ItemSKU.id)
+        .join(Item, ItemSKU.item_id == Item.id)
+        .join(Warehouse, Receipt.warehouse_id == Warehouse.id)
+        .outerjoin(User, Receipt.operator_id == User.id)
+        .outerjoin(Area, Receipt.area_id == Area.id)
+        .outerjoin(Department, Receipt.department_id == Department.id)
+    )
+
+
+def _legacy_export():
+    results = _export_query().all()
+    df = pd.DataFrame([r._asdict() for r in results])
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d %H:%M")
+    df["count"] = df.apply(lambda x: -x["count"], axis=1)
+    df["price"] = df["price"].apply(lambda x: "{:.2f}".format(float(x)))
+    return df
+
+
+def _projection_export():
+    query = _export_query()
+    results = query.all()
+    df = pd.DataFrame.from_records(
+        results, columns=[c["name"] for c in query.column_descriptions]
+    )
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d %H:%M")
+    df["count"] = -df["count"]
+    df["price"] = df["price"].map("{:.2f}".format)
+    return df
+
+
+def _measure(repeat: int, func, *args) -> tuple[float, int]:
+    """Return (best CPU seconds, peak traced bytes) over ``repeat`` calls."""
+    best = float("inf")
+    peak = 0
+    for _ in range(repeat):
+        db.session.expunge_all()
+        tracemalloc.start()
+        start = time.process_time()
+        func(*args)
+        best = min(best, time.process_time() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak
+
+
+def _report(label: str, legacy, projection) -> None:
+    (legacy_cpu, legacy_mem), (new_cpu, new_mem) = legacy, projection
+    print(
+        f"{label:<14} cpu {legacy_cpu * 1000:8.2f} ms -> {new_cpu * 1000:8.2f} ms "
+        f"({legacy_cpu / new_cpu:5.2f}x)   peak {legacy_mem / 1024:9.1f} KiB -> "
+        f"{new_mem / 1024:9.1f} KiB ({legacy_mem / max(new_mem, 1):5.2f}x)"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--export-repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=20250214)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        _populate(args.receipts, args.lines, args.seed)
+        print(f"transactions={args.receipts * args.lines} page size={PER_PAGE}")
+        for page in (1, 50):
+            _report(
+                f"records p{page}",
+                _measure(args.repeat, _legacy_page, page),
+                _measure(args.repeat, _projection_page, page),
+            )
+        _report(
+            "export",
+            _measure(args.export_repeat, _legacy_export),
+            _measure(args.export_repeat, _projection_export),
+        )
+        db.session.remove()
+        db.drop_all()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Benchmark the usage-statistics engine against the previous nested loops.
+
+Generates a synthetic, sparse set of aggregated (SKU, area, department) rows and
+times both the legacy dict-walking implementation (kept here for comparison)
+and the ``wms.statistics`` summary plus every usage tab, as the statistics
+page and its tab endpoint compute them. No database is needed.
+
+Usage
+    python scripts/benchmark_statistics_usage.py
+    python scripts/benchmark_statistics_usage.py --skus 5000 --cells 40000
+"""
+
+import argparse
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+import random
+import sys
+import time
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from wms.statistics import USAGE_TABS, summarize, usage_frame  # noqa: E402
+
+
+def _pandas_usage_views(rows):
+    frame = usage_frame(rows)
+    views = summarize(frame)
+    skus = views.pop("skus")
+    views["usage_data"] = list(views["usage_data"])
+    for view in USAGE_TABS.values():
+        for name, value in view(frame, skus).items():
+            views[name] = value if isinstance(value, dict) else list(value)
+    return views
+
+
+def _synthetic_rows(skus: int, areas: int, departments: int, cells: int, seed: int):
+    rng = random.Random(seed)
+    keys = set()
+    while len(keys) < cells:
+        keys.add(
+            (
+                rng.randint(1, skus),
+                rng.choice([None] + list(range(1, areas + 1))),
+                rng.choice([None] + list(range(1, departments + 1))),
+            )
+        )
+    rows = []
+    for sku_id, area_id, dept_id in sorted(keys, key=lambda k: (k[0], k[1] or 0)):
+        usage = rng.randint(1, 50)
+        cents = usage * rng.randint(100, 50000)
+        rows.append(
+            (
+                sku_id,
+                sku_id,
+                f"物品{sku_id % 997}",
+                f"品牌{sku_id % 13}",
+                f"规格{sku_id}",
+                area_id,
+                dept_id,
+                usage,
+                cents,
+            )
+        )
+    return rows
+
+
+def _legacy_usage_views(rows, areas, departments):
+    """The previous implementation, walking SKUs × areas × departments.
+
+    Mirrors the old route: one pass for the per-SKU totals, three nested dict
+    aggregations, then dense loops over every area and department.
+    """
+    sku_base = {}
+    for sku_id, item_id, name, brand, spec, _, _, usage, cents in rows:
+        key = (sku_id, item_id)
+        if key not in sku_base:
+            sku_base[key] = {
+                "itemsku": SimpleNamespace(id=sku_id, brand=brand, spec=spec),
+                "item": SimpleNamespace(id=item_id, name=name),
+                "total_usage": 0,
+                "total_value": Decimal("0"),
+            }
+        sku_base[key]["total_usage"] += usage
+        sku_base[key]["total_value"] += Decimal(cents) / 100
+    for base in sku_base.values():
+        base["average_price"] = base["total_value"] / base["total_usage"]
+
+    sku_area_agg = {}
+    sku_dept_agg = {}
+    sku_dept_area_agg = {}
+    for sku_id, item_id, _, _, _, area_id, dept_id, usage, cents in rows:
+        key = (sku_id, item_id)
+        value = Decimal(cents) / 100
+        if key not in sku_area_agg:
+            sku_area_agg[key] = {}
+        if area_id:
+            if area_id not in sku_area_agg[key]:
+                sku_area_agg[key][area_id] = [0, Decimal("0")]
+            sku_area_agg[key][area_id][0] += usage
+            sku_area_agg[key][area_id][1] += value
+        if key not in sku_dept_agg:
+            sku_dept_agg[key] = {}
+        if dept_id:
+            if dept_id not in sku_dept_agg[key]:
+                sku_dept_agg[key][dept_id] = [0, Decimal("0")]
+            sku_dept_agg[key][dept_id][0] += usage
+            sku_dept_agg[key][dept_id][1] += value
+        if key not in sku_dept_area_agg:
+            sku_dept_area_agg[key] = {}
+        if dept_id and area_id:
+            if dept_id not in sku_dept_area_agg[key]:
+                sku_dept_area_agg[key][dept_id] = {}
+            if area_id not in sku_dept_area_agg[key][dept_id]:
+                sku_dept_area_agg[key][dept_id][area_id] = [0, Decimal("0")]
+            sku_dept_area_agg[key][dept_id][area_id][0] += usage
+            sku_dept_area_agg[key][dept_id][area_id][1] += value
+
+    def sort_key(row):
+        return (row["item"].name, row["itemsku"].brand, row["itemsku"].spec)
+
+    def dense_list(agg, ids, usage_key, value_key):
+        result = []
+        for key, base in sku_base.items():
+            usage_map, value_map = {}, {}
+            usage_total, value_total = 0, Decimal("0")
+            data = agg.get(key, {})
+            for i in ids:
+                cell = data.get(i, [0, Decimal("0")])
+                usage_map[i] = cell[0]
+                value_map[i] = cell[1]
+                usage_total += cell[0]
+                value_total += cell[1]
+            result.append(
+                {
+                    "itemsku": base["itemsku"],
+                    "item": base["item"],
+                    usage_key: usage_map,
+                    value_key: value_map,
+                    "total_usage": usage_total,
+                    "average_price": (
+                        value_total / usage_total
+                        if usage_total > 0
+                        else base["average_price"]
+                    ),
+                    "total_value": value_total,
+                }
+            )
+        result.sort(key=sort_key)
+        return result
+
+    area_list = dense_list(sku_area_agg, areas, "area_usage", "area_value")
+    dept_list = dense_list(sku_dept_agg, departments, "dept_usage", "dept_value")
+
+    detailed_by_dept = {}
+    for dept_id in departments:
+        dept_items = []
+        for key, base in sku_base.items():
+            usage_map, value_map = {}, {}
+            usage_total, value_total = 0, Decimal("0")
+            data = sku_dept_area_agg.get(key, {}).get(dept_id, {})
+            for area_id in areas:
+                cell = data.get(area_id, [0, Decimal("0")])
+                usage_map[area_id] = cell[0]
+                value_map[area_id] = cell[1]
+                usage_total += cell[0]
+                value_total += cell[1]
+            if usage_total == 0:
+                continue
+            dept_items.append(
+                {
+                    "itemsku": base["itemsku"],
+                    "item": base["item"],
+                    "area_usage": usage_map,
+                    "area_value": value_map,
+                    "total_usage": usage_total,
+                    "average_price": value_total / usage_total,
+                    "total_value": value_total,
+                }
+            )
+        if dept_items:
+            dept_items.sort(key=sort_key)
+            detailed_by_dept[dept_id] = dept_items
+    return area_list, dept_list, detailed_by_dept
+
+
+def _best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--skus", type=int, default=3000)
+    parser.add_argument("--areas", type=int, default=19)
+    parser.add_argument("--departments", type=int, default=17)
+    parser.add_argument("--cells", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=20250214)
+    args = parser.parse_args()
+
+    rows = _synthetic_rows(
+        args.skus, args.areas, args.departments, args.cells, args.seed
+    )
+    areas = list(range(1, args.areas + 1))
+    departments = list(range(1, args.departments + 1))
+
+    legacy = _best_of(args.repeat, _legacy_usage_views, rows, areas, departments)
+    engine = _best_of(args.repeat, _pandas_usage_views, rows)
+
+    print(
+        f"rows={len(rows)} skus≤{args.skus} areas={args.areas} "
+        f"departments={args.departments}"
+    )
+    print(f"legacy nested loops : {legacy * 1000:9.1f} ms")
+    print(f"pandas pivot engine : {engine * 1000:9.1f} ms")
+    print(f"speedup             : {legacy / engine:9.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
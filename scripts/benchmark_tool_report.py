@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Benchmark the tool holdings and consumption report.
+
+Populates a synthetic in-memory database with crews, employees and tool
+transactions, then times the grouped queries plus pivot behind /tools/report
+and the XLSX export (against DataFrame.to_excel), and shows the query plan of the movement aggregate.
+
+Usage
+    python scripts/benchmark_tool_report.py
+    python scripts/benchmark_tool_report.py --receipts 20000 --repeat 5
+"""
+
+import argparse
+from io import BytesIO
+from pathlib import Path
+import os
+import random
+import sys
+import time
+
+# Use the in-memory database; this never touches data.db
+os.environ["TESTING"] = "True"
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from sqlalchemy import text  # noqa: E402
+from wms import app, db  # noqa: E402
+from wms.models import (  # noqa: E402
+    Employee,
+    EmployeeToolHolding,
+    Item,
+    ItemSKU,
+    ToolReceipt,
+    ToolReceiptType,
+    ToolTransaction,
+    User,
+)
+from wms.routes.tool import _tool_report  # noqa: E402
+from wms.tool_statistics import (  # noqa: E402
+    TOOL_REPORT_HEADERS,
+    write_tool_report_xlsx,
+)
+
+MOVEMENTS = [
+    ToolReceiptType.REQUISITION,
+    ToolReceiptType.EXCHANGE,
+    ToolReceiptType.RETURN,
+]
+
+
+def _populate(crews: int, employees: int, receipts: int, seed: int) -> None:
+    rng = random.Random(seed)
+    users = []
+    for c in range(crews):
+        user = User(username=f"crew{c}", nickname=f"班组{c}")
+        user.set_password("bench")
+        users.append(user)
+    skus = [
+        ItemSKU(item=Item(name=f"工具{i}"), brand="品牌", spec=f"规格{i}")
+        for i in range(80)
+    ]
+    db.session.add_all([*users, *skus])
+    db.session.flush()
+    staff = [
+        Employee(employee_id=f"E{n:05d}", name=f"员工{n}", user_id=users[n % crews].id)
+        for n in range(employees)
+    ]
+    db.session.add_all(staff)
+    db.session.flush()
+
+    held = {}
+    for r in range(receipts):
+        employee = rng.choice(staff)
+        receipt = ToolReceipt(
+            type=rng.choice(MOVEMENTS),
+            employee_id=employee.id,
+            operator_id=employee.user_id,
+        )
+        db.session.add(receipt)
+        for sku in rng.sample(skus, 3):
+            count = rng.randint(1, 3)
+            receipt.transactions.append(
+                ToolTransaction(itemSKU_id=sku.id, count=count, employee_id=employee.id)
+            )
+            key = (employee.id, sku.id)
+            held[key] = held.get(key, 0) + count
+        if r % 1000 == 0:
+            db.session.flush()
+    db.session.add_all(
+        EmployeeToolHolding(employee_id=e, itemSKU_id=s, count=c)
+        for (e, s), c in held.items()
+    )
+    db.session.commit()
+
+
+def _pandas_export(frame) -> int:
+    excel_file = BytesIO()
+    frame.rename(columns=TOOL_REPORT_HEADERS).to_excel(
+        excel_file, index=False, engine="openpyxl"
+    )
+    return excel_file.tell()
+
+
+def _export(frame) -> int:
+    excel_file = BytesIO()
+    write_tool_report_xlsx(frame, excel_file)
+    return excel_file.tell()
+
+
+def _best(repeat: int, func, *args) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crews", type=int, default=10)
+    parser.add_argument("--employees", type=int, default=400)
+    parser.add_argument("--receipts", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=20261019)
+    args = parser.parse_args()
+
+    filters = {"start_date": "2000-01-01", "end_date": "2999-12-31", "crew_id": None}
+    with app.app_context():
+        db.create_all()
+        _populate(args.crews, args.employees, args.receipts, args.seed)
+        lines = db.session.query(ToolTransaction).count()
+        print(f"tool transactions={lines} employees={args.employees}")
+
+        plan = db.session.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT t.employee_id, t.itemSKU_id, r.type,"
+                " sum(t.count) FROM tool_transaction t JOIN tool_receipt r"
+                " ON t.tool_receipt_id = r.id GROUP BY 1, 2, 3"
+            )
+        ).all()
+        for row in plan:
+            print(f"  plan: {row[-1]}")
+
+        seconds, frame = _best(args.repeat, _tool_report, filters)
+        print(f"report  {seconds * 1000:8.1f} ms  rows={len(frame)}")
+        filters["crew_id"] = db.session.query(User.id).first()[0]
+        seconds, crew_frame = _best(args.repeat, _tool_report, filters)
+        print(f"1 crew  {seconds * 1000:8.1f} ms  rows={len(crew_frame)}")
+        seconds, size = _best(args.repeat, _pandas_export, frame)
+        print(f"to_excel{seconds * 1000:8.1f} ms  size={size / 1024:.0f} KiB")
+        seconds, size = _best(args.repeat, _export, frame)
+        print(f"xlsx    {seconds * 1000:8.1f} ms  size={size / 1024:.0f} KiB")
+        db.session.remove()
+        db.drop_all()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
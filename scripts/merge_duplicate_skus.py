@@ -19,6 +19,9 @@ import sqlite3
 import argparse
 from typing import List, Tuple
 
+# warehouse_item_sku.average_price is stored in micro-units
+MICROS_PER_UNIT = 1_000_000
+
 
 def get_duplicates(cursor) -> List[Tuple]:
     """Get all duplicate SKU groups."""
@@ -124,16 +127,19 @@ def merge_warehouse_inventory(
                         new_price = keep_price
                     else:
                         # Weighted average: (count1 * price1 + count2 * price2) / (count1 + count2)
-                        new_price = (
-                            keep_count * keep_price + merge_count * merge_price
-                        ) / new_count
+                        # Prices are integer micro-units (see wms/money.py)
+                        new_price = round(
+                            (keep_count * keep_price + merge_count * merge_price)
+                            / new_count
+                        )
                 else:
                     new_price = 0
 
                 changes.append(
                     f"Warehouse {warehouse_id}: Update inventory for SKU {keep_id}: "
                     f"count {keep_count} + {merge_count} = {new_count}, "
-                    f"avg_price {keep_price:.2f} -> {new_price:.2f}"
+                    f"avg_price {keep_price / MICROS_PER_UNIT:.2f} -> "
+                    f"{new_price / MICROS_PER_UNIT:.2f}"
                 )
 
                 if not dry_run:
@@ -149,7 +155,7 @@ def merge_warehouse_inventory(
                 # Create new inventory entry for keep_id
                 changes.append(
                     f"Warehouse {warehouse_id}: Create new inventory for SKU {keep_id}: "
-                    f"count {merge_count}, avg_price {merge_price:.2f}"
+                    f"count {merge_count}, avg_price {merge_price / MICROS_PER_UNIT:.2f}"
                 )
 
                 if not dry_run:
@@ -0,0 +1,10 @@
+-- Migration: Indexes for the aggregated employee roster
+-- Date: 2026-10-19
+-- Index names match SQLAlchemy's (index=True on Employee.user_id, and
+-- ToolReceipt.__table_args__). Run once against an existing database:
+--     sqlite3 data.db < scripts/migration_employee_roster.sql
+
+CREATE INDEX IF NOT EXISTS ix_employee_user_id ON employee (user_id);
+CREATE INDEX IF NOT EXISTS ix_tool_receipt_employee_date ON tool_receipt (employee_id, date);
+
+ANALYZE;
@@ -0,0 +1,65 @@
+-- Migration: Store prices and values as integer minor units
+-- Date: 2026-10-19
+-- Matches the Money columns in wms/models.py (see wms/money.py):
+--   transaction.price            cents       (was NUMERIC(10,2))
+--   receipt.total_value          cents       (was NUMERIC(12,2))
+--   warehouse_item_sku.average_price  micro-units (was FLOAT)
+-- "transaction" is a reserved word in SQLite and must stay quoted.
+--
+-- NUMERIC columns keep integer values as integers, so prices and totals are
+-- converted in place. FLOAT columns would turn them back into REAL, so
+-- warehouse_item_sku is rebuilt with an INTEGER column. Run this exactly once,
+-- inside a maintenance window and after a backup:
+--     sqlite3 data.db < scripts/migration_money_units.sql
+--
+-- Ordering: run scripts/migration_receipt_totals.sql FIRST. It adds
+-- receipt.total_value and backfills it in yuan; this script converts that
+-- yuan total to cents. Running this script before it, a second time, or on a
+-- database created by the application after this change would rescale values
+-- that are already in minor units, so the guard below aborts the whole script
+-- unless receipt.total_value exists and average_price is still a FLOAT column
+-- (this script is what turns it into INTEGER).
+
+.bail on
+
+CREATE TEMP TABLE money_units_guard (
+    receipt_totals INTEGER CONSTRAINT run_migration_receipt_totals_first CHECK (receipt_totals),
+    float_prices INTEGER CONSTRAINT money_units_already_applied CHECK (float_prices)
+);
+INSERT INTO money_units_guard (receipt_totals, float_prices)
+SELECT (SELECT COUNT(*) FROM pragma_table_info('receipt')
+        WHERE name = 'total_value'),
+       (SELECT COUNT(*) FROM pragma_table_info('warehouse_item_sku')
+        WHERE name = 'average_price' AND upper(type) = 'FLOAT');
+DROP TABLE money_units_guard;
+
+PRAGMA foreign_keys = OFF;
+
+BEGIN;
+
+-- 1. Line prices and receipt totals: yuan -> cents
+UPDATE "transaction" SET price = CAST(ROUND(price * 100) AS INTEGER);
+UPDATE receipt SET total_value = CAST(ROUND(total_value * 100) AS INTEGER);
+
+-- 2. Average prices: yuan -> micro-units, in an INTEGER column
+CREATE TABLE warehouse_item_sku_new (
+    warehouse_id INTEGER NOT NULL,
+    "itemSKU_id" INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    average_price INTEGER NOT NULL,
+    PRIMARY KEY (warehouse_id, "itemSKU_id"),
+    FOREIGN KEY (warehouse_id) REFERENCES warehouse (id),
+    FOREIGN KEY ("itemSKU_id") REFERENCES item_sku (id)
+);
+INSERT INTO warehouse_item_sku_new (warehouse_id, "itemSKU_id", count, average_price)
+SELECT warehouse_id, "itemSKU_id", count,
+       CAST(ROUND(COALESCE(average_price, 0) * 1000000) AS INTEGER)
+FROM warehouse_item_sku;
+DROP TABLE warehouse_item_sku;
+ALTER TABLE warehouse_item_sku_new RENAME TO warehouse_item_sku;
+
+COMMIT;
+
+PRAGMA foreign_keys = ON;
+
+ANALYZE;
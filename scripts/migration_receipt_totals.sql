@@ -0,0 +1,32 @@
+-- Migration: Store receipt totals on the receipt row
+-- Date: 2026-10-19
+-- Column names match SQLAlchemy's default (attribute name used as-is).
+-- "transaction" is a reserved word in SQLite and must stay quoted.
+--
+-- Receipt.total_value and Receipt.line_count are maintained as transactions
+-- are posted, edited or deleted (see wms/models.py); this backfills them for
+-- existing receipts:
+--     sqlite3 data.db < scripts/migration_receipt_totals.sql
+--
+-- Ordering: run this BEFORE scripts/migration_money_units.sql. The backfill
+-- sums prices in yuan and the money-units migration then converts the stored
+-- totals to cents; that script refuses to run until this one has been applied.
+
+.bail on
+
+BEGIN;
+
+ALTER TABLE receipt ADD COLUMN total_value NUMERIC(12, 2) NOT NULL DEFAULT 0;
+ALTER TABLE receipt ADD COLUMN line_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE receipt
+SET total_value = COALESCE(
+        (SELECT ROUND(SUM("transaction".count * "transaction".price), 2)
+         FROM "transaction"
+         WHERE "transaction".receipt_id = receipt.id),
+        0),
+    line_count = (SELECT COUNT(*)
+                  FROM "transaction"
+                  WHERE "transaction".receipt_id = receipt.id);
+
+COMMIT;
@@ -0,0 +1,38 @@
+-- Migration: Daily tool exchange rollup for the exchange frequency page
+-- Date: 2026-10-19
+-- Table and index names match ToolExchangeRollup in wms/models.py.
+-- New exchanges are added to the rollup when they are posted; this script
+-- creates the table and backfills it from the existing exchange slips.
+-- Run once against an existing database:
+--     sqlite3 data.db < scripts/migration_tool_exchange_rollup.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS tool_exchange_rollup (
+    employee_id INTEGER NOT NULL,
+    "itemSKU_id" INTEGER NOT NULL,
+    day DATE NOT NULL,
+    pieces INTEGER NOT NULL,
+    exchanges INTEGER NOT NULL,
+    PRIMARY KEY (employee_id, "itemSKU_id", day),
+    FOREIGN KEY (employee_id) REFERENCES employee (id),
+    FOREIGN KEY ("itemSKU_id") REFERENCES item_sku (id)
+);
+CREATE INDEX IF NOT EXISTS ix_tool_exchange_rollup_day ON tool_exchange_rollup (day);
+
+DELETE FROM tool_exchange_rollup;
+INSERT INTO tool_exchange_rollup (employee_id, "itemSKU_id", day, pieces, exchanges)
+SELECT tool_transaction.employee_id,
+       tool_transaction."itemSKU_id",
+       date(tool_receipt.date),
+       SUM(tool_transaction.count),
+       COUNT(DISTINCT tool_receipt.id)
+FROM tool_transaction
+JOIN tool_receipt ON tool_receipt.id = tool_transaction.tool_receipt_id
+WHERE tool_receipt.type = 'EXCHANGE'
+  AND tool_transaction.employee_id IS NOT NULL
+GROUP BY tool_transaction.employee_id, tool_transaction."itemSKU_id", date(tool_receipt.date);
+
+COMMIT;
+
+ANALYZE;
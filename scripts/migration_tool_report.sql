@@ -0,0 +1,11 @@
+-- Migration: Covering index for the tool holdings and consumption report
+-- Date: 2026-10-19
+-- The index name matches ToolTransaction.__table_args__ in wms/models.py.
+-- Run once against an existing database:
+--     sqlite3 data.db < scripts/migration_tool_report.sql
+
+CREATE INDEX IF NOT EXISTS ix_tool_transaction_employee_sku ON tool_transaction (
+    employee_id, "itemSKU_id", tool_receipt_id, count
+);
+
+ANALYZE;
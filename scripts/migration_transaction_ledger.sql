@@ -0,0 +1,46 @@
+-- Migration: Copy receipt ledger attributes onto transaction and add covering indexes
+-- Date: 2026-10-19
+-- Column names match SQLAlchemy's default (attribute name used as-is).
+-- "transaction" is a reserved word in SQLite and must stay quoted.
+--
+-- New transactions get these values from their receipt when they are posted,
+-- and revoking a receipt updates them (see RECEIPT_LEDGER_COLUMNS in
+-- wms/models.py). Run this once against an existing database, inside a
+-- maintenance window:
+--     sqlite3 data.db < scripts/migration_transaction_ledger.sql
+
+BEGIN;
+
+-- 1. Add the ledger columns (placeholder defaults are overwritten in step 2)
+ALTER TABLE "transaction" ADD COLUMN date DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00';
+ALTER TABLE "transaction" ADD COLUMN type VARCHAR(9) NOT NULL DEFAULT 'STOCKOUT';
+ALTER TABLE "transaction" ADD COLUMN revoked BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE "transaction" ADD COLUMN warehouse_id INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "transaction" ADD COLUMN area_id INTEGER;
+ALTER TABLE "transaction" ADD COLUMN department_id INTEGER;
+ALTER TABLE "transaction" ADD COLUMN is_tool BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- 2. Backfill from the owning receipt
+UPDATE "transaction"
+SET date = receipt.date,
+    type = receipt.type,
+    revoked = receipt.revoked,
+    warehouse_id = receipt.warehouse_id,
+    area_id = receipt.area_id,
+    department_id = receipt.department_id,
+    is_tool = receipt.is_tool
+FROM receipt
+WHERE receipt.id = "transaction".receipt_id;
+
+-- 3. Covering index for the statistics queries and indexes for record listings
+CREATE INDEX ix_transaction_ledger_report ON "transaction" (
+    type, revoked, date, is_tool, warehouse_id, area_id, department_id,
+    "itemSKU_id", count, price
+);
+CREATE INDEX ix_transaction_date ON "transaction" (date, id);
+CREATE INDEX ix_transaction_warehouse_date ON "transaction" (warehouse_id, date, id);
+CREATE INDEX ix_transaction_receipt_id ON "transaction" (receipt_id);
+
+COMMIT;
+
+ANALYZE;
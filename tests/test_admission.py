@@ -0,0 +1,39 @@
+"""Tests for heavy request admission control in wms.admission."""
+
+import pytest
+from wms import app
+from wms.admission import SlotSemaphore
+
+
+@pytest.fixture
+def admission(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "ADMISSION_CONTROL_ENABLED", True)
+    monkeypatch.setitem(app.config, "ADMISSION_LOCK_DIR", str(tmp_path))
+    monkeypatch.setitem(app.config, "HEAVY_REQUEST_SLOTS", 1)
+    monkeypatch.setitem(app.config, "HEAVY_REQUEST_WAIT", 0)
+    return SlotSemaphore(tmp_path, 1)
+
+
+def test_slot_semaphore_caps_concurrent_holders(tmp_path):
+    first = SlotSemaphore(tmp_path, 2)
+    second = SlotSemaphore(tmp_path, 2)
+    with first.slot(timeout=0) as a, second.slot(timeout=0) as b:
+        assert (a, b) == (True, True)
+        with first.slot(timeout=0.1) as c:
+            assert c is False
+    with second.slot(timeout=0) as d:
+        assert d is True
+
+
+def test_heavy_requests_get_503_while_posting_routes_stay_open(auth_client, admission):
+    with admission.slot(timeout=0):
+        busy = auth_client.get("/statistics_fee")
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"] == "10"
+        assert "系统繁忙".encode() in busy.data
+        assert auth_client.get("/records/export").status_code == 503
+        # Interactive pages and the batch upload form are not admission controlled
+        assert auth_client.get("/stockout").status_code == 200
+        assert auth_client.get("/batch_takestock").status_code == 200
+
+    assert auth_client.get("/statistics_fee").status_code == 200
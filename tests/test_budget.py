@@ -0,0 +1,93 @@
+"""Tests for report query time budgets in wms.budget."""
+
+import logging
+from flask import Response, g, get_flashed_messages, stream_with_context
+import wms.routes.records
+from wms import app, db
+from wms.budget import budgeted_stream, query_budget
+
+_ENDLESS = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+    "WHERE x < 1000000000) SELECT count(*) FROM c"
+)
+
+
+@query_budget
+def _report(sql):
+    return db.session.execute(db.text(sql)).scalar()
+
+
+def test_query_over_budget_is_interrupted(client, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, "QUERY_BUDGETS", {"records_export": 0.05})
+    with app.test_request_context(
+        "/records/export?start_date=2000-01-01",
+        headers={"Referer": "/records?start_date=2000-01-01"},
+    ):
+        with caplog.at_level(logging.WARNING, logger="wms.slow_query"):
+            response = _report(_ENDLESS)
+        assert response.status_code == 302
+        assert response.location == "/records?start_date=2000-01-01"
+        assert "缩小日期范围" in get_flashed_messages()[0]
+        assert "query_deadline" not in g
+        # The session is usable again and later queries are not interrupted
+        assert db.session.execute(db.text("SELECT 1")).scalar() == 1
+    record = next(r for r in caplog.records if r.name == "wms.slow_query")
+    assert "interrupted" in record.getMessage()
+    assert "records_export" in record.getMessage()
+    assert "start_date=2000-01-01" in record.getMessage()
+
+
+@query_budget
+def _streamed_report(sql):
+    def page():
+        yield "<p>"
+        yield str(db.session.execute(db.text(sql)).scalar())
+
+    # As stream_page renders the part of a page after its head
+    return Response(stream_with_context(budgeted_stream(page())))
+
+
+def test_streamed_query_over_budget_ends_page_with_notice(client, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, "QUERY_BUDGETS", {"statistics_fee": 0.05})
+    with app.test_request_context("/statistics_fee"):
+        response = _streamed_report(_ENDLESS)
+        # The deadline outlives the view for the queries run while streaming
+        assert "query_deadline" in g
+        with caplog.at_level(logging.WARNING, logger="wms.slow_query"):
+            body = "".join(response.response)
+        assert body.startswith("<p>")
+        assert "缩小日期范围" in body
+        assert g.query_interrupted
+        assert "query_deadline" not in g
+    assert any(
+        r.getMessage().startswith("interrupted")
+        for r in caplog.records
+        if r.name == "wms.slow_query"
+    )
+
+
+def test_query_within_budget_and_slow_log(client, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, "SLOW_QUERY_SECONDS", 0)
+    with app.test_request_context("/statistics_fee"):
+        with caplog.at_level(logging.WARNING, logger="wms.slow_query"):
+            assert _report("SELECT 42") == 42
+    messages = [r.getMessage() for r in caplog.records if r.name == "wms.slow_query"]
+    assert any(m.startswith("slow") and "statistics_fee" in m for m in messages)
+
+
+def test_statistics_usage_tab_over_budget_ends_fragment_with_notice(
+    auth_client, monkeypatch
+):
+    monkeypatch.setitem(app.config, "QUERY_BUDGETS", {"statistics_usage_tab": 0.05})
+
+    def endless_rows(filters, by_area, by_department):
+        db.session.execute(db.text(_ENDLESS)).scalar()
+        return []
+
+    monkeypatch.setattr(wms.routes.records, "_usage_rows", endless_rows)
+    response = auth_client.get("/statistics_usage/area")
+    # The tab is fetched into the page, so it must not redirect to a full page
+    assert response.status_code == 200
+    html = response.data.decode()
+    assert "缩小日期范围" in html
+    assert "<table" not in html
@@ -1,4 +1,8 @@
 import uuid
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
 
 from wms import app, db
 from wms.models import (
@@ -10,6 +14,7 @@ from wms.models import (
     ItemSKU,
     Receipt,
     ReceiptType,
+    ToolExchangeRollup,
     ToolInventory,
     ToolReceipt,
     ToolReceiptType,
@@ -45,6 +50,24 @@ def _user_id(username: str) -> int:
     ).scalar_one()
 
 
+def _count_selects(client, url: str, method: str = "GET", **kwargs):
+    """Request ``url`` and return (number of SELECT statements, response)."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    db.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.open(url, method=method, **kwargs)
+    finally:
+        db.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements), response
+
+
 def test_employees_get_and_include_resigned(client, regular_user):
     with app.app_context():
         regular_user_id = _user_id("testuser")
@@ -377,12 +400,16 @@ def test_tool_employee_detail_branches(auth_client, regular_user):
 def test_tool_employee_detail_auditor_blocked(auditor_client, regular_user):
     with app.app_context():
         regular_user_id = _user_id("testuser")
-        emp = Employee(employee_id="E701", name="审核员阻断员工", user_id=regular_user_id)
+        emp = Employee(
+            employee_id="E701", name="审核员阻断员工", user_id=regular_user_id
+        )
         db.session.add(emp)
         db.session.flush()
 
         sku = _create_tool_sku("审核员阻断")
-        db.session.add(EmployeeToolHolding(employee_id=emp.id, itemSKU_id=sku.id, count=1))
+        db.session.add(
+            EmployeeToolHolding(employee_id=emp.id, itemSKU_id=sku.id, count=1)
+        )
         db.session.commit()
 
         emp_id = emp.id
@@ -582,3 +609,466 @@ def test_tool_print_post_mark_printed(auth_client):
     with app.app_context():
         assert db.session.get(ToolReceipt, r1_id).printed is True
         assert db.session.get(ToolReceipt, r2_id).printed is True
+
+
+def test_tool_print_batch_renders_visible_slips_and_marks_printed(
+    client, test_user, regular_user
+):
+    with app.app_context():
+        owner_id = _user_id("testuser")
+        admin_id = _user_id("testadmin")
+        ids = []
+        for n, operator_id in enumerate([owner_id, owner_id, owner_id, admin_id]):
+            employee = Employee(
+                employee_id=f"B{n}", name=f"批量员工{n}", user_id=owner_id
+            )
+            receipt = ToolReceipt(
+                type=ToolReceiptType.REQUISITION,
+                operator_id=operator_id,
+                employee=employee,
+            )
+            sku = _create_tool_sku(f"批量工具{n}")
+            db.session.add_all([employee, receipt])
+            db.session.add(
+                ToolTransaction(
+                    tool_receipt=receipt, itemSKU=sku, count=1, employee=employee
+                )
+            )
+            db.session.flush()
+            ids.append(receipt.id)
+        db.session.commit()
+
+    _login(client, "testuser")
+
+    # The number of queries does not grow with the number of slips
+    one, _ = _count_selects(
+        client, "/tools/batch-print", query_string={"receipt_ids[]": ids[:1]}
+    )
+    three, page = _count_selects(
+        client, "/tools/batch-print", query_string={"receipt_ids[]": ids[:3]}
+    )
+    assert page.status_code == 200
+    assert one == three
+    for n in range(3):
+        assert f"批量员工{n}".encode() in page.data
+        assert f"批量工具{n}".encode() in page.data
+
+    # Slips the user cannot view are skipped
+    marked = client.post(
+        "/tools/batch-print",
+        data={"receipt_ids[]": [str(i) for i in ids], "mark_printed": "1"},
+    )
+    assert marked.status_code == 200
+    assert "批量员工3".encode() not in marked.data
+    assert "已将 3 张单据标记为已打印".encode() in marked.data
+    with app.app_context():
+        printed = [db.session.get(ToolReceipt, i).printed for i in ids]
+    assert printed == [True, True, True, False]
+
+    empty = client.get("/tools/batch-print", follow_redirects=True)
+    assert "请选择要打印的单据".encode() in empty.data
+
+
+def test_tool_print_batch_marks_printed_with_tool_print_scope(
+    client, test_user, regular_user
+):
+    with app.app_context():
+        owner_id = _user_id("testuser")
+        admin_id = _user_id("testadmin")
+        slips = [
+            ToolReceipt(type=ToolReceiptType.REQUISITION, operator_id=owner_id),
+            # Scrap slips targeted at the user are in scope on tool_print
+            ToolReceipt(
+                type=ToolReceiptType.SCRAP,
+                operator_id=admin_id,
+                target_user_id=owner_id,
+            ),
+            ToolReceipt(type=ToolReceiptType.REQUISITION, operator_id=admin_id),
+        ]
+        db.session.add_all(slips)
+        db.session.commit()
+        ids = [slip.id for slip in slips]
+
+    # An admin marking from another user's tool_print scope only marks that
+    # user's slips, as the tool_print page does
+    _login(client, "testadmin")
+    marked = client.post(
+        "/tools/batch-print",
+        data={
+            "receipt_ids[]": [str(i) for i in ids],
+            "scope_user_id": str(owner_id),
+            "mark_printed": "1",
+        },
+    )
+    assert "已将 2 张单据标记为已打印".encode() in marked.data
+    with app.app_context():
+        printed = [db.session.get(ToolReceipt, i).printed for i in ids]
+    assert printed == [True, True, False]
+
+
+def test_tool_print_listing_query_count_is_fixed(client, test_user, regular_user):
+    def add_slips(count):
+        with app.app_context():
+            owner_id = _user_id("testuser")
+            for _ in range(count):
+                employee = Employee(
+                    employee_id=str(uuid.uuid4())[:8], name="列表员工", user_id=owner_id
+                )
+                receipt = ToolReceipt(
+                    type=ToolReceiptType.REQUISITION,
+                    operator_id=owner_id,
+                    employee=employee,
+                )
+                sku = _create_tool_sku()
+                db.session.add_all([employee, receipt])
+                for count in (1, 2):
+                    db.session.add(
+                        ToolTransaction(
+                            tool_receipt=receipt,
+                            itemSKU=sku,
+                            count=count,
+                            employee=employee,
+                        )
+                    )
+            db.session.commit()
+
+    _login(client, "testuser")
+    add_slips(1)
+    few, _ = _count_selects(client, "/tools/print")
+    add_slips(15)
+    many, page = _count_selects(client, "/tools/print")
+    assert page.status_code == 200
+    assert few == many
+    assert page.data.count("列表员工".encode()) == 16
+
+
+def test_tool_postings_prefetch_selected_skus(auth_client, regular_user):
+    with app.app_context():
+        regular_id = _user_id("testuser")
+        emp = Employee(employee_id="E900", name="批量领用", user_id=regular_id)
+        db.session.add(emp)
+        sku_ids = []
+        for _ in range(7):
+            sku = _create_tool_sku("预取")
+            db.session.add(
+                ToolInventory(
+                    user_id=regular_id, itemSKU_id=sku.id, count=10, pending_scrap=0
+                )
+            )
+            sku_ids.append(sku.id)
+        db.session.commit()
+        emp_id = emp.id
+
+    def post(url, skus, **extra):
+        data = {"sku_ids[]": [str(i) for i in skus], **extra}
+        data.update({f"qty_{i}": "2" for i in skus})
+        count, response = _count_selects(auth_client, url, method="POST", data=data)
+        assert response.status_code == 302
+        return count
+
+    requisition = "/tools/requisition"
+    scope = {"scope_user_id": str(regular_id), "employee_id": str(emp_id)}
+    assert post(requisition, sku_ids[:1], **scope) == post(
+        requisition, sku_ids[1:], **scope
+    )
+    detail = f"/tools/employee/{emp_id}"
+    assert post(detail, sku_ids[:1], action="exchange") == post(
+        detail, sku_ids[1:], action="exchange"
+    )
+    assert post(detail, sku_ids[:1], action="return") == post(
+        detail, sku_ids[1:], action="return"
+    )
+
+    with app.app_context():
+        holdings = EmployeeToolHolding.query.filter_by(employee_id=emp_id).all()
+        assert [h.count for h in holdings] == [0] * 7
+        first = ToolInventory.query.filter_by(
+            user_id=regular_id, itemSKU_id=sku_ids[0]
+        ).one()
+        # Issued 2, exchanged 2 (old ones to pending scrap), returned 2
+        assert (first.count, first.pending_scrap) == (8, 2)
+
+
+def test_tool_scrap_batch_confirmation_isolates_failures(
+    client, regular_user, auditor_user
+):
+    with app.app_context():
+        regular_id = _user_id("testuser")
+        warehouse = Warehouse(name="批量报废仓库", owner_id=regular_id)
+        sku_a = _create_tool_sku("报废A")
+        sku_b = _create_tool_sku("报废B")
+        db.session.add(warehouse)
+        db.session.flush()
+        for sku, pending, stock in ((sku_a, 4, 3), (sku_b, 1, 5)):
+            db.session.add(
+                ToolInventory(
+                    user_id=regular_id,
+                    itemSKU_id=sku.id,
+                    count=0,
+                    pending_scrap=pending,
+                )
+            )
+            db.session.add(
+                WarehouseItemSKU(
+                    warehouse_id=warehouse.id,
+                    itemSKU_id=sku.id,
+                    count=stock,
+                    average_price=2,
+                )
+            )
+        request_ids = []
+        # The second request for A no longer fits once the first is posted
+        for sku, count in ((sku_a, 2), (sku_a, 2), (sku_b, 1)):
+            req = ToolReceipt(
+                type=ToolReceiptType.SCRAP,
+                target_user_id=regular_id,
+                operator_id=regular_id,
+                printed=True,
+            )
+            db.session.add(req)
+            db.session.add(ToolTransaction(tool_receipt=req, itemSKU=sku, count=count))
+            db.session.flush()
+            request_ids.append(req.id)
+        db.session.commit()
+        warehouse_id, sku_a_id, sku_b_id = warehouse.id, sku_a.id, sku_b.id
+
+    _login(client, "testauditor")
+    resp = client.post(
+        "/tools/scrap",
+        data={"request_ids[]": [str(i) for i in request_ids]},
+        follow_redirects=True,
+    )
+    assert "已确认 2 张报废申请单".encode() in resp.data
+    assert f"申请单 #{request_ids[1]} 确认失败: 库存不足".encode() in resp.data
+
+    with app.app_context():
+        first, second, third = (db.session.get(ToolReceipt, i) for i in request_ids)
+        assert first.receipt_id is not None and third.receipt_id is not None
+        assert second.receipt_id is None and second.confirmed_by_id is None
+        assert first.receipt.refcode != third.receipt.refcode
+
+        def stock(sku_id):
+            return db.session.get(WarehouseItemSKU, (warehouse_id, sku_id)).count
+
+        def pending(sku_id):
+            return (
+                ToolInventory.query.filter_by(user_id=regular_id, itemSKU_id=sku_id)
+                .one()
+                .pending_scrap
+            )
+
+        assert (stock(sku_a_id), pending(sku_a_id)) == (1, 2)
+        assert (stock(sku_b_id), pending(sku_b_id)) == (4, 0)
+
+
+def test_employees_roster_summarizes_holdings_in_fixed_queries(
+    auth_client, regular_user
+):
+    def add_employees(start, count):
+        with app.app_context():
+            regular_id = _user_id("testuser")
+            sku = _create_tool_sku("名册")
+            for n in range(start, start + count):
+                emp = Employee(
+                    employee_id=f"R{n:03d}", name=f"名册{n}", user_id=regular_id
+                )
+                db.session.add(emp)
+                db.session.flush()
+                db.session.add(
+                    EmployeeToolHolding(employee_id=emp.id, itemSKU_id=sku.id, count=2)
+                )
+                db.session.add(
+                    ToolReceipt(
+                        type=ToolReceiptType.REQUISITION,
+                        employee_id=emp.id,
+                        operator_id=regular_id,
+                        date=datetime(2026, 3, 4, 8, 0),
+                    )
+                )
+            db.session.commit()
+
+    add_employees(0, 1)
+    # Warm up: the first request after login also loads the session user
+    auth_client.get("/employees")
+    few, _ = _count_selects(auth_client, "/employees")
+    add_employees(1, 12)
+    many, page = _count_selects(auth_client, "/employees")
+    assert few == many
+    assert page.data.count("2 件（1 种）".encode()) == 13
+    assert "2026-03-04".encode() in page.data
+
+    with app.app_context():
+        emp_id = Employee.query.filter_by(employee_id="R000").one().id
+    blocked = auth_client.post(f"/employee/{emp_id}/resign", follow_redirects=True)
+    assert "还持有工具".encode() in blocked.data
+
+
+def test_tool_report_page_and_export_scoped_by_crew(client, regular_user):
+    with app.app_context():
+        regular_id = _user_id("testuser")
+        other = User(username="report_other", nickname="别的班组", is_admin=False)
+        other.set_password("password123")
+        db.session.add(other)
+        db.session.flush()
+        sku = _create_tool_sku("统计")
+        for crew_id, name in ((regular_id, "本组员工"), (other.id, "他组员工")):
+            emp = Employee(employee_id=f"T-{name}", name=name, user_id=crew_id)
+            db.session.add(emp)
+            db.session.flush()
+            db.session.add(
+                EmployeeToolHolding(employee_id=emp.id, itemSKU_id=sku.id, count=4)
+            )
+            receipt = ToolReceipt(
+                type=ToolReceiptType.REQUISITION,
+                employee_id=emp.id,
+                operator_id=crew_id,
+            )
+            db.session.add(
+                ToolTransaction(
+                    tool_receipt=receipt, itemSKU_id=sku.id, count=6, employee=emp
+                )
+            )
+        db.session.commit()
+
+    _login(client, "testuser")
+    page = client.get("/tools/report")
+    assert page.status_code == 200
+    assert "本组员工".encode() in page.data
+    # Crew leaders only see their own crew, whatever they ask for
+    assert "他组员工".encode() not in page.data
+    assert "他组员工".encode() not in client.get("/tools/report?user_id=0").data
+
+    export = client.get("/tools/report/export")
+    assert export.status_code == 200
+    frame = pd.read_excel(BytesIO(export.data))
+    assert frame[["姓名", "当前持有", "领用"]].values.tolist() == [["本组员工", 4, 6]]
+
+    # Periods without movements still show current holdings
+    past = client.get("/tools/report/export?start_date=2000-01-01&end_date=2000-01-31")
+    frame = pd.read_excel(BytesIO(past.data))
+    assert frame[["当前持有", "领用"]].values.tolist() == [[4, 0]]
+
+
+def test_tool_exchange_stats_ranks_frequent_exchangers(auth_client, regular_user):
+    with app.app_context():
+        regular_id = _user_id("testuser")
+        sku = _create_tool_sku("更换")
+        db.session.add(
+            ToolInventory(
+                user_id=regular_id, itemSKU_id=sku.id, count=50, pending_scrap=0
+            )
+        )
+        employee_ids = []
+        for name in ("常换员工", "少换员工", "不换员工"):
+            emp = Employee(employee_id=f"X-{name}", name=name, user_id=regular_id)
+            db.session.add(emp)
+            db.session.flush()
+            db.session.add(
+                EmployeeToolHolding(employee_id=emp.id, itemSKU_id=sku.id, count=5)
+            )
+            employee_ids.append(emp.id)
+        db.session.commit()
+        sku_id = sku.id
+
+    def exchange(emp_id, qty):
+        response = auth_client.post(
+            f"/tools/employee/{emp_id}",
+            data={
+                "action": "exchange",
+                "sku_ids[]": [str(sku_id)],
+                f"qty_{sku_id}": qty,
+            },
+        )
+        assert response.status_code == 302
+
+    exchange(employee_ids[0], "3")
+    exchange(employee_ids[0], "2")
+    exchange(employee_ids[1], "1")
+
+    with app.app_context():
+        rollup = ToolExchangeRollup.query.filter_by(employee_id=employee_ids[0]).one()
+        assert (rollup.itemSKU_id, rollup.pieces, rollup.exchanges) == (sku_id, 5, 2)
+        assert rollup.day == datetime.now().date()
+
+    page = auth_client.get("/tools/exchanges?window=30")
+    assert page.status_code == 200
+    html = page.data.decode()
+    # The frequent exchanger is ranked first and flagged against the crew median
+    assert html.index("常换员工") < html.index("少换员工")
+    assert "异常 1 项" in html
+    assert "不换员工" not in html
+
+
+def test_tool_bulk_requisition_issues_matrix_in_one_pass(auth_client, regular_user):
+    with app.app_context():
+        regular_id = _user_id("testuser")
+        skus = [_create_tool_sku("批量"), _create_tool_sku("批量")]
+        for sku in skus:
+            db.session.add(
+                ToolInventory(
+                    user_id=regular_id, itemSKU_id=sku.id, count=10, pending_scrap=0
+                )
+            )
+        employees = [
+            Employee(employee_id=f"B{i:02d}", name=f"批量员工{i}", user_id=regular_id)
+            for i in range(3)
+        ]
+        outsider = Employee(employee_id="B99", name="他组员工", user_id=1)
+        db.session.add_all([*employees, outsider])
+        db.session.flush()
+        # Existing holdings are added to, not replaced
+        db.session.add(
+            EmployeeToolHolding(
+                employee_id=employees[0].id, itemSKU_id=skus[0].id, count=1
+            )
+        )
+        db.session.commit()
+        sku_ids = [sku.id for sku in skus]
+        emp_ids = [emp.id for emp in employees]
+        outsider_id = outsider.id
+
+    url = "/tools/requisition/bulk"
+    page = auth_client.get(f"{url}?user_id={regular_id}")
+    assert page.status_code == 200
+    assert f'name="qty_{emp_ids[2]}_{sku_ids[1]}"'.encode() in page.data
+
+    scope = {"scope_user_id": str(regular_id)}
+    # Over-issuing a tool across employees rejects the whole matrix
+    too_many = {f"qty_{emp_id}_{sku_ids[0]}": "4" for emp_id in emp_ids}
+    response = auth_client.post(url, data={**scope, **too_many}, follow_redirects=True)
+    assert "库内余量不足".encode() in response.data
+    response = auth_client.post(
+        url,
+        data={**scope, f"qty_{outsider_id}_{sku_ids[0]}": "1"},
+        follow_redirects=True,
+    )
+    assert "不属于当前查看用户".encode() in response.data
+    with app.app_context():
+        assert ToolReceipt.query.count() == 0
+
+    matrix = {f"qty_{emp_id}_{sku_ids[0]}": "2" for emp_id in emp_ids}
+    matrix[f"qty_{emp_ids[1]}_{sku_ids[1]}"] = "3"
+    matrix[f"qty_{emp_ids[2]}_{sku_ids[1]}"] = ""
+    response = auth_client.post(url, data={**scope, **matrix})
+    assert response.status_code == 302
+
+    with app.app_context():
+        receipts = ToolReceipt.query.order_by(ToolReceipt.id).all()
+        assert [r.employee_id for r in receipts] == emp_ids
+        assert {r.type for r in receipts} == {ToolReceiptType.REQUISITION}
+        assert [len(r.transactions) for r in receipts] == [1, 2, 1]
+        holdings = {
+            (h.employee_id, h.itemSKU_id): h.count
+            for h in EmployeeToolHolding.query.all()
+        }
+        assert holdings == {
+            (emp_ids[0], sku_ids[0]): 3,
+            (emp_ids[1], sku_ids[0]): 2,
+            (emp_ids[1], sku_ids[1]): 3,
+            (emp_ids[2], sku_ids[0]): 2,
+        }
+        stock = [
+            ToolInventory.query.filter_by(user_id=regular_id, itemSKU_id=i).one().count
+            for i in sku_ids
+        ]
+        assert stock == [4, 7]
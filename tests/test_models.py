@@ -139,7 +139,8 @@ def test_receipt_model(client, test_user):
         receipt.update_warehouse_item_skus()
         db.session.flush()
         assert warehouse.item_skus[0].count == 5 + 10
-        newaverage = float(5 * 10 + 10 * 20) / (5 + 10)
+        # Averages are kept in fixed-point micro-units
+        newaverage = Decimal("16.666667")
         assert warehouse.item_skus[0].average_price == newaverage
 
         # Test STOCKOUT receipt
@@ -591,3 +592,106 @@ def test_receipt_stockin_zero_average_price_initialization(client, test_user):
         ).first()
         assert warehouse_item.count == 5
         assert warehouse_item.average_price == 30.0
+
+
+def test_transaction_copies_receipt_ledger(client, test_user):
+    with client.application.app_context():
+        item = Item(name=f"Ledger Item {uuid.uuid4()}", is_tool=True)
+        sku = ItemSKU(item=item, brand="B", spec="S")
+        warehouse = Warehouse(name="Ledger Warehouse", owner=test_user)
+        area = Area(name="Ledger Area")
+        department = Department(name="Ledger Department")
+        db.session.add_all([item, sku, warehouse, area, department])
+        db.session.flush()
+
+        receipt = Receipt(
+            operator=test_user,
+            warehouse=warehouse,
+            type=ReceiptType.STOCKOUT,
+            area=area,
+            department=department,
+            is_tool=True,
+        )
+        # Posted through the relationship, before the receipt has been flushed
+        first = Transaction(itemSKU=sku, count=-1, price=2, receipt=receipt)
+        db.session.add_all([receipt, first])
+        db.session.commit()
+
+        # Posted by id against a receipt whose attributes have been expired
+        second = Transaction(
+            itemSKU_id=sku.id, count=-2, price=2, receipt_id=receipt.id
+        )
+        db.session.add(second)
+        db.session.commit()
+
+        for transaction in (first, second):
+            assert transaction.date == receipt.date
+            assert transaction.type == ReceiptType.STOCKOUT
+            assert transaction.revoked is False
+            assert transaction.warehouse_id == warehouse.id
+            assert transaction.area_id == area.id
+            assert transaction.department_id == department.id
+            assert transaction.is_tool is True
+
+        # Revoking the receipt updates every copy
+        receipt.revoked = True
+        db.session.commit()
+        revoked = db.session.scalars(
+            db.select(Transaction.revoked).where(Transaction.receipt_id == receipt.id)
+        ).all()
+        assert revoked == [True, True]
+
+
+def test_statistics_query_uses_covering_index(client):
+    with client.application.app_context():
+        plan = db.session.execute(
+            db.text(
+                "EXPLAIN QUERY PLAN SELECT warehouse_id, area_id, department_id, "
+                'sum(count * price) FROM "transaction" '
+                "WHERE type = 'STOCKOUT' AND revoked = 0 AND date >= '2026-01-01' "
+                "AND count < 0 GROUP BY warehouse_id, area_id, department_id"
+            )
+        ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "COVERING INDEX ix_transaction_ledger_report" in details
+
+
+def test_receipt_totals_maintained_on_posting(client, test_user):
+    with client.application.app_context():
+        item = Item(name=f"Totals Item {uuid.uuid4()}")
+        sku = ItemSKU(item=item, brand="B", spec="S")
+        warehouse = Warehouse(name="Totals Warehouse", owner=test_user)
+        db.session.add_all([item, sku, warehouse])
+        db.session.flush()
+
+        receipt = Receipt(
+            operator=test_user, warehouse=warehouse, type=ReceiptType.STOCKIN
+        )
+        db.session.add(receipt)
+        db.session.add(Transaction(itemSKU=sku, count=3, price=1.25, receipt=receipt))
+        db.session.add(Transaction(itemSKU=sku, count=2, price=10, receipt=receipt))
+        db.session.commit()
+        receipt_id = receipt.id
+
+        db.session.expunge_all()
+        receipt = db.session.get(Receipt, receipt_id)
+        assert receipt.sum == Decimal("23.75")
+        assert receipt.line_count == 2
+        # Reading the totals does not load the lines
+        assert "transactions" not in receipt.__dict__
+
+        # Editing and deleting lines keeps the totals in step
+        first, second = sorted(receipt.transactions, key=lambda t: t.id)
+        first.count = 4
+        db.session.delete(second)
+        db.session.commit()
+        assert receipt.sum == Decimal("5.00")
+        assert receipt.line_count == 1
+
+        # The hybrid works in SQL as well
+        assert (
+            db.session.scalar(
+                db.select(Receipt.id).where(Receipt.sum == Decimal("5.00"))
+            )
+            == receipt_id
+        )
@@ -0,0 +1,69 @@
+"""Tests for the fixed-point money columns in wms.money."""
+
+from decimal import Decimal
+from sqlalchemy import text
+from wms import app, db
+from wms.models import (
+    Receipt,
+    ReceiptType,
+    Transaction,
+    Warehouse,
+    WarehouseItemSKU,
+)
+from wms.money import MICROS, divide_units, from_units, to_units
+
+
+def test_unit_conversions_round_half_up():
+    assert to_units("12.345") == 1235
+    assert to_units(Decimal("-0.005")) == -1
+    assert to_units(16.6666666, MICROS) == 16666667
+    assert to_units(None) == 0
+    assert from_units(1235) == Decimal("12.35")
+    assert from_units(16666667, MICROS) == Decimal("16.666667")
+    assert divide_units(250, 15) == 17
+    assert divide_units(-250, 15) == -17
+    assert divide_units(7, 2) == 4
+
+
+def test_prices_and_totals_are_stored_as_integers(client, test_user, test_item):
+    with app.app_context():
+        warehouse = Warehouse(name="Money Warehouse", owner_id=1)
+        db.session.add(warehouse)
+        db.session.flush()
+        receipt = Receipt(
+            operator_id=1,
+            warehouse_id=warehouse.id,
+            type=ReceiptType.STOCKIN,
+        )
+        db.session.add(receipt)
+        db.session.add_all(
+            [
+                Transaction(
+                    itemSKU_id=1, count=3, price=Decimal("0.10"), receipt=receipt
+                ),
+                Transaction(
+                    itemSKU_id=1, count=3, price=Decimal("0.20"), receipt=receipt
+                ),
+            ]
+        )
+        db.session.flush()
+        receipt.update_warehouse_item_skus()
+
+        raw = db.session.execute(
+            text('SELECT price, typeof(price) FROM "transaction" ORDER BY id')
+        ).all()
+        assert [tuple(row) for row in raw] == [(10, "integer"), (20, "integer")]
+        assert (
+            db.session.execute(text("SELECT total_value FROM receipt")).scalar() == 90
+        )
+        assert (
+            db.session.execute(
+                text("SELECT average_price FROM warehouse_item_sku")
+            ).scalar()
+            == 150000
+        )
+
+        db.session.expire_all()
+        assert receipt.sum == Decimal("0.90")
+        wis = WarehouseItemSKU.query.one()
+        assert wis.average_price == Decimal("0.15")
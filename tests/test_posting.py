@@ -0,0 +1,150 @@
+"""Tests for BEGIN IMMEDIATE posting transactions in wms.posting."""
+
+import io
+import sqlite3
+import pandas as pd
+import pytest
+from sqlalchemy.exc import OperationalError
+import wms.posting
+import wms.routes.batch
+from wms import app, db
+from wms.models import Receipt, ToolReceipt, ToolReceiptType
+from wms.posting import PostingBusyError, posting, posting_metrics
+
+
+def _in_sqlite_transaction() -> bool:
+    return db.session().connection().connection.dbapi_connection.in_transaction
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setitem(app.config, "POSTING_LOCK_BACKOFF", 0)
+    posting_metrics.reset()
+    yield posting_metrics
+    posting_metrics.reset()
+
+
+def _busy_connection(monkeypatch, failures):
+    """Make the session's next ``failures`` BEGINs fail with a busy database."""
+    session = db.session()
+    real = session.connection
+    calls = []
+
+    def connection(*args, **kwargs):
+        calls.append(1)
+        if len(calls) <= failures:
+            raise OperationalError(
+                "BEGIN IMMEDIATE", {}, sqlite3.OperationalError("database is locked")
+            )
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(session, "connection", connection)
+    return calls
+
+
+def test_posting_takes_the_write_lock_up_front(client, metrics):
+    with app.app_context():
+        # Plain reads do not open a SQLite transaction
+        db.session.execute(db.text("SELECT 1"))
+        assert not _in_sqlite_transaction()
+        with posting() as wait:
+            assert wait >= 0
+            assert _in_sqlite_transaction()
+            # Nested blocks join the outer transaction
+            with posting() as nested:
+                assert nested == 0.0
+        # Uncommitted work is rolled back and the lock released
+        assert not _in_sqlite_transaction()
+    assert metrics.snapshot()["acquired"] == 1
+
+
+def test_posting_retries_a_busy_database(client, metrics, monkeypatch):
+    with app.app_context():
+        calls = _busy_connection(monkeypatch, failures=2)
+        with posting():
+            assert _in_sqlite_transaction()
+        assert len(calls) >= 3
+    snapshot = metrics.snapshot()
+    assert (snapshot["acquired"], snapshot["retries"], snapshot["failures"]) == (
+        1,
+        2,
+        0,
+    )
+
+
+def test_posting_gives_up_after_the_retry_budget(client, metrics, monkeypatch):
+    monkeypatch.setitem(app.config, "POSTING_LOCK_RETRIES", 2)
+    with app.app_context():
+        calls = _busy_connection(monkeypatch, failures=10)
+        with pytest.raises(PostingBusyError):
+            with posting():
+                pass  # pragma: no cover
+        assert len(calls) == 3
+    assert metrics.snapshot()["failures"] == 1
+
+
+def test_posting_view_reports_lock_wait_and_busy(auth_client, metrics, monkeypatch):
+    with app.app_context():
+        tool_receipt = ToolReceipt(
+            type=ToolReceiptType.RETURN, operator_id=1, printed=False
+        )
+        db.session.add(tool_receipt)
+        db.session.commit()
+        receipt_id = tool_receipt.id
+
+    url = f"/tools/print/{receipt_id}/toggle-printed"
+    response = auth_client.post(url)
+    assert response.status_code == 302
+    assert response.headers["Server-Timing"].startswith("lockwait;dur=")
+    with app.app_context():
+        assert db.session.get(ToolReceipt, receipt_id).printed is True
+
+    def busy(session):
+        raise PostingBusyError("database is locked")
+
+    monkeypatch.setattr(wms.posting, "_acquire_write_lock", busy)
+    response = auth_client.post(url, follow_redirects=True)
+    assert "系统繁忙，请稍后重试".encode() in response.data
+    with app.app_context():
+        assert db.session.get(ToolReceipt, receipt_id).printed is True
+
+
+def test_batch_stockin_parses_sheet_before_taking_write_lock(
+    auth_client, test_warehouse, metrics, monkeypatch
+):
+    sheet = io.BytesIO()
+    pd.DataFrame(
+        {"物品": ["螺丝"], "品牌": ["A"], "规格": ["M4"], "数量": [5], "单价": [1.5]}
+    ).to_excel(sheet, index=False)
+    parse = wms.routes.batch._stockin_rows
+    locks_taken_while_parsing = []
+
+    def parse_and_record(df):
+        locks_taken_while_parsing.append(metrics.snapshot()["acquired"])
+        return parse(df)
+
+    monkeypatch.setattr(wms.routes.batch, "_stockin_rows", parse_and_record)
+
+    for busy in (False, True):
+        if busy:
+
+            def busy_lock(session):
+                raise PostingBusyError("database is locked")
+
+            monkeypatch.setattr(wms.posting, "_acquire_write_lock", busy_lock)
+        response = auth_client.post(
+            "/batch_stockin",
+            data={
+                "warehouse": test_warehouse,
+                "file": (io.BytesIO(sheet.getvalue()), "stock.xlsx"),
+            },
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 302
+        if not busy:
+            assert response.headers["Server-Timing"].startswith("lockwait;dur=")
+
+    assert locks_taken_while_parsing == [0, 1]
+    with app.app_context():
+        # Only the first upload was posted; the busy one changed nothing
+        assert Receipt.query.count() == 1
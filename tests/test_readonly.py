@@ -0,0 +1,67 @@
+"""Tests for read-only report routing in wms.readonly."""
+
+import pytest
+from flask import g
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+import wms.readonly
+from wms import app, db
+from wms.models import Warehouse
+from wms.readonly import _use_wal, create_read_engine, read_engine, read_only_view
+
+
+@pytest.fixture
+def file_database(client, tmp_path):
+    """A WAL file database with the app schema and one warehouse."""
+    url = f"sqlite:///{tmp_path / 'report.db'}"
+    writer = create_engine(url)
+    event.listen(writer, "connect", _use_wal)
+    db.metadata.create_all(writer)
+    with writer.begin() as conn:
+        conn.execute(Warehouse.__table__.insert().values(name="只读仓库"))
+    with app.app_context():
+        reader = create_read_engine(url)
+    yield writer, reader
+    reader.dispose()
+    writer.dispose()
+
+
+def _warehouse_count(conn):
+    return conn.exec_driver_sql("SELECT count(*) FROM warehouse").scalar()
+
+
+def test_read_engine_is_query_only_and_reads_a_snapshot(file_database):
+    writer, reader = file_database
+    with reader.connect() as conn:
+        with conn.begin():
+            assert _warehouse_count(conn) == 1
+            # A commit made while the report runs is not seen half-way through
+            with writer.begin() as write:
+                write.execute(Warehouse.__table__.insert().values(name="新仓库"))
+            assert _warehouse_count(conn) == 1
+            with pytest.raises(OperationalError, match="readonly"):
+                conn.exec_driver_sql("DELETE FROM warehouse")
+        with conn.begin():
+            assert _warehouse_count(conn) == 2
+
+
+def test_read_only_view_routes_selects(file_database, monkeypatch):
+    _, reader = file_database
+    monkeypatch.setattr(wms.readonly, "read_engine", lambda: reader)
+
+    @read_only_view
+    def report():
+        return [w.name for w in Warehouse.query.all()]
+
+    with app.test_request_context("/statistics_fee"):
+        # Other requests keep reading the primary database
+        assert Warehouse.query.all() == []
+        db.session.expunge_all()
+        assert report() == ["只读仓库"]
+        assert g.read_only_reads is True
+        db.session.remove()
+
+
+def test_in_memory_database_has_no_read_engine(client):
+    with app.app_context():
+        assert read_engine() is None
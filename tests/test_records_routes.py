@@ -10,6 +10,8 @@ from wms.models import (
     WarehouseItemSKU,
     ToolInventory,
 )
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash
 from wms import app, db
 from datetime import datetime, timedelta
@@ -1033,6 +1035,215 @@ def test_statistics_usage_with_stockin_ignored(auth_client, test_warehouse):
     assert str(2000).encode() not in response.data
 
 
+@pytest.mark.usefixtures("test_item")
+def test_statistics_usage_tabs_load_on_demand(
+    auth_client, test_warehouse, test_customer
+):
+    """Breakdown tabs are served by their own fragment endpoint"""
+    with app.app_context():
+        sku = ItemSKU.query.first()
+        receipt = Receipt(
+            operator_id=1,
+            warehouse_id=test_warehouse,
+            type=ReceiptType.STOCKOUT,
+            area_id=test_customer["area"],
+            department_id=test_customer["department"],
+        )
+        db.session.add(receipt)
+        db.session.flush()
+        db.session.add(Transaction(itemSKU=sku, count=-7, price=3.00, receipt=receipt))
+        db.session.commit()
+
+    # The page itself only renders the summary and tab placeholders
+    response = auth_client.get("/statistics_usage")
+    assert response.status_code == 200
+    assert b"21.00" in response.data
+    assert "部门: Test Department".encode() not in response.data
+    assert b"/statistics_usage/area?" in response.data
+
+    response = auth_client.get("/statistics_usage/area")
+    assert response.status_code == 200
+    assert b"Test Area" in response.data
+    assert b"<html" not in response.data
+
+    response = auth_client.get("/statistics_usage/department")
+    assert response.status_code == 200
+    assert b"Test Department" in response.data
+    assert b"Test Area" not in response.data
+
+    response = auth_client.get("/statistics_usage/detailed")
+    assert response.status_code == 200
+    assert "部门: Test Department".encode() in response.data
+    assert b"21.00" in response.data
+
+    response = auth_client.get("/statistics_usage/unknown")
+    assert response.status_code == 404
+
+
+def _record_table_rows(html: str) -> list[str]:
+    tbody = html.split("<tbody>", 1)[1].split("</tbody>", 1)[0]
+    return tbody.split("<tr")[1:]
+
+
+@pytest.mark.usefixtures("test_item")
+def test_records_rows_are_projected_from_receipt_columns(
+    auth_client, test_warehouse, test_customer
+):
+    with app.app_context():
+        sku = ItemSKU.query.one()
+        item_name = sku.item.name
+        stockin = Receipt(
+            operator_id=1,
+            warehouse_id=test_warehouse,
+            type=ReceiptType.STOCKIN,
+            refcode="PROJ-IN",
+        )
+        stockout = Receipt(
+            operator_id=1,
+            warehouse_id=test_warehouse,
+            type=ReceiptType.STOCKOUT,
+            area_id=test_customer["area"],
+            department_id=test_customer["department"],
+            location="Line 7",
+        )
+        db.session.add_all([stockin, stockout])
+        db.session.flush()
+        # Lines are added in the opposite order so line and receipt ids differ
+        db.session.add(Transaction(itemSKU=sku, count=-2, price=3, receipt=stockout))
+        db.session.flush()
+        db.session.add(Transaction(itemSKU=sku, count=4, price=3, receipt=stockin))
+        db.session.commit()
+        assert stockin.transactions[0].id != stockin.id
+        stockout.revoked = True
+        db.session.commit()
+        stockin_id, stockout_id = stockin.id, stockout.id
+
+    html = auth_client.get("/records?type=all").data.decode()
+    stockout_row, stockin_row = _record_table_rows(html)
+
+    assert "入库" in stockin_row
+    assert item_name in stockin_row
+    assert "Test Brand - Test Spec" in stockin_row
+    assert "Test Warehouse" in stockin_row
+    assert "PROJ-IN" in stockin_row
+    assert "line-through" not in stockin_row.split(">", 1)[0]
+    assert f'href="/receipt/{stockin_id}"' in stockin_row
+
+    # Revoked receipts are struck through and have no revoke link
+    assert "出库" in stockout_row
+    assert "Test Department" in stockout_row
+    assert "Line 7" in stockout_row
+    assert "line-through" in stockout_row.split(">", 1)[0]
+    assert f'href="/receipt/{stockout_id}"' not in stockout_row
+
+    html = auth_client.get("/records?type=stockout").data.decode()
+    (stockout_row,) = _record_table_rows(html)
+    assert "Test Admin" in stockout_row
+    assert "Test Area" in stockout_row
+    assert "Test Department" in stockout_row
+    assert "Test Warehouse" in stockout_row
+    assert "¥3.00" in stockout_row
+
+
+@pytest.mark.usefixtures("test_item", "test_another_item")
+def test_records_grouped_by_receipt(auth_client, test_warehouse):
+    with app.app_context():
+        first_sku, second_sku = ItemSKU.query.order_by(ItemSKU.id).all()
+        receipt = Receipt(
+            operator_id=1,
+            warehouse_id=test_warehouse,
+            type=ReceiptType.STOCKIN,
+            refcode="GROUPED-1",
+        )
+        db.session.add(receipt)
+        db.session.flush()
+        for count in range(1, 26):
+            sku = first_sku if count % 2 else second_sku
+            db.session.add(
+                Transaction(itemSKU=sku, count=count, price=2, receipt=receipt)
+            )
+        db.session.commit()
+        receipt_id = receipt.id
+        first_sku_id = first_sku.id
+
+    lines_page = auth_client.get("/records?type=stockin")
+    assert "GROUPED-1".encode() in lines_page.data
+    assert b"page=2" in lines_page.data
+
+    # One row for the whole receipt, with totals aggregated in SQL
+    response = auth_client.get("/records?type=stockin&view=receipts")
+    assert response.status_code == 200
+    html = response.data.decode()
+    assert html.count("GROUPED-1") == 1
+    assert "page=2" not in html
+    assert '<td class="text-end">25</td>' in html
+    assert '<td class="text-end">325</td>' in html
+    assert "¥650.00" in html
+
+    # Item filters narrow the aggregated lines
+    response = auth_client.get(
+        f"/records?type=stockin&view=receipts&sku_id={first_sku_id}"
+    )
+    assert '<td class="text-end">13</td>' in response.data.decode()
+
+    lines = auth_client.get(f"/records/receipt/{receipt_id}/lines")
+    assert lines.status_code == 200
+    assert lines.data.decode().count("<tr>") == 26
+
+
+def test_records_receipt_lines_access_control(
+    client, regular_user, test_user, test_item
+):
+    with app.app_context():
+        private = Warehouse(name="Private Warehouse", owner=test_user)
+        db.session.add(private)
+        db.session.flush()
+        receipt = Receipt(
+            operator_id=test_user.id,
+            warehouse_id=private.id,
+            type=ReceiptType.STOCKIN,
+        )
+        db.session.add(receipt)
+        db.session.add(
+            Transaction(
+                itemSKU=ItemSKU.query.first(), count=1, price=1, receipt=receipt
+            )
+        )
+        db.session.commit()
+        receipt_id = receipt.id
+
+    client.post("/login", data={"username": "testuser", "password": "password123"})
+    assert client.get(f"/records/receipt/{receipt_id}/lines").status_code == 403
+    assert client.get("/records/receipt/999999/lines").status_code == 404
+
+
+def test_records_page_is_streamed_and_consumes_flash(auth_client):
+    response = auth_client.get("/records")
+    assert response.is_streamed
+    assert "操作记录".encode() in response.data
+    # The login message is shown once even though the body is streamed after
+    # the session cookie has been written
+    assert "登录成功。".encode() in response.data
+    assert "登录成功。".encode() not in auth_client.get("/records").data
+
+
+def test_records_rows_are_fetched_after_the_head_is_sent(auth_client):
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", _record)
+    try:
+        # The test client only pulls the first write, which is the page head
+        response = auth_client.get("/records")
+        assert not any('FROM "transaction"' in s for s in statements)
+        assert "操作记录".encode() in response.data
+        assert any('FROM "transaction"' in s for s in statements)
+    finally:
+        event.remove(Engine, "before_cursor_execute", _record)
+
+
 @pytest.mark.usefixtures("test_item")
 def test_records_location_info_filter(auth_client, test_warehouse, test_customer):
     with app.app_context():
@@ -1168,6 +1379,54 @@ def test_export_takestock_records(auth_client, test_warehouse):
     assert response.status_code == 200
 
 
+@pytest.mark.usefixtures("test_item")
+def test_receipt_detail_pages_lines_by_keyset(auth_client, test_warehouse):
+    with app.app_context():
+        sku = ItemSKU.query.first()
+        receipt = Receipt(
+            operator_id=1, warehouse_id=test_warehouse, type=ReceiptType.STOCKIN
+        )
+        db.session.add(receipt)
+        db.session.flush()
+        db.session.add_all(
+            Transaction(itemSKU=sku, count=1, price=2, receipt=receipt)
+            for _ in range(250)
+        )
+        db.session.commit()
+        receipt_id = receipt.id
+
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lower())
+
+    event.listen(Engine, "before_cursor_execute", _record)
+    try:
+        response = auth_client.get(f"/receipt/{receipt_id}")
+        html = response.data.decode()
+    finally:
+        event.remove(Engine, "before_cursor_execute", _record)
+    assert response.status_code == 200
+    assert "共 250 行" in html
+    # Totals cover every line, not just the first page, and are read from
+    # the receipt instead of being summed over its lines
+    assert "¥500.00" in html
+    assert not any("sum(" in s for s in statements)
+    assert html.count("<td>¥2.00</td>") == 200
+
+    pages = 1
+    next_url = re.search(r'data-url="([^"]+)"', html).group(1).replace("&amp;", "&")
+    rows = 100
+    while next_url:
+        page = auth_client.get(next_url).data.decode()
+        rows += page.count("<td>¥2.00</td>") // 2
+        match = re.search(r'data-url="([^"]+)"', page)
+        next_url = match.group(1).replace("&amp;", "&") if match else None
+        pages += 1
+    assert pages == 3
+    assert rows == 250
+
+
 @pytest.mark.usefixtures("test_item")
 def test_receipt_detail_access(client, test_user, regular_user):
     """Test access control for receipt_detail route"""
@@ -2021,7 +2280,7 @@ def test_revoked_stockin_price_restoration(client, test_user, regular_user):
             .first()
         )
         assert warehouse_item.count == 20
-        assert abs(warehouse_item.average_price - expected_average) < 0.01
+        assert abs(float(warehouse_item.average_price) - expected_average) < 0.01
 
         # Store receipt ID for revocation
         receipt_id_to_revoke = second_stockin_receipt.id
@@ -2051,7 +2310,7 @@ def test_revoked_stockin_price_restoration(client, test_user, regular_user):
         # Stock should be back to initial level (10)
         assert warehouse_item.count == 10
         # Price should be restored to initial price
-        assert abs(warehouse_item.average_price - initial_price) < 0.01
+        assert abs(float(warehouse_item.average_price) - initial_price) < 0.01
 
 
 @pytest.mark.usefixtures("test_item")
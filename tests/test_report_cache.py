@@ -0,0 +1,296 @@
+"""Tests for the shared report cache in wms.cache."""
+
+import pytest
+import tempfile
+from datetime import datetime, timedelta
+import wms.cache
+from wms import app, db
+from wms.cache import ReportCache
+from wms.models import (
+    ItemSKU,
+    Receipt,
+    ReceiptType,
+    ToolReceipt,
+    ToolReceiptType,
+    Transaction,
+    User,
+    WarehouseItemSKU,
+)
+
+
+@pytest.fixture
+def report_cache(auth_client, tmp_path, monkeypatch):
+    cache = ReportCache(tmp_path)
+    monkeypatch.setattr(wms.cache, "report_cache", cache)
+    monkeypatch.setitem(app.config, "REPORT_CACHE_ENABLED", True)
+    # Consume the login flash message; pages with pending flashes bypass the cache
+    auth_client.get("/inventory")
+    return cache
+
+
+def _add_stockout(warehouse_id, customer, count, price):
+    with app.app_context():
+        sku = ItemSKU.query.first()
+        receipt = Receipt(
+            operator_id=1,
+            warehouse_id=warehouse_id,
+            type=ReceiptType.STOCKOUT,
+            area_id=customer["area"],
+            department_id=customer["department"],
+        )
+        db.session.add(receipt)
+        db.session.flush()
+        db.session.add(
+            Transaction(itemSKU=sku, count=count, price=price, receipt=receipt)
+        )
+        db.session.commit()
+
+
+@pytest.mark.usefixtures("test_item")
+def test_statistics_fee_served_from_cache_until_data_changes(
+    auth_client, test_warehouse, test_customer, report_cache
+):
+    _add_stockout(test_warehouse, test_customer, -15, 100.00)
+
+    first = auth_client.get("/statistics_fee")
+    assert first.headers["X-Report-Cache"] == "MISS"
+    assert b"1500.00" in first.data
+
+    second = auth_client.get("/statistics_fee")
+    assert second.headers["X-Report-Cache"] == "HIT"
+    assert second.data == first.data
+
+    # Posting new data bumps the data version and invalidates the entry
+    _add_stockout(test_warehouse, test_customer, -5, 100.00)
+    third = auth_client.get("/statistics_fee")
+    assert third.headers["X-Report-Cache"] == "MISS"
+    assert b"2000.00" in third.data
+
+
+@pytest.mark.usefixtures("test_item")
+def test_statistics_usage_cache_key_normalizes_args(
+    auth_client, test_warehouse, test_customer, report_cache
+):
+    _add_stockout(test_warehouse, test_customer, -3, 10.00)
+    today = datetime.now().date()
+    start_date = (today - timedelta(days=30)).strftime("%Y-%m-%d")
+    end_date = today.strftime("%Y-%m-%d")
+
+    first = auth_client.get(
+        f"/statistics_usage?start_date={start_date}&end_date={end_date}&brand="
+    )
+    assert first.headers["X-Report-Cache"] == "MISS"
+    # Streamed pages are stored once the body has been sent
+    assert first.data
+
+    # Same filters in a different order, without the empty parameter
+    second = auth_client.get(
+        f"/statistics_usage?end_date={end_date}&start_date={start_date}"
+    )
+    assert second.headers["X-Report-Cache"] == "HIT"
+
+
+@pytest.mark.usefixtures("test_item")
+def test_records_export_reuses_cached_file(
+    auth_client, test_warehouse, test_customer, report_cache
+):
+    _add_stockout(test_warehouse, test_customer, -2, 12.50)
+
+    first = auth_client.get("/records/export?type=stockout")
+    assert first.status_code == 200
+    assert first.headers["X-Report-Cache"] == "MISS"
+
+    second = auth_client.get("/records/export?type=stockout")
+    assert second.headers["X-Report-Cache"] == "HIT"
+    assert second.data == first.data
+    assert second.mimetype == first.mimetype
+    assert second.headers["Content-Disposition"] == first.headers["Content-Disposition"]
+
+
+def test_report_cache_lock_coalesces_concurrent_misses(tmp_path):
+    with app.app_context():
+        holder = ReportCache(tmp_path)
+        waiter = ReportCache(tmp_path)
+        with holder.lock("same-key", timeout=1) as acquired:
+            assert acquired is True
+            # A second worker cannot compute the same key concurrently
+            with waiter.lock("same-key", timeout=0.1) as waited:
+                assert waited is False
+            # Other keys are independent
+            with waiter.lock("other-key", timeout=0.1) as other:
+                assert other is True
+        with waiter.lock("same-key", timeout=0.1) as acquired_after:
+            assert acquired_after is True
+
+
+@pytest.mark.usefixtures("test_item")
+def test_statistics_usage_tabs_cached_independently(
+    auth_client, test_warehouse, test_customer, report_cache
+):
+    _add_stockout(test_warehouse, test_customer, -4, 5.00)
+
+    page = auth_client.get("/statistics_usage")
+    assert page.headers["X-Report-Cache"] == "MISS"
+    assert page.data
+    area = auth_client.get("/statistics_usage/area")
+    assert area.headers["X-Report-Cache"] == "MISS"
+    assert area.data
+    assert auth_client.get("/statistics_usage/area").headers["X-Report-Cache"] == "HIT"
+    detailed = auth_client.get("/statistics_usage/detailed")
+    assert detailed.headers["X-Report-Cache"] == "MISS"
+    assert detailed.data != area.data
+
+
+@pytest.mark.usefixtures("test_item")
+def test_receipt_detail_revalidates_by_etag(
+    auth_client, test_warehouse, test_customer, report_cache
+):
+    _add_stockout(test_warehouse, test_customer, -2, 3.00)
+    with app.app_context():
+        receipt_id = Receipt.query.first().id
+        # Stock row the revocation returns the items to
+        db.session.add(
+            WarehouseItemSKU(
+                warehouse_id=test_warehouse,
+                itemSKU_id=ItemSKU.query.first().id,
+                count=8,
+                average_price=3,
+            )
+        )
+        db.session.commit()
+
+    first = auth_client.get(f"/receipt/{receipt_id}")
+    assert first.status_code == 200
+    assert first.headers["X-Report-Cache"] == "MISS"
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+
+    # Unrelated postings do not invalidate a posted document
+    _add_stockout(test_warehouse, test_customer, -1, 3.00)
+    second = auth_client.get(f"/receipt/{receipt_id}")
+    assert second.headers["X-Report-Cache"] == "HIT"
+    assert second.headers["ETag"] == etag
+    assert second.data == first.data
+
+    not_modified = auth_client.get(
+        f"/receipt/{receipt_id}", headers={"If-None-Match": etag}
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    # Revoking changes the document, so the old ETag no longer matches
+    response = auth_client.post(
+        f"/receipt/{receipt_id}/revoke",
+        data={"reason": "测试"},
+        follow_redirects=True,
+    )
+    assert "单据已成功撤销".encode() in response.data
+    revoked = auth_client.get(f"/receipt/{receipt_id}", headers={"If-None-Match": etag})
+    assert revoked.status_code == 200
+    assert revoked.headers["ETag"] != etag
+
+
+def test_tool_print_detail_etag_follows_printed_state(auth_client, report_cache):
+    with app.app_context():
+        tool_receipt = ToolReceipt(
+            type=ToolReceiptType.RETURN, operator_id=1, printed=False
+        )
+        db.session.add(tool_receipt)
+        db.session.commit()
+        receipt_id = tool_receipt.id
+
+    first = auth_client.get(f"/tools/print/{receipt_id}")
+    assert first.headers["X-Report-Cache"] == "MISS"
+    etag = first.headers["ETag"]
+    assert (
+        auth_client.get(
+            f"/tools/print/{receipt_id}", headers={"If-None-Match": etag}
+        ).status_code
+        == 304
+    )
+
+    auth_client.post(f"/tools/print/{receipt_id}/toggle-printed", follow_redirects=True)
+    printed = auth_client.get(
+        f"/tools/print/{receipt_id}", headers={"If-None-Match": etag}
+    )
+    assert printed.status_code == 200
+    assert printed.headers["ETag"] != etag
+    assert "取消“已打印”状态".encode() in printed.data
+
+
+def test_report_cache_creates_missing_directory(tmp_path):
+    with app.app_context():
+        # A fresh deployment has no cache directory yet; the first commit bumps
+        cache = ReportCache(tmp_path / "missing" / "cache")
+        cache.bump_data_version()
+        assert cache.data_version() == 1
+
+
+def test_report_cache_set_from_file_copies_body_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(wms.cache, "_COPY_CHUNK_SIZE", 7)
+    body = "统计".encode() * 50
+    with app.app_context():
+        cache = ReportCache(tmp_path)
+        with tempfile.TemporaryFile() as fh:
+            fh.write(body)
+            cache.set_from_file("key", fh, "text/html", {"X-Test": "1"})
+        entry = cache.get("key")
+    assert entry["body"] == body
+    assert entry["mimetype"] == "text/html"
+    assert entry["headers"] == {"X-Test": "1"}
+
+
+def test_streamed_page_spooled_to_disk_is_cached_whole(
+    auth_client, report_cache, monkeypatch
+):
+    # Spool after a few bytes so the body goes through a temporary file
+    monkeypatch.setattr(wms.cache, "_SPOOL_MEMORY_SIZE", 16)
+    first = auth_client.get("/statistics_fee")
+    assert first.headers["X-Report-Cache"] == "MISS"
+    assert "费用统计".encode() in first.data
+    second = auth_client.get("/statistics_fee")
+    assert second.headers["X-Report-Cache"] == "HIT"
+    assert second.data == first.data
+
+
+def test_report_cache_lock_files_are_removed_after_release(tmp_path):
+    with app.app_context():
+        cache = ReportCache(tmp_path)
+        with cache.lock("some-key", timeout=1) as acquired:
+            assert acquired is True
+            assert (cache.lock_dir / "some-key.lock").exists()
+        assert list(cache.lock_dir.iterdir()) == []
+        # The key can be locked again once its file is gone
+        with cache.lock("some-key", timeout=0.1) as again:
+            assert again is True
+
+
+def _login(client, username):
+    client.post("/login", data={"username": username, "password": "password123"})
+    # Consume the login flash; pages with pending flashes bypass the cache
+    client.get("/inventory")
+
+
+def test_auditors_share_cached_reports(client, auditor_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(wms.cache, "report_cache", ReportCache(tmp_path))
+    monkeypatch.setitem(app.config, "REPORT_CACHE_ENABLED", True)
+    with app.app_context():
+        second = User(username="auditor2", nickname="Second Auditor", is_auditor=True)
+        second.set_password("password123")
+        db.session.add(second)
+        db.session.commit()
+
+    _login(client, "testauditor")
+    first = client.get("/statistics_fee")
+    assert first.headers["X-Report-Cache"] == "MISS"
+    assert "你好，Test Auditor".encode() in first.data
+    client.get("/logout")
+
+    _login(client, "auditor2")
+    shared = client.get("/statistics_fee")
+    assert shared.headers["X-Report-Cache"] == "HIT"
+    # Per-viewer parts are filled in for the viewer, not the one who computed it
+    assert "你好，Second Auditor".encode() in shared.data
+    assert b"Test Auditor" not in shared.data
+    for response in (first, shared):
+        assert b"__report_cache_" not in response.data
@@ -0,0 +1,70 @@
+"""Tests for the usage statistics engine in wms.statistics."""
+
+from decimal import Decimal
+from wms.statistics import (
+    area_view,
+    department_view,
+    detailed_view,
+    summarize,
+    usage_frame,
+)
+
+
+def _row(sku_id, item_name, area_id, dept_id, usage, cents, brand="B", spec="S"):
+    return (sku_id, sku_id * 10, item_name, brand, spec, area_id, dept_id, usage, cents)
+
+
+def test_usage_views_empty():
+    frame = usage_frame([])
+    summary = summarize(frame)
+    assert list(summary["usage_data"]) == []
+    assert summary["total_quantity"] == 0
+    assert summary["total_value"] == Decimal("0")
+    skus = summary["skus"]
+    assert list(area_view(frame, skus)["area_list"]) == []
+    assert list(department_view(frame, skus)["dept_list"]) == []
+    assert detailed_view(frame, skus)["detailed_by_dept"] == {}
+
+
+def test_usage_views_pivot_sparse_cells():
+    rows = [
+        _row(1, "Screw", 1, 1, 4, 4000),
+        _row(1, "Screw", 2, 1, 1, 1100),
+        _row(1, "Screw", None, None, 5, 5000),
+        _row(2, "Bolt", 2, 2, 3, 750),
+        _row(2, "Bolt", 1, None, 2, 500),
+    ]
+    frame = usage_frame(rows)
+    summary = summarize(frame)
+    skus = summary["skus"]
+
+    # Summary sorted by item name and including unlocated stockouts
+    usage = [(sku.id, item.name, u, v) for sku, item, u, _, v in summary["usage_data"]]
+    assert usage == [
+        (2, "Bolt", 5, Decimal("12.50")),
+        (1, "Screw", 10, Decimal("101.00")),
+    ]
+    assert summary["total_quantity"] == 15
+    assert summary["total_value"] == Decimal("113.50")
+
+    # Per-area totals only count located stockouts
+    bolt_area, screw_area = area_view(frame, skus)["area_list"]
+    assert bolt_area["area_usage"] == {1: 2, 2: 3}
+    assert screw_area["area_usage"] == {1: 4, 2: 1}
+    assert screw_area["total_usage"] == 5
+    assert screw_area["total_value"] == Decimal("51.00")
+    assert screw_area["average_price"] == Decimal("10.2")
+
+    bolt_dept, screw_dept = department_view(frame, skus)["dept_list"]
+    assert bolt_dept["dept_usage"] == {2: 3}
+    assert screw_dept["dept_usage"] == {1: 5}
+
+    # Department × area needs both keys
+    detailed_by_dept = detailed_view(frame, skus)["detailed_by_dept"]
+    assert sorted(detailed_by_dept) == [1, 2]
+    (screw_detail,) = detailed_by_dept[1]
+    assert screw_detail["area_usage"] == {1: 4, 2: 1}
+    assert screw_detail["total_value"] == Decimal("51.00")
+    (bolt_detail,) = detailed_by_dept[2]
+    assert bolt_detail["item"].name == "Bolt"
+    assert bolt_detail["area_usage"] == {2: 3}
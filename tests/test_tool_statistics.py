@@ -0,0 +1,88 @@
+"""Tests for the tool report engine in wms.tool_statistics."""
+
+from wms.models import ToolReceiptType
+from wms.tool_statistics import (
+    TOOL_REPORT_COLUMNS,
+    exchange_frequency,
+    tool_report_frame,
+    tool_report_totals,
+)
+
+
+def test_tool_report_frame_empty():
+    frame = tool_report_frame([], [], [], [])
+    assert list(frame.columns) == TOOL_REPORT_COLUMNS
+    assert frame.empty
+    assert tool_report_totals(frame) == {
+        "held": 0,
+        "requisitioned": 0,
+        "exchanged": 0,
+        "returned": 0,
+    }
+
+
+def test_tool_report_frame_pivots_movements_onto_holdings():
+    holdings = [(1, 10, 3), (2, 10, 1)]
+    movements = [
+        (1, 10, ToolReceiptType.REQUISITION, 5),
+        (1, 10, ToolReceiptType.RETURN, 2),
+        # Tool no longer held but exchanged during the period
+        (3, 11, ToolReceiptType.EXCHANGE, 1),
+    ]
+    employees = [
+        (1, "E1", "甲", "一班"),
+        (2, "E2", "乙", "一班"),
+        (3, "E3", "丙", None),
+    ]
+    skus = [(10, "扳手", "B", "S"), (11, "钳子", "B", "S")]
+
+    frame = tool_report_frame(holdings, movements, employees, skus)
+
+    rows = frame[["employee_no", "item_name", *TOOL_REPORT_COLUMNS[-4:]]]
+    assert rows.values.tolist() == [
+        ["E1", "扳手", 3, 5, 0, 2],
+        ["E2", "扳手", 1, 0, 0, 0],
+        ["E3", "钳子", 0, 0, 1, 0],
+    ]
+    assert frame["crew"].tolist() == ["一班", "一班", "—"]
+    assert tool_report_totals(frame) == {
+        "held": 4,
+        "requisitioned": 5,
+        "exchanged": 1,
+        "returned": 2,
+    }
+
+
+def test_exchange_frequency_ranks_against_crew_median():
+    # employee_id, sku_id, pieces, exchanges, previous
+    rows = [
+        (1, 10, 9, 3, 2),
+        (2, 10, 1, 1, 0),
+        (4, 10, 2, 1, 1),
+        # Resigned employee, not on the roster
+        (9, 10, 50, 5, 0),
+        # Only exchanged in the previous window
+        (3, 11, 0, 0, 4),
+    ]
+    roster = [(1, 100), (2, 100), (3, 100), (4, 200)]
+    employees = [(1, "E1", "甲", "一班"), (2, "E2", "乙", "一班")]
+    skus = [(10, "扳手", "B", "S"), (11, "钳子", "B", "S")]
+
+    stats = exchange_frequency(rows, roster, employees, skus, 90)
+
+    ranking = stats["ranking"]
+    assert ranking["employee_id"].tolist() == [1, 4, 2]
+    # Crew 100 exchanged 9, 1 and 0 (employee 3), so the median is 1
+    assert ranking["crew_median"].tolist() == [1.0, 2.0, 1.0]
+    assert ranking["outlier"].tolist() == [True, False, False]
+    assert ranking.loc[0, "rate"] == 3.0
+    assert ranking["crew"].tolist() == ["一班", "—", "一班"]
+
+    by_tool = stats["by_tool"]
+    assert by_tool[
+        ["item_name", "pieces", "exchanges", "previous"]
+    ].values.tolist() == [
+        ["扳手", 12, 5, 3],
+        ["钳子", 0, 0, 4],
+    ]
+    assert by_tool["employees"].tolist() == [3, 0]
@@ -0,0 +1,241 @@
+"""Tests for the single-writer posting queue in wms.writer."""
+
+from decimal import Decimal
+from multiprocessing.connection import Client
+import threading
+import time
+import pytest
+from wms import app, db
+from wms.models import (
+    Area,
+    Department,
+    ItemSKU,
+    Receipt,
+    ReceiptType,
+    Transaction,
+    Warehouse,
+    WarehouseItemSKU,
+)
+from wms.posting import PostingBusyError, posting_metrics
+from wms.writer import _JOBS, run_batch, serve, submit
+
+
+@pytest.fixture
+def stocked(client, test_user, test_item):
+    """A warehouse holding 10 of the test SKU at 2.50."""
+    with app.app_context():
+        area = Area(name="Writer Area")
+        department = Department(name="Writer Department")
+        warehouse = Warehouse(name="Writer Warehouse", owner_id=1)
+        db.session.add_all([area, department, warehouse])
+        db.session.flush()
+        sku = ItemSKU.query.first()
+        receipt = Receipt(
+            operator_id=1,
+            warehouse_id=warehouse.id,
+            type=ReceiptType.STOCKIN,
+        )
+        db.session.add(receipt)
+        db.session.add(
+            Transaction(itemSKU_id=sku.id, count=10, price=2.5, receipt=receipt)
+        )
+        db.session.commit()
+        receipt.update_warehouse_item_skus()
+        return {
+            "warehouse_id": warehouse.id,
+            "sku_id": sku.id,
+            "area": area.id,
+            "department": department.id,
+        }
+
+
+def _stockout(stocked, quantity, note=None):
+    return (
+        "stockout",
+        {
+            "operator_id": 1,
+            "warehouse_id": stocked["warehouse_id"],
+            "area_id": stocked["area"],
+            "department_id": stocked["department"],
+            "location": None,
+            "note": note,
+            "date": None,
+            "lines": [(stocked["sku_id"], quantity)],
+        },
+    )
+
+
+def _stock_count(stocked):
+    return (
+        WarehouseItemSKU.query.filter_by(
+            warehouse_id=stocked["warehouse_id"], itemSKU_id=stocked["sku_id"]
+        )
+        .one()
+        .count
+    )
+
+
+def test_run_batch_isolates_rejected_jobs(stocked):
+    posting_metrics.reset()
+    with app.app_context():
+        replies = run_batch(
+            [
+                _stockout(stocked, 3, "first"),
+                _stockout(stocked, 50, "too many"),
+                _stockout(stocked, 4, "second"),
+            ]
+        )
+        assert [status for status, _ in replies] == ["ok", "error", "ok"]
+        assert "库存不足" in replies[1][1]
+        # Later jobs see the stock left by earlier ones in the same batch
+        assert _stock_count(stocked) == 3
+        notes = {
+            r.note for r in Receipt.query.filter_by(type=ReceiptType.STOCKOUT).all()
+        }
+        assert notes == {"first", "second"}
+        # Prices come from the warehouse average, not the payload
+        stockout = db.session.get(Receipt, replies[0][1]["receipt_id"])
+        assert [float(t.price) for t in stockout.transactions] == [2.5]
+    # One transaction for the whole batch
+    assert posting_metrics.snapshot()["acquired"] == 1
+
+
+def test_run_batch_isolates_failing_jobs(stocked, monkeypatch):
+    def broken(payload):
+        # Writes a receipt, then fails before the job completes
+        _JOBS["stockout"](payload)
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setitem(_JOBS, "broken", broken)
+    with app.app_context():
+        replies = run_batch(
+            [
+                _stockout(stocked, 3, "first"),
+                ("broken", _stockout(stocked, 2, "broken")[1]),
+                _stockout(stocked, 4, "second"),
+            ]
+        )
+        assert [status for status, _ in replies] == ["ok", "error", "ok"]
+        assert "disk I/O error" in replies[1][1]
+        # The failed job's writes are rolled back, the others are committed
+        assert _stock_count(stocked) == 3
+        notes = {
+            r.note for r in Receipt.query.filter_by(type=ReceiptType.STOCKOUT).all()
+        }
+        assert notes == {"first", "second"}
+
+
+def test_submit_raises_for_rejected_job(stocked):
+    with app.app_context():
+        with pytest.raises(ValueError, match="库存不足"):
+            submit(*_stockout(stocked, 11))
+        assert submit(*_stockout(stocked, 10))["receipt_id"]
+        assert _stock_count(stocked) == 0
+
+
+def _start_writer(tmp_path, monkeypatch, timeout=5):
+    address = str(tmp_path / "writer.sock")
+    monkeypatch.setitem(app.config, "POSTING_WRITER_SOCKET", address)
+    monkeypatch.setitem(app.config, "POSTING_WRITER_TIMEOUT", timeout)
+    threading.Thread(target=serve, args=(address,), daemon=True).start()
+    for _ in range(100):
+        if (tmp_path / "writer.sock").exists():
+            break
+        time.sleep(0.01)
+    return address
+
+
+def test_submit_through_writer_socket(stocked, tmp_path, monkeypatch):
+    _start_writer(tmp_path, monkeypatch)
+
+    with app.app_context():
+        results = []
+
+        def post(quantity):
+            try:
+                results.append(submit(*_stockout(stocked, quantity)))
+            except ValueError as exc:
+                results.append(str(exc))
+
+        threads = [threading.Thread(target=post, args=(q,)) for q in (2, 3, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(isinstance(r, dict) for r in results) == 2
+        assert any("库存不足" in r for r in results if isinstance(r, str))
+        db.session.expire_all()
+        assert _stock_count(stocked) == 5
+
+
+def test_writer_never_starts_a_job_its_request_gave_up_on(
+    stocked, tmp_path, monkeypatch
+):
+    # The writer collects a batch for longer than requests wait for it
+    monkeypatch.setitem(app.config, "POSTING_WRITER_WINDOW", 1.5)
+    _start_writer(tmp_path, monkeypatch, timeout=0.5)
+
+    with app.app_context():
+        with pytest.raises(PostingBusyError):
+            submit(*_stockout(stocked, 3))
+        # Let the writer run the batch it was collecting
+        time.sleep(2)
+        db.session.expire_all()
+        assert _stock_count(stocked) == 10
+        assert not Receipt.query.filter_by(type=ReceiptType.STOCKOUT).count()
+
+
+def test_writer_skips_jobs_past_their_start_deadline(stocked, tmp_path, monkeypatch):
+    address = _start_writer(tmp_path, monkeypatch)
+    name, payload = _stockout(stocked, 3)
+    with Client(address, authkey=str(app.secret_key).encode()) as conn:
+        conn.send((name, payload, time.time() - 1))
+        assert conn.poll(5)
+        status, _ = conn.recv()
+    assert status == "busy"
+    with app.app_context():
+        assert _stock_count(stocked) == 10
+
+
+def test_stockin_and_revoke_are_posting_jobs(stocked, tmp_path, monkeypatch):
+    _start_writer(tmp_path, monkeypatch)
+    with app.app_context():
+        stockin = submit(
+            "stockin",
+            {
+                "operator_id": 1,
+                "refcode": "WRITER-IN",
+                "warehouse_id": stocked["warehouse_id"],
+                "date": None,
+                "lines": [(stocked["sku_id"], 5, Decimal("4.00"))],
+            },
+        )
+        db.session.expire_all()
+        assert _stock_count(stocked) == 15
+        # The refcode is checked again by the job, under the write lock
+        with pytest.raises(ValueError, match="已存在"):
+            submit(
+                "stockin",
+                {
+                    "operator_id": 1,
+                    "refcode": "WRITER-IN",
+                    "warehouse_id": stocked["warehouse_id"],
+                    "date": None,
+                    "lines": [(stocked["sku_id"], 5, Decimal("4.00"))],
+                },
+            )
+
+        revoke = {
+            "receipt_id": stockin["receipt_id"],
+            "operator_id": 1,
+            "operator_nickname": "Test Admin",
+            "reason": "录入错误",
+        }
+        submit("revoke_receipt", revoke)
+        db.session.expire_all()
+        assert _stock_count(stocked) == 10
+        assert db.session.get(Receipt, stockin["receipt_id"]).revoked
+        with pytest.raises(ValueError, match="此单据已被撤销"):
+            submit("revoke_receipt", revoke)
+        assert _stock_count(stocked) == 10
@@ -7,6 +7,7 @@ REPO_ROOT="$SCRIPT_DIR"
 LOG_DIR="$REPO_ROOT/logs"
 PID_FILE="$REPO_ROOT/wms.pid"
 PORT_FILE="$REPO_ROOT/wms.port"
+WRITER_PID_FILE="$REPO_ROOT/wms-writer.pid"
 
 resolve_gunicorn() {
     if [[ -x "$REPO_ROOT/.venv/bin/gunicorn" ]]; then
@@ -22,6 +23,39 @@ resolve_gunicorn() {
     return 1
 }
 
+resolve_python() {
+    if [[ -x "$REPO_ROOT/.venv/bin/python" ]]; then
+        printf '%s\n' "$REPO_ROOT/.venv/bin/python"
+        return 0
+    fi
+
+    command -v python3
+}
+
+# The posting writer only runs when POSTING_WRITER_SOCKET is configured
+start_writer() {
+    local log="$1"
+
+    if [[ -z "${POSTING_WRITER_SOCKET:-}" ]]; then
+        return 0
+    fi
+
+    nohup "$(resolve_python)" -m flask --app wsgi posting-writer &>> "$log" &
+    printf '%s\n' "$!" > "$WRITER_PID_FILE"
+}
+
+stop_writer() {
+    local pid=""
+
+    if [[ -f "$WRITER_PID_FILE" ]]; then
+        pid="$(<"$WRITER_PID_FILE")"
+        if [[ "$pid" =~ ^[0-9]+$ ]]; then
+            kill "$pid" >/dev/null 2>&1 || true
+        fi
+        rm -f "$WRITER_PID_FILE"
+    fi
+}
+
 usage() {
     cat <<'EOF'
 Usage:
@@ -105,8 +139,10 @@ start_server() {
     fi
 
     log="$LOG_DIR/$(date --iso-8601).log"
+    export SLOW_QUERY_LOG="${SLOW_QUERY_LOG:-$LOG_DIR/slow_queries.log}"
     printf '%s\n' "$port" > "$PORT_FILE"
-    nohup "$gunicorn_bin" --bind "0.0.0.0:$port" --workers=3 --pid "$PID_FILE" wsgi:app &>> "$log" &
+    start_writer "$log"
+    nohup "$gunicorn_bin" -c "$REPO_ROOT/gunicorn.conf.py" --bind "0.0.0.0:$port" --pid "$PID_FILE" wsgi:app &>> "$log" &
     echo "Started on port $port. Log: $log"
 }
 
@@ -121,6 +157,7 @@ stop_server() {
 
     kill "$pid" >/dev/null 2>&1 || true
     rm -f "$PID_FILE"
+    stop_writer
     echo "Stopped pid $pid."
 }
 
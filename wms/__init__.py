@@ -38,6 +38,46 @@ app.config["SQLALCHEMY_POOL_RECYCLE"] = 1800
 # Maximum number of connections to create beyond pool_size
 app.config["SQLALCHEMY_MAX_OVERFLOW"] = 20
 app.config["BOOTSTRAP_SERVE_LOCAL"] = True
+# Shared report cache (see wms/cache.py); disabled for the in-memory test database
+app.config["REPORT_CACHE_ENABLED"] = not is_testing
+app.config["REPORT_CACHE_DIR"] = os.getenv(
+    "REPORT_CACHE_DIR", os.path.join(os.path.dirname(app.root_path), "cache")
+)
+# Seconds a cached report stays valid; keep below the CSRF token lifetime
+app.config["REPORT_CACHE_TTL"] = 600
+# Seconds a worker waits for another worker computing the same report
+app.config["REPORT_CACHE_LOCK_TIMEOUT"] = 120
+# Posting transactions (see wms/posting.py): retries after the busy timeout,
+# base backoff in seconds, and the lock wait in seconds that gets logged
+app.config["POSTING_LOCK_RETRIES"] = 5
+app.config["POSTING_LOCK_BACKOFF"] = 0.05
+app.config["POSTING_LOCK_WAIT_WARN"] = 1.0
+# Optional single writer process (see wms/writer.py): its Unix socket path,
+# the seconds it waits to group jobs, the most jobs per commit, and how long a
+# request waits for its reply
+app.config["POSTING_WRITER_SOCKET"] = os.getenv("POSTING_WRITER_SOCKET") or None
+app.config["POSTING_WRITER_WINDOW"] = 0.005
+app.config["POSTING_WRITER_BATCH"] = 32
+app.config["POSTING_WRITER_TIMEOUT"] = 30
+# Read-only engine for reports and exports (see wms/readonly.py): its pool and
+# its SQLite page cache in KiB
+app.config["READ_ENGINE_POOL_SIZE"] = 5
+app.config["READ_ENGINE_MAX_OVERFLOW"] = 10
+app.config["READ_ENGINE_CACHE_KIB"] = 65536
+# Query time budgets (see wms/budget.py): seconds per report endpoint, the
+# default for other budgeted endpoints, and the slow query log
+app.config["QUERY_BUDGET_DEFAULT"] = 30
+app.config["QUERY_BUDGETS"] = {"records_export": 60, "inventory_export": 60}
+app.config["SLOW_QUERY_SECONDS"] = 2.0
+app.config["SLOW_QUERY_LOG"] = os.getenv("SLOW_QUERY_LOG") or None
+# Admission control for heavy requests (see wms/admission.py): how many may run
+# at once across all workers, how long a request waits for a slot, and the
+# Retry-After seconds sent with the 503; keep slots below the server capacity
+app.config["ADMISSION_CONTROL_ENABLED"] = not is_testing
+app.config["ADMISSION_LOCK_DIR"] = os.getenv("ADMISSION_LOCK_DIR") or None
+app.config["HEAVY_REQUEST_SLOTS"] = 2
+app.config["HEAVY_REQUEST_WAIT"] = 3.0
+app.config["HEAVY_REQUEST_RETRY_AFTER"] = 10
 load_runtime_config(app)
 bootstrap = Bootstrap5(app)
 csrf = CSRFProtect(app)
@@ -0,0 +1,111 @@
+"""Admission control for heavy requests.
+
+Exports, statistics pages and batch imports can each keep a worker busy for
+many seconds. With a handful of gunicorn workers, a few of them at once would
+leave no worker to answer a storekeeper posting a stock-out. ``heavy_request``
+caps how many heavy requests run at the same time across all workers with a
+file-lock semaphore: ``HEAVY_REQUEST_SLOTS`` lock files in a shared directory,
+each held with ``flock`` by the request using it. Keep the slot count below
+the number of concurrent requests the server can handle so posting routes,
+which are never admission controlled, always find a free worker.
+
+A request that finds every slot taken waits up to ``HEAVY_REQUEST_WAIT``
+seconds for one, then gets a 503 with ``Retry-After``. Locks held by a worker
+that dies are released by the kernel, so slots cannot leak.
+"""
+
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from pathlib import Path
+import fcntl
+import os
+import time
+
+from flask import make_response, render_template, request
+from wms import app
+
+
+class SlotSemaphore:
+    """A counting semaphore shared by processes through ``flock``."""
+
+    def __init__(self, directory: str | os.PathLike, slots: int):
+        self.directory = Path(directory)
+        self.slots = slots
+
+    def _try_acquire(self):
+        for slot in range(self.slots):
+            fh = open(self.directory / f"slot-{slot}.lock", "a+")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                continue
+            return fh
+        return None
+
+    @contextmanager
+    def slot(self, timeout: float):
+        """Hold one slot; yields False when none freed up within ``timeout``."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + timeout
+        fh = self._try_acquire()
+        while fh is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            fh = self._try_acquire()
+        if fh is None:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+
+
+def _semaphore() -> SlotSemaphore:
+    directory = app.config["ADMISSION_LOCK_DIR"] or os.path.join(
+        app.config["REPORT_CACHE_DIR"], "admission"
+    )
+    return SlotSemaphore(directory, app.config["HEAVY_REQUEST_SLOTS"])
+
+
+def _busy_response():
+    retry_after = app.config["HEAVY_REQUEST_RETRY_AFTER"]
+    response = make_response(
+        render_template("errors/503.html.jinja", retry_after=retry_after), 503
+    )
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def heavy_request(view):
+    """Run the view only while holding one of the heavy-request slots.
+
+    Views that also accept POST are form pages; only their submissions count.
+    """
+
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        if not app.config["ADMISSION_CONTROL_ENABLED"] or (
+            request.method != "POST" and "POST" in request.url_rule.methods
+        ):
+            return view(*args, **kwargs)
+
+        with ExitStack() as stack:
+            acquired = stack.enter_context(
+                _semaphore().slot(app.config["HEAVY_REQUEST_WAIT"])
+            )
+            if not acquired:
+                app.logger.warning(
+                    "Rejected heavy request %s: all %d slots busy",
+                    request.endpoint,
+                    app.config["HEAVY_REQUEST_SLOTS"],
+                )
+                return _busy_response()
+            response = make_response(view(*args, **kwargs))
+            if response.is_streamed:
+                # Streamed pages keep working after the view returns
+                response.call_on_close(stack.pop_all().close)
+            return response
+
+    return decorated
@@ -0,0 +1,152 @@
+"""Query time budgets for report endpoints.
+
+A report over a careless date range can scan years of ledger rows and pin a
+worker for minutes. Views decorated with ``query_budget`` get a deadline of
+``QUERY_BUDGETS[endpoint]`` seconds (``QUERY_BUDGET_DEFAULT`` otherwise). A
+SQLite progress handler, called every few thousand virtual machine steps,
+interrupts the running statement once the deadline has passed, and the view
+answers with a request to narrow the filters instead of a timeout. Streamed
+pages run their queries while they render; the deadline covers that too, and
+an interrupted page ends with the same request.
+
+Interrupted statements, and any statement slower than ``SLOW_QUERY_SECONDS``,
+are written to the ``wms.slow_query`` log, which goes to ``SLOW_QUERY_LOG``
+when that is set.
+"""
+
+from functools import wraps
+import logging
+import time
+
+from flask import (
+    Response,
+    flash,
+    g,
+    has_app_context,
+    has_request_context,
+    redirect,
+    request,
+    url_for,
+)
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from wms import app, db
+
+# SQLite virtual machine steps between deadline checks
+_PROGRESS_STEPS = 10000
+
+OVER_BUDGET = "查询超出时间限制，请缩小日期范围或增加筛选条件后重试。"
+
+slow_log = logging.getLogger("wms.slow_query")
+if app.config["SLOW_QUERY_LOG"]:
+    _handler = logging.FileHandler(app.config["SLOW_QUERY_LOG"], encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.INFO)
+
+
+def _deadline_passed() -> int:
+    # Runs inside sqlite3 in the thread executing the query; a non-zero
+    # return value aborts the statement with "interrupted"
+    deadline = g.get("query_deadline") if has_app_context() else None
+    return int(deadline is not None and time.monotonic() > deadline)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+    if conn.dialect.name != "sqlite" or not has_app_context():
+        return
+    if g.get("query_deadline") is not None and not conn.info.get("query_budget"):
+        # Installed once per connection; it is a no-op without a deadline
+        conn.connection.dbapi_connection.set_progress_handler(
+            _deadline_passed, _PROGRESS_STEPS
+        )
+        conn.info["query_budget"] = True
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+    if elapsed > app.config["SLOW_QUERY_SECONDS"]:
+        slow_log.warning(
+            "slow %.3fs %s: %s",
+            elapsed,
+            request.endpoint if has_request_context() else "-",
+            statement,
+        )
+
+
+def _is_interrupted(exc: OperationalError) -> bool:
+    return "interrupted" in str(exc.orig).lower()
+
+
+def _log_interrupted(exc: OperationalError, start: float, budget: float) -> None:
+    db.session.rollback()
+    slow_log.warning(
+        "interrupted %.3fs (budget %ss) %s %s: %s",
+        time.monotonic() - start,
+        budget,
+        request.endpoint,
+        request.query_string.decode(),
+        exc.statement,
+    )
+
+
+def budgeted_stream(chunks):
+    """Keep the view's query budget while a streamed page renders.
+
+    ``stream_page`` runs the rest of a page inside this generator, after the
+    status line has been sent, so an interruption ends the page with the
+    notice instead of a redirect.
+    """
+    try:
+        yield from chunks
+    except OperationalError as exc:
+        if not _is_interrupted(exc) or "query_budget" not in g:
+            raise
+        _log_interrupted(exc, *g.query_budget)
+        # Tells cached_report not to store the truncated page
+        g.query_interrupted = True
+        yield Markup('<div class="alert alert-warning m-3">%s</div>') % OVER_BUDGET
+    finally:
+        g.pop("query_deadline", None)
+        g.pop("query_budget", None)
+
+
+def query_budget(view):
+    """Interrupt the view's queries once its time budget has been spent."""
+
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        budget = app.config["QUERY_BUDGETS"].get(
+            request.endpoint, app.config["QUERY_BUDGET_DEFAULT"]
+        )
+        start = time.monotonic()
+        g.query_deadline = start + budget
+        g.query_budget = (start, budget)
+        streamed = False
+        try:
+            response = view(*args, **kwargs)
+            # Streamed pages keep running queries after the view returns;
+            # budgeted_stream clears the deadline once they are done
+            streamed = (
+                isinstance(response, Response)
+                and response.is_streamed
+                and not response.direct_passthrough
+            )
+            return response
+        except OperationalError as exc:
+            if not _is_interrupted(exc):
+                raise
+            _log_interrupted(exc, start, budget)
+            flash(OVER_BUDGET, "warning")
+            return redirect(request.referrer or url_for("index"))
+        finally:
+            if not streamed:
+                g.pop("query_deadline", None)
+                g.pop("query_budget", None)
+
+    return decorated
@@ -0,0 +1,493 @@
+"""Shared on-disk cache for rendered report responses.
+
+Entries are stored in a small SQLite file next to the application database so
+every gunicorn worker reads and writes the same cache. Keys combine the route,
+the normalized query string, the viewer's access scope and a global data
+version that is bumped whenever a session commits changes, so a posted receipt
+invalidates every cached report at once.
+
+Admins share entries, as do auditors, so several auditors opening the same
+period are served one computed report. Other users see only their own
+warehouses and crew and keep entries of their own. The few per-viewer parts of
+a page (the CSRF token and the greeting) are rendered as placeholders while an
+entry is filled and substituted for each response.
+
+Concurrent misses for the same key are coalesced with a per-key ``flock``: the
+first worker computes the response while the others block on the lock and then
+read the freshly stored entry. Streamed pages are copied into the cache as they
+are sent, and the lock is held until the last chunk has gone out.
+
+Posted documents (receipts, tool slips) are cached differently: their pages
+only change when one of a few mutable fields does, so ``cached_document`` keys
+them on those fields instead of the global data version and also exposes the
+key as an ``ETag`` so browsers revalidate with a 304.
+"""
+
+from contextlib import ExitStack, contextmanager
+from datetime import date
+from functools import wraps
+from pathlib import Path
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from flask import Response, g, make_response, request, session
+from flask.globals import request_ctx
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from wms import app
+
+# Response headers worth replaying from a cached entry
+_REPLAYED_HEADERS = ("Content-Disposition",)
+# Stand-ins for per-viewer values in shared cached pages
+_CSRF_PLACEHOLDER = b"__report_cache_csrf_token__"
+_NICKNAME_PLACEHOLDER = b"__report_cache_nickname__"
+# Bytes of a streamed body kept in memory before it is spooled to disk
+_SPOOL_MEMORY_SIZE = 1024 * 1024
+# Bytes copied at a time from a spooled body into its cache entry
+_COPY_CHUNK_SIZE = 64 * 1024
+
+
+class ReportCache:
+    """SQLite-backed response cache shared by all worker processes."""
+
+    def __init__(self, directory: str | os.PathLike):
+        self.directory = Path(directory)
+        self.path = self.directory / "report_cache.sqlite"
+        self.lock_dir = self.directory / "locks"
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entry ("
+                " key TEXT PRIMARY KEY,"
+                " created REAL NOT NULL,"
+                " mimetype TEXT NOT NULL,"
+                " headers TEXT NOT NULL,"
+                " body BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                " name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) VALUES ('data_version', 0)"
+            )
+            self._initialized = True
+        return conn
+
+    def data_version(self) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE name = 'data_version'"
+            ).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def bump_data_version(self) -> None:
+        """Invalidate every entry by moving to a new data version."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE name = 'data_version'"
+            )
+            # Drop expired entries while the connection is open
+            conn.execute(
+                "DELETE FROM entry WHERE created < ?",
+                (time.time() - app.config["REPORT_CACHE_TTL"],),
+            )
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> dict | None:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT created, mimetype, headers, body FROM entry WHERE key = ?",
+                (key,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        created, mimetype, headers, body = row
+        if time.time() - created > app.config["REPORT_CACHE_TTL"]:
+            return None
+        return {"mimetype": mimetype, "headers": json.loads(headers), "body": body}
+
+    def set(self, key: str, body: bytes, mimetype: str, headers: dict) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entry (key, created, mimetype, headers, body)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, time.time(), mimetype, json.dumps(headers), body),
+            )
+        finally:
+            conn.close()
+
+    def set_from_file(self, key: str, fh, mimetype: str, headers: dict) -> None:
+        """Store the body spooled to ``fh`` without reading it into memory."""
+        size = fh.seek(0, os.SEEK_END)
+        fh.seek(0)
+        conn = self._connect()
+        try:
+            # One transaction so readers never see the zero-filled placeholder
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row_id = conn.execute(
+                    "INSERT OR REPLACE INTO entry"
+                    " (key, created, mimetype, headers, body)"
+                    " VALUES (?, ?, ?, ?, zeroblob(?))",
+                    (key, time.time(), mimetype, json.dumps(headers), size),
+                ).lastrowid
+                with conn.blobopen("entry", "body", row_id) as blob:
+                    while chunk := fh.read(_COPY_CHUNK_SIZE):
+                        blob.write(chunk)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def clear(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM entry")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def lock(self, key: str, timeout: float):
+        """Hold an exclusive cross-process lock for ``key``.
+
+        Yields True when the lock was acquired, False when ``timeout`` expired;
+        callers then compute without coalescing rather than waiting forever.
+        The lock file is removed on release so one file per key does not pile
+        up in the lock directory.
+        """
+        self._connect().close()
+        path = self.lock_dir / f"{key}.lock"
+        deadline = time.monotonic() + timeout
+        fh = None
+        while fh is None:
+            candidate = open(path, "a+")
+            try:
+                fcntl.flock(candidate, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                candidate.close()
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.05)
+                continue
+            # The previous holder may have unlinked the file while we opened
+            # it; a lock on a removed file excludes nobody, so start over
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(candidate.fileno()).st_ino:
+                fh = candidate
+            else:
+                candidate.close()
+        try:
+            yield fh is not None
+        finally:
+            if fh is not None:
+                # Unlink while still holding the lock, then release
+                path.unlink(missing_ok=True)
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                fh.close()
+
+
+report_cache = ReportCache(app.config["REPORT_CACHE_DIR"])
+
+
+def _normalized_args() -> list[tuple[str, str]]:
+    """Return query args sorted and with empty values dropped."""
+    return sorted((k, v) for k, v in request.args.items(multi=True) if v != "")
+
+
+def _access_scope() -> dict:
+    """What the viewer may see; reports depend on nothing else about them."""
+    if current_user.can_view_all_warehouses:
+        # The navigation still differs between admins and auditors
+        return {"admin": current_user.is_admin, "auditor": current_user.is_auditor}
+    # Own warehouses and own crew only
+    return {"user": current_user.get_id()}
+
+
+def report_cache_key() -> str:
+    """Build the cache key for the current request."""
+    parts = {
+        "endpoint": request.endpoint,
+        "view_args": request.view_args,
+        "args": _normalized_args(),
+        "scope": _access_scope(),
+        # Default date ranges depend on today's date
+        "today": date.today().isoformat(),
+        "version": report_cache.data_version(),
+    }
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _viewer_values() -> dict:
+    return {
+        _CSRF_PLACEHOLDER: generate_csrf().encode(),
+        _NICKNAME_PLACEHOLDER: str(escape(current_user.nickname)).encode(),
+    }
+
+
+def _substitute(body: bytes, values: dict) -> bytes:
+    for placeholder, value in values.items():
+        body = body.replace(placeholder, value)
+    return body
+
+
+def _substitute_chunks(chunks, values: dict):
+    """Substitute placeholders in a streamed body, even across chunk borders."""
+    keep = max(len(p) for p in values) - 1
+    pending = b""
+    for chunk in chunks:
+        pending = _substitute(pending + chunk, values)
+        if len(pending) > keep:
+            yield pending[:-keep]
+            pending = pending[-keep:]
+    if pending:
+        yield pending
+
+
+def _personalize(response):
+    """Put the current viewer's values into a page rendered with placeholders."""
+    if response.mimetype != "text/html":
+        return response
+    values = _viewer_values()
+    if response.is_streamed:
+        response.response = _substitute_chunks(response.iter_encoded(), values)
+    else:
+        response.set_data(_substitute(response.get_data(), values))
+    return response
+
+
+@app.context_processor
+def _report_cache_placeholders():
+    if not g.get("report_cache_fill"):
+        return {}
+    return {
+        "csrf_token": _CSRF_PLACEHOLDER.decode,
+        "viewer_nickname": _NICKNAME_PLACEHOLDER.decode(),
+    }
+
+
+def _response_from_entry(entry: dict):
+    response = make_response(entry["body"])
+    response.mimetype = entry["mimetype"]
+    for name, value in entry["headers"].items():
+        response.headers[name] = value
+    response.headers["X-Report-Cache"] = "HIT"
+    return response
+
+
+def _has_flashes() -> bool:
+    """True when messages are pending or were already rendered into this page."""
+    return bool(session.get("_flashes") or request_ctx.flashes)
+
+
+def _headers_to_replay(response) -> dict:
+    return {
+        name: response.headers[name]
+        for name in _REPLAYED_HEADERS
+        if name in response.headers
+    }
+
+
+def _tee_to_cache(chunks, key: str, mimetype: str, headers: dict, release, request_g):
+    """Yield a streamed body to the client while collecting it for the cache.
+
+    The copy is spooled to a temporary file once it outgrows
+    ``_SPOOL_MEMORY_SIZE``, so a large export is never held in memory, and is
+    stored once the whole body has been sent; ``release`` frees the per-key
+    lock afterwards, so concurrent misses keep waiting on the worker that is
+    still streaming instead of rendering the report again. ``request_g`` is
+    the request's ``g``, which is not bound while the body is sent.
+    """
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MEMORY_SIZE) as body:
+            for chunk in chunks:
+                body.write(chunk)
+                yield chunk
+            # A page cut short by its query budget is not worth keeping
+            if not request_g.get("query_interrupted"):
+                report_cache.set_from_file(key, body, mimetype, headers)
+    finally:
+        release()
+
+
+def cached_report(f):
+    """Serve a GET report from the shared cache, computing it at most once."""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Pending flash messages are rendered into the page, so skip caching
+        if (
+            not app.config["REPORT_CACHE_ENABLED"]
+            or request.method != "GET"
+            or _has_flashes()
+        ):
+            return f(*args, **kwargs)
+
+        key = report_cache_key()
+        entry = report_cache.get(key)
+        if entry is not None:
+            return _personalize(_response_from_entry(entry))
+
+        with ExitStack() as stack:
+            stack.enter_context(
+                report_cache.lock(key, app.config["REPORT_CACHE_LOCK_TIMEOUT"])
+            )
+            # Another worker may have filled the entry while we waited
+            entry = report_cache.get(key)
+            if entry is not None:
+                return _personalize(_response_from_entry(entry))
+
+            # Render per-viewer values as placeholders so the entry can be shared
+            g.report_cache_fill = True
+            try:
+                response = make_response(f(*args, **kwargs))
+            finally:
+                g.pop("report_cache_fill", None)
+            response.headers["X-Report-Cache"] = "MISS"
+            if response.status_code != 200 or _has_flashes():
+                return _personalize(response)
+            if response.is_streamed and not response.direct_passthrough:
+                # Keep the lock until the last chunk has been sent; closing
+                # the response also releases it if the body is never iterated
+                release = stack.pop_all().close
+                response.response = _tee_to_cache(
+                    response.iter_encoded(),
+                    key,
+                    response.mimetype,
+                    _headers_to_replay(response),
+                    release,
+                    g._get_current_object(),
+                )
+                response.call_on_close(release)
+                return _personalize(response)
+            # send_file responses stream a file wrapper; buffer it once
+            response.direct_passthrough = False
+            report_cache.set(
+                key,
+                response.get_data(),
+                response.mimetype,
+                _headers_to_replay(response),
+            )
+            return _personalize(response)
+
+    return decorated_function
+
+
+def document_etag(state) -> str:
+    """Strong ETag for a document page rendered from ``state`` for this viewer."""
+    parts = {
+        "endpoint": request.endpoint,
+        "view_args": request.view_args,
+        "state": state,
+        "user": current_user.get_id(),
+        "csrf": hashlib.sha1(str(session.get("csrf_token", "")).encode()).hexdigest(),
+    }
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _set_document_headers(response, etag: str):
+    response.set_etag(etag)
+    # Browsers keep the page but must revalidate it on every view
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def cached_document(state):
+    """Serve a posted document page from its ETag and the shared cache.
+
+    ``state`` is called with the view's arguments and returns the document's
+    mutable fields (plus anything else the page depends on), or None when the
+    page must be rendered as usual, e.g. a missing document or no access.
+    A matching ``If-None-Match`` answers 304 without rendering anything.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != "GET" or _has_flashes():
+                return f(*args, **kwargs)
+            current = state(*args, **kwargs)
+            if current is None:
+                return f(*args, **kwargs)
+
+            etag = document_etag(current)
+            if request.if_none_match.contains(etag):
+                return _set_document_headers(Response(status=304), etag)
+
+            use_cache = app.config["REPORT_CACHE_ENABLED"]
+            key = f"document-{etag}"
+            entry = report_cache.get(key) if use_cache else None
+            if entry is not None:
+                return _set_document_headers(_response_from_entry(entry), etag)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or _has_flashes():
+                return response
+            if use_cache:
+                report_cache.set(
+                    key,
+                    response.get_data(),
+                    response.mimetype,
+                    _headers_to_replay(response),
+                )
+                response.headers["X-Report-Cache"] = "MISS"
+            return _set_document_headers(response, etag)
+
+        return decorated_function
+
+    return decorator
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_data_changed(session, flush_context):
+    session.info["report_cache_dirty"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_changed(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["report_cache_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    if (
+        session.info.pop("report_cache_dirty", False)
+        and app.config["REPORT_CACHE_ENABLED"]
+    ):
+        report_cache.bump_data_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session):
+    session.info.pop("report_cache_dirty", None)
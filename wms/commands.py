@@ -1,5 +1,6 @@
 from wms import app, db
 from wms.settings import sync_initial_reference_data
+from wms.writer import serve
 from wms.models import (
     Receipt,
     User,
@@ -109,3 +110,13 @@ def resetpwd():
     click.echo(f"Successfully reset password for user {user.username} (id=1)")
     click.echo(f"New password: {new_password}")
     click.echo("Note: This password is only shown once. Please change it after login.")
+
+
+@app.cli.command("posting-writer")
+def posting_writer():
+    """Run the single-writer posting process on POSTING_WRITER_SOCKET."""
+    address = app.config["POSTING_WRITER_SOCKET"]
+    if not address:
+        raise click.UsageError("POSTING_WRITER_SOCKET is not set.")
+    click.echo(f"Posting writer listening on {address}")
+    serve(address)
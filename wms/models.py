@@ -1,13 +1,17 @@
 from wms import db
 from flask_login import UserMixin
-from sqlalchemy import ForeignKey, Enum
-from sqlalchemy.types import String, Numeric
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import ForeignKey, Enum, Index, event, inspect, select, update
+from sqlalchemy.types import String
+from sqlalchemy.orm import Mapped, mapped_column, object_session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from werkzeug.security import generate_password_hash, check_password_hash
 from typing import List
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 import enum
+from wms.money import MICROS, Money, divide_units, from_units, to_units, units
 
 
 class User(db.Model, UserMixin):
@@ -113,12 +117,21 @@ class WarehouseItemSKU(db.Model):
     itemSKU_id: Mapped[int] = mapped_column(ForeignKey("item_sku.id"), primary_key=True)
     # Current inventory status
     count: Mapped[int] = mapped_column(db.Integer, default=0, nullable=False)
-    average_price: Mapped[float] = mapped_column(default=0, nullable=False)
+    # Stored in micro-units so repeated averaging stays exact
+    average_price: Mapped[Decimal] = mapped_column(
+        Money(MICROS), default=0, nullable=False
+    )
     # Relationships
     warehouse: Mapped[Warehouse] = relationship("Warehouse", back_populates="item_skus")
     itemSKU: Mapped[ItemSKU] = relationship("ItemSKU", back_populates="warehouses")
 
 
+class ReceiptType(enum.Enum):
+    STOCKIN = 0  # Incoming stock
+    STOCKOUT = 1  # Outgoing stock
+    TAKESTOCK = 2  # Stock taking/adjustment
+
+
 class Transaction(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     # Link to the SKU being transacted
@@ -126,16 +139,41 @@ class Transaction(db.Model):
     itemSKU: Mapped[ItemSKU] = relationship(back_populates="transactions")
     # Transaction details
     count: Mapped[int]
-    price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    price: Mapped[Decimal] = mapped_column(Money(), nullable=False)
     # Link to the receipt this transaction belongs to
     receipt_id: Mapped[int] = mapped_column(ForeignKey("receipt.id"), nullable=False)
     receipt: Mapped["Receipt"] = relationship(back_populates="transactions")
+    # Copies of the receipt's RECEIPT_LEDGER_COLUMNS, kept in sync on posting
+    # and revoke so report queries can filter without joining receipt
+    date: Mapped[datetime] = mapped_column(nullable=False)
+    type: Mapped[ReceiptType] = mapped_column(Enum(ReceiptType), nullable=False)
+    revoked: Mapped[bool] = mapped_column(default=False, nullable=False)
+    warehouse_id: Mapped[int] = mapped_column(nullable=False)
+    area_id: Mapped[int] = mapped_column(nullable=True)
+    department_id: Mapped[int] = mapped_column(nullable=True)
+    is_tool: Mapped[bool] = mapped_column(default=False, nullable=False)
 
-
-class ReceiptType(enum.Enum):
-    STOCKIN = 0  # Incoming stock
-    STOCKOUT = 1  # Outgoing stock
-    TAKESTOCK = 2  # Stock taking/adjustment
+    __table_args__ = (
+        # Covers the statistics queries: filters lead, then the group-by keys
+        # and the summed values, so SQLite never reads the table itself
+        Index(
+            "ix_transaction_ledger_report",
+            "type",
+            "revoked",
+            "date",
+            "is_tool",
+            "warehouse_id",
+            "area_id",
+            "department_id",
+            "itemSKU_id",
+            "count",
+            "price",
+        ),
+        # Newest-first record listings, overall and per warehouse
+        Index("ix_transaction_date", "date", "id"),
+        Index("ix_transaction_warehouse_date", "warehouse_id", "date", "id"),
+        Index("ix_transaction_receipt_id", "receipt_id"),
+    )
 
 
 class Receipt(db.Model):
@@ -170,17 +208,23 @@ class Receipt(db.Model):
     note: Mapped[str] = mapped_column(String(100), nullable=True)
     # Whether this receipt involves tool items
     is_tool: Mapped[bool] = mapped_column(default=False, nullable=False)
+    # Totals over the receipt's transactions, maintained as lines are posted
+    total_value: Mapped[Decimal] = mapped_column(Money(), default=0, nullable=False)
+    line_count: Mapped[int] = mapped_column(default=0, nullable=False)
 
-    @property
+    @hybrid_property
     def sum(self) -> Decimal:
-        # Calculate total value of the receipt using Decimal arithmetic
-        return sum(
-            Decimal(str(transaction.count)) * transaction.price
-            for transaction in self.transactions
-        )
+        # Total value of the receipt without loading its transactions
+        return self.total_value
+
+    @sum.inplace.expression
+    @classmethod
+    def _sum_expression(cls):
+        return cls.total_value
 
-    def update_warehouse_item_skus(self):
-        # Update warehouse inventory after a receipt is processed
+    def update_warehouse_item_skus(self, commit: bool = True):
+        # Update warehouse inventory after a receipt is processed; posting jobs
+        # pass commit=False and leave the commit to the batch (wms/writer.py)
         for transaction in self.transactions:
             # Attempt to lock the warehouse_item_sku row to prevent concurrent updates
             warehouse_item_sku = (
@@ -196,26 +240,22 @@ class Receipt(db.Model):
             warehouse_obj = db.session.get(Warehouse, self.warehouse_id)
             if warehouse_item_sku:
                 if self.type == ReceiptType.STOCKIN:
+                    # Weighted average in integer micro-units
+                    price = to_units(transaction.price, MICROS)
+                    average = to_units(warehouse_item_sku.average_price, MICROS)
                     # Initialize average price if it's not set
-                    if warehouse_item_sku.average_price is None or Decimal(
-                        str(warehouse_item_sku.average_price)
-                    ) == Decimal("0.00"):
-                        warehouse_item_sku.average_price = float(transaction.price)
-                    # Update average price and count for stock in using Decimal
+                    if not average:
+                        average = price
                     total_count = warehouse_item_sku.count + transaction.count
                     if total_count != 0:
-                        dec_total_count = Decimal(str(total_count))
-                        dec_wh_count = Decimal(str(warehouse_item_sku.count))
-                        dec_trans_count = Decimal(str(transaction.count))
-                        dec_wh_price = Decimal(str(warehouse_item_sku.average_price))
-                        dec_result = (
-                            dec_wh_count * dec_wh_price
-                            + dec_trans_count * transaction.price
-                        ) / dec_total_count
-                        # store as float for compatibility
-                        warehouse_item_sku.average_price = float(dec_result)
+                        average = divide_units(
+                            warehouse_item_sku.count * average
+                            + transaction.count * price,
+                            total_count,
+                        )
                     else:
-                        warehouse_item_sku.average_price = 0
+                        average = 0
+                    warehouse_item_sku.average_price = from_units(average, MICROS)
                     warehouse_item_sku.count = total_count
                 elif (
                     self.type == ReceiptType.STOCKOUT
@@ -260,10 +300,155 @@ class Receipt(db.Model):
                     warehouse_id=self.warehouse_id,
                     itemSKU_id=transaction.itemSKU_id,
                     count=transaction.count,
-                    average_price=float(transaction.price),
+                    average_price=transaction.price,
                 )
                 db.session.add(warehouse_item_sku)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+
+
+# Receipt attributes copied onto each of its transactions
+RECEIPT_LEDGER_COLUMNS = (
+    "date",
+    "type",
+    "revoked",
+    "warehouse_id",
+    "area_id",
+    "department_id",
+    "is_tool",
+)
+
+
+def _receipt_ledger(connection, transaction) -> dict:
+    """Return the ledger values of the receipt a transaction is posted to."""
+    receipt = transaction.__dict__.get("receipt")
+    if receipt is None:
+        session = object_session(transaction)
+        key = inspect(Receipt).identity_key_from_primary_key((transaction.receipt_id,))
+        receipt = session.identity_map.get(key) if session is not None else None
+    if receipt is not None:
+        loaded = inspect(receipt).dict
+        if all(name in loaded for name in RECEIPT_LEDGER_COLUMNS):
+            return {name: loaded[name] for name in RECEIPT_LEDGER_COLUMNS}
+    # Not in memory (or expired): read it on the flush connection
+    table = Receipt.__table__
+    row = connection.execute(
+        select(*(table.c[name] for name in RECEIPT_LEDGER_COLUMNS)).where(
+            table.c.id == transaction.receipt_id
+        )
+    ).one()
+    return dict(row._mapping)
+
+
+@event.listens_for(Transaction, "before_insert")
+def _copy_receipt_ledger(mapper, connection, target):
+    for name, value in _receipt_ledger(connection, target).items():
+        setattr(target, name, value)
+
+
+@event.listens_for(Receipt, "after_update")
+def _propagate_receipt_ledger(mapper, connection, target):
+    # Revoking (or re-dating) a receipt updates the copies on its transactions
+    state = inspect(target)
+    changed = {
+        name: getattr(target, name)
+        for name in RECEIPT_LEDGER_COLUMNS
+        if state.attrs[name].history.has_changes()
+    }
+    if changed:
+        connection.execute(
+            update(Transaction.__table__)
+            .where(Transaction.__table__.c.receipt_id == target.id)
+            .values(**changed)
+        )
+        for transaction in target.__dict__.get("transactions", []):
+            for name, value in changed.items():
+                set_committed_value(transaction, name, value)
+
+
+def _line_value(count, price) -> int:
+    # Line value in cents
+    return (count or 0) * to_units(price)
+
+
+def _add_to_receipt_totals(connection, transaction, receipt_id, value, lines):
+    """Add ``value`` cents and ``lines`` to a receipt's stored totals.
+
+    The in-memory receipt, if loaded, is updated too so ``Receipt.sum`` is
+    current right after the flush.
+    """
+    if not value and not lines:
+        return
+    table = Receipt.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.id == receipt_id)
+        .values(
+            total_value=units(table.c.total_value) + value,
+            line_count=table.c.line_count + lines,
+        )
+    )
+    session = object_session(transaction)
+    if session is None:
+        return
+    key = inspect(Receipt).identity_key_from_primary_key((receipt_id,))
+    receipt = session.identity_map.get(key)
+    if receipt is not None:
+        loaded = inspect(receipt).dict
+        if "total_value" in loaded and "line_count" in loaded:
+            set_committed_value(
+                receipt,
+                "total_value",
+                Decimal(str(loaded["total_value"])) + from_units(value),
+            )
+            set_committed_value(receipt, "line_count", loaded["line_count"] + lines)
+
+
+@event.listens_for(Transaction, "after_insert")
+def _count_posted_line(mapper, connection, target):
+    _add_to_receipt_totals(
+        connection,
+        target,
+        target.receipt_id,
+        _line_value(target.count, target.price),
+        1,
+    )
+
+
+@event.listens_for(Transaction, "after_update")
+def _recount_changed_line(mapper, connection, target):
+    state = inspect(target)
+    changes = {
+        name: state.attrs[name].history for name in ("count", "price", "receipt_id")
+    }
+    if not any(history.has_changes() for history in changes.values()):
+        return
+
+    def before(name):
+        history = changes[name]
+        return history.deleted[0] if history.deleted else getattr(target, name)
+
+    old_value = _line_value(before("count"), before("price"))
+    new_value = _line_value(target.count, target.price)
+    old_receipt_id = before("receipt_id")
+    if old_receipt_id == target.receipt_id:
+        _add_to_receipt_totals(
+            connection, target, target.receipt_id, new_value - old_value, 0
+        )
+    else:
+        _add_to_receipt_totals(connection, target, old_receipt_id, -old_value, -1)
+        _add_to_receipt_totals(connection, target, target.receipt_id, new_value, 1)
+
+
+@event.listens_for(Transaction, "after_delete")
+def _uncount_deleted_line(mapper, connection, target):
+    _add_to_receipt_totals(
+        connection,
+        target,
+        target.receipt_id,
+        -_line_value(target.count, target.price),
+        -1,
+    )
 
 
 class Area(db.Model):
@@ -286,7 +471,9 @@ class Employee(db.Model):
     name: Mapped[str] = mapped_column(String(30), nullable=False)
     is_resigned: Mapped[bool] = mapped_column(default=False, nullable=False)
     # Associated 班组 user account
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id"), nullable=True, index=True
+    )
     user: Mapped["User"] = relationship("User", back_populates="employees")
     # Tool holdings and records
     tool_holdings: Mapped[List["EmployeeToolHolding"]] = relationship(
@@ -324,6 +511,24 @@ class EmployeeToolHolding(db.Model):
     employee: Mapped["Employee"] = relationship(back_populates="tool_holdings")
     itemSKU: Mapped["ItemSKU"] = relationship("ItemSKU")
 
+    @classmethod
+    def add_counts(cls, counts: dict[tuple[int, int], int]):
+        """Add ``{(employee_id, sku_id): qty}`` to holdings in one statement."""
+        if not counts:
+            return
+        stmt = sqlite_insert(cls).values(
+            [
+                {"employee_id": employee_id, "itemSKU_id": sku_id, "count": qty}
+                for (employee_id, sku_id), qty in counts.items()
+            ]
+        )
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["employee_id", "itemSKU_id"],
+                set_={"count": cls.count + stmt.excluded.count},
+            )
+        )
+
 
 class ToolReceiptType(enum.Enum):
     REQUISITION = 0  # 领用
@@ -335,6 +540,9 @@ class ToolReceiptType(enum.Enum):
 class ToolReceipt(db.Model):
     """A batch tool operation (requisition / exchange / return / scrap)."""
 
+    # Latest tool movement per employee for the roster
+    __table_args__ = (Index("ix_tool_receipt_employee_date", "employee_id", "date"),)
+
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     type: Mapped[ToolReceiptType] = mapped_column(Enum(ToolReceiptType), nullable=False)
     # Employee who is receiving / returning the tools (null for scrap)
@@ -365,6 +573,17 @@ class ToolReceipt(db.Model):
 class ToolTransaction(db.Model):
     """One line in a ToolReceipt: which SKU and how many."""
 
+    # Covers the per-employee, per-SKU grouping of the tool report
+    __table_args__ = (
+        Index(
+            "ix_tool_transaction_employee_sku",
+            "employee_id",
+            "itemSKU_id",
+            "tool_receipt_id",
+            "count",
+        ),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     tool_receipt_id: Mapped[int] = mapped_column(
         ForeignKey("tool_receipt.id"), nullable=False
@@ -376,3 +595,50 @@ class ToolTransaction(db.Model):
     # Employee who is receiving / returning the tools (null for scrap)
     employee_id: Mapped[int] = mapped_column(ForeignKey("employee.id"), nullable=True)
     employee: Mapped["Employee"] = relationship(back_populates="tool_transactions")
+
+
+class ToolExchangeRollup(db.Model):
+    """Daily exchange totals per employee and tool SKU.
+
+    Maintained as exchanges are posted, so the exchange analytics read one row
+    per employee, SKU and day instead of scanning ToolTransaction.
+    """
+
+    employee_id: Mapped[int] = mapped_column(
+        ForeignKey("employee.id"), primary_key=True
+    )
+    itemSKU_id: Mapped[int] = mapped_column(ForeignKey("item_sku.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    # Pieces exchanged and the number of exchange receipts they came from
+    pieces: Mapped[int] = mapped_column(default=0, nullable=False)
+    exchanges: Mapped[int] = mapped_column(default=0, nullable=False)
+
+    __table_args__ = (Index("ix_tool_exchange_rollup_day", "day"),)
+
+    @classmethod
+    def record(cls, employee_id: int, day: date, quantities: dict[int, int]):
+        """Add one exchange receipt's pieces per SKU to the rollup."""
+        if not quantities:
+            return
+        # Upsert so concurrent exchanges on the same day cannot collide
+        stmt = sqlite_insert(cls).values(
+            [
+                {
+                    "employee_id": employee_id,
+                    "itemSKU_id": sku_id,
+                    "day": day,
+                    "pieces": pieces,
+                    "exchanges": 1,
+                }
+                for sku_id, pieces in quantities.items()
+            ]
+        )
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["employee_id", "itemSKU_id", "day"],
+                set_={
+                    "pieces": cls.pieces + stmt.excluded.pieces,
+                    "exchanges": cls.exchanges + stmt.excluded.exchanges,
+                },
+            )
+        )
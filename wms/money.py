@@ -0,0 +1,65 @@
+"""Fixed-point money columns.
+
+Prices and values are stored as integers counting minor units: line prices and
+receipt totals in cents, average prices in micro-units so repeated averaging
+does not drift. The ``Money`` column type converts at the ORM boundary, so
+models, forms and templates keep working with ``Decimal`` while SQLite stores,
+sums and multiplies plain integers.
+
+SQL aggregates should wrap money columns in ``units()`` to make the integer
+arithmetic explicit and convert the result back with ``from_units()``.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from sqlalchemy import Integer, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+# Minor units per column kind
+CENTS = 2
+MICROS = 6
+
+
+def to_units(value, scale: int = CENTS) -> int:
+    """Round a decimal amount half-up to an integer number of minor units."""
+    return int(
+        Decimal(str(value or 0)).scaleb(scale).quantize(Decimal(1), ROUND_HALF_UP)
+    )
+
+
+def from_units(units, scale: int = CENTS) -> Decimal:
+    """Turn an integer number of minor units back into a ``Decimal`` amount."""
+    return Decimal(int(units or 0)).scaleb(-scale)
+
+
+def divide_units(numerator: int, denominator: int) -> int:
+    """Integer division rounded half away from zero."""
+    quotient, remainder = divmod(abs(numerator), abs(denominator))
+    if 2 * remainder >= abs(denominator):
+        quotient += 1
+    return quotient if (numerator < 0) == (denominator < 0) else -quotient
+
+
+class Money(TypeDecorator):
+    """A ``Decimal`` amount stored as an integer count of ``10**-scale`` units."""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, scale: int = CENTS):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_units(value, self.scale)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_units(value, self.scale)
+
+
+def units(column):
+    """Expose a ``Money`` column as its raw integer units in a SQL expression."""
+    return type_coerce(column, Integer)
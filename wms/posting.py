@@ -0,0 +1,174 @@
+"""Write serialization for posting requests.
+
+SQLite allows one writer at a time. pysqlite starts a transaction lazily, right
+before the first INSERT/UPDATE/DELETE, so a posting request used to do all its
+reads and validation without a lock and then fail with "database is locked"
+when it tried to upgrade. ``posting()`` instead opens the transaction with
+``BEGIN IMMEDIATE``: the write lock is taken up front, reads inside the block
+see the state the writes will be applied to, and a busy database is retried
+with jittered exponential backoff before any work has been done.
+
+Lock-wait time is recorded per process in ``posting_metrics``, sent to the
+browser as a ``Server-Timing`` header and logged when it exceeds
+``POSTING_LOCK_WAIT_WARN`` seconds.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import random
+import threading
+import time
+
+from flask import flash, make_response, redirect, request, url_for
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from wms import app, db
+
+# Set while a posting block is active; transactions begun then are IMMEDIATE
+_begin_immediate: ContextVar[bool] = ContextVar("begin_immediate", default=False)
+
+
+class PostingBusyError(RuntimeError):
+    """The write lock could not be acquired within the retry budget."""
+
+
+class LockWaitMetrics:
+    """Per-process lock-wait statistics for posting transactions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._acquired = 0
+            self._retries = 0
+            self._failures = 0
+            self._total_wait = 0.0
+            self._max_wait = 0.0
+
+    def record(self, wait: float, retries: int, failed: bool = False) -> None:
+        with self._lock:
+            if failed:
+                self._failures += 1
+            else:
+                self._acquired += 1
+            self._retries += retries
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self._acquired + self._failures
+            return {
+                "acquired": self._acquired,
+                "retries": self._retries,
+                "failures": self._failures,
+                "total_wait": self._total_wait,
+                "max_wait": self._max_wait,
+                "mean_wait": self._total_wait / attempts if attempts else 0.0,
+            }
+
+
+posting_metrics = LockWaitMetrics()
+
+
+@event.listens_for(Engine, "begin")
+def _begin_sqlite_transaction(conn):
+    # pysqlite would emit a deferred BEGIN before the first write; an explicit
+    # BEGIN IMMEDIATE takes the write lock now and pysqlite then skips its own
+    if _begin_immediate.get() and conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _is_busy(exc: OperationalError) -> bool:
+    message = str(exc.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def _acquire_write_lock(session) -> float:
+    """Begin the session's transaction with BEGIN IMMEDIATE, retrying on busy."""
+    retries = app.config["POSTING_LOCK_RETRIES"]
+    backoff = app.config["POSTING_LOCK_BACKOFF"]
+    start = time.perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            connection = session.connection()
+            # Earlier reads (e.g. loading the user) ran outside a SQLite
+            # transaction, so the session may hold a connection that still
+            # needs its BEGIN
+            if (
+                connection.dialect.name == "sqlite"
+                and not connection.connection.dbapi_connection.in_transaction
+            ):
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+        except OperationalError as exc:
+            session.rollback()
+            if not _is_busy(exc):
+                raise
+            if attempt == retries:
+                posting_metrics.record(time.perf_counter() - start, attempt, True)
+                raise PostingBusyError("database is locked") from exc
+            # Full jitter keeps waiting writers from retrying in lockstep
+            time.sleep(random.uniform(0, backoff * 2**attempt))
+            continue
+        wait = time.perf_counter() - start
+        posting_metrics.record(wait, attempt)
+        if wait > app.config["POSTING_LOCK_WAIT_WARN"]:
+            app.logger.warning(
+                "Posting waited %.3fs for the write lock (%d retries)", wait, attempt
+            )
+        return wait
+
+
+@contextmanager
+def posting():
+    """Run a block of reads and writes in one BEGIN IMMEDIATE transaction.
+
+    Yields the seconds spent waiting for the write lock. Transactions begun
+    inside the block after a commit are IMMEDIATE too. Anything left
+    uncommitted when the block ends is rolled back so the lock is released
+    before the response is sent. Nested blocks join the outer one.
+    """
+    if _begin_immediate.get():
+        yield 0.0
+        return
+    session = db.session()
+    token = _begin_immediate.set(True)
+    try:
+        yield _acquire_write_lock(session)
+    except BaseException:
+        session.rollback()
+        raise
+    else:
+        if session.in_transaction():
+            session.rollback()
+    finally:
+        _begin_immediate.reset(token)
+
+
+def add_lock_wait_timing(response, wait: float):
+    """Report the seconds a posting waited for the write lock to the browser."""
+    response.headers.add("Server-Timing", f"lockwait;dur={wait * 1000:.1f}")
+    return response
+
+
+def posting_view(view):
+    """Serialize the POST requests of a view with ``posting()``."""
+
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        if request.method != "POST":
+            return view(*args, **kwargs)
+        try:
+            with posting() as wait:
+                response = make_response(view(*args, **kwargs))
+        except PostingBusyError:
+            flash("系统繁忙，请稍后重试。", "danger")
+            # Back to the form; the submission was not applied
+            return redirect(request.referrer or url_for("index"))
+        return add_lock_wait_timing(response, wait)
+
+    return decorated
@@ -0,0 +1,118 @@
+"""Read-only engine for report and export endpoints.
+
+Reports and exports run long SELECTs over the whole ledger. On the primary
+engine they compete with posting requests for pooled connections and, in
+rollback-journal mode, block writers while they read. Views decorated with
+``read_only_view`` send their SELECTs to a second engine instead: its own
+pool, ``PRAGMA query_only`` so a report can never take the write lock, and a
+larger page cache sized by ``READ_ENGINE_CACHE_KIB``.
+
+The database runs in WAL mode so readers and the writer do not block each
+other. Each request on the read engine reads inside one explicit ``BEGIN``,
+so all queries of a report see the same snapshot even while stock-outs are
+being committed.
+
+An in-memory database (the test suite) cannot be opened twice, so there
+reads stay on the primary engine.
+"""
+
+from functools import wraps
+import threading
+
+from flask import g, has_app_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from wms import app, db
+
+_lock = threading.Lock()
+_engines: dict = {}
+
+
+def _is_file_database(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def _use_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
+def create_read_engine(url):
+    """Create a query-only engine for ``url`` with its own connection pool."""
+    engine = create_engine(
+        url,
+        pool_size=app.config["READ_ENGINE_POOL_SIZE"],
+        max_overflow=app.config["READ_ENGINE_MAX_OVERFLOW"],
+        pool_timeout=app.config["SQLALCHEMY_POOL_TIMEOUT"],
+        pool_recycle=app.config["SQLALCHEMY_POOL_RECYCLE"],
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = ON")
+        # A negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size = -{app.config['READ_ENGINE_CACHE_KIB']}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin_snapshot(conn):
+        # pysqlite never begins a transaction for SELECTs, so every statement
+        # would read its own snapshot; BEGIN pins one for the whole request
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def read_engine():
+    """Return the shared read-only engine, or ``None`` for in-memory databases."""
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if not _is_file_database(url):
+        return None
+    key = str(url)
+    with _lock:
+        if key not in _engines:
+            _engines[key] = create_read_engine(url)
+        return _engines[key]
+
+
+def dispose_read_engines() -> None:
+    """Close pooled read connections, e.g. in a freshly forked worker."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose(close=False)
+        _engines.clear()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _route_reads(orm_execute_state):
+    # Kept on g rather than a context variable so the queries of a streamed
+    # page, which run after the view has returned, are routed as well
+    if not (orm_execute_state.is_select and has_app_context()):
+        return
+    if g.get("read_only_reads") and "bind" not in orm_execute_state.bind_arguments:
+        engine = read_engine()
+        if engine is not None:
+            orm_execute_state.bind_arguments["bind"] = engine
+
+
+def read_only_view(view):
+    """Send the SELECTs of a report or export view to the read-only engine."""
+
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        g.read_only_reads = True
+        return view(*args, **kwargs)
+
+    return decorated
+
+
+with app.app_context():
+    if _is_file_database(db.engine.url):
+        event.listen(db.engine, "connect", _use_wal)
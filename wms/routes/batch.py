@@ -23,6 +23,8 @@ from wms.models import (
 )
 from wms.forms import BatchStockInForm, BatchTakeStockForm
 from wms.utils import admin_required, set_item_tool_status
+from wms.posting import PostingBusyError, add_lock_wait_timing, posting
+from wms.admission import heavy_request
 import pandas as pd
 from datetime import datetime
 from io import BytesIO
@@ -35,9 +37,41 @@ def _tool_inventory_owner_id(warehouse: Warehouse) -> int | None:
     return warehouse.owner_id
 
 
+def _stockin_rows(df: pd.DataFrame) -> list[tuple[str, str, str, int, Decimal]]:
+    """Parse a batch stock-in sheet into (item, brand, spec, quantity, price)."""
+    rows = []
+    for _, row in df.iterrows():
+        item_name = str(row["物品"]).strip()
+        brand = str(row["品牌"]).strip()
+        spec = str(row["规格"]).strip()
+        quantity = int(row["数量"]) if not pd.isna(row["数量"]) else 0
+        price = Decimal(row["单价"]) if not pd.isna(row["单价"]) else Decimal(0)
+
+        if not item_name or not brand or not spec or item_name == "样例-LED长方形灯":
+            continue  # Skip incomplete rows
+        rows.append((item_name, brand, spec, quantity, price))
+    return rows
+
+
+def _takestock_rows(df: pd.DataFrame) -> list[tuple[str, str, str, int]]:
+    """Parse a batch take-stock sheet into (item, brand, spec, actual count)."""
+    rows = []
+    for _, row in df.iterrows():
+        item_name = str(row["物品"]).strip()
+        brand = str(row["品牌"]).strip()
+        spec = str(row["规格"]).strip()
+        actual_count = int(row["实际库存"]) if not pd.isna(row["实际库存"]) else 0
+
+        if not item_name or not brand or not spec:
+            continue  # Skip incomplete rows  # pragma: no cover
+        rows.append((item_name, brand, spec, actual_count))
+    return rows
+
+
 @app.route("/batch_stockin", methods=["GET", "POST"])
 @login_required
 @admin_required
+@heavy_request
 def batch_stockin():
     """Batch stockin page"""
     form = BatchStockInForm()
@@ -86,105 +120,100 @@ def batch_stockin():
                     flash(f"文件缺少必要的列: {col}", "error")
                     return redirect(url_for("batch_stockin"))
 
-            # Generate refcode for this batch operation
-            refcode = f"IM-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-
-            # Create the receipt for this batch operation
-            receipt = Receipt(
-                operator=current_user,
-                refcode=refcode,
-                warehouse_id=warehouse.id,
-                type=ReceiptType.STOCKIN,
-            )
-            db.session.add(receipt)
-            db.session.flush()  # Flush to get receipt ID
-
-            # Process each row
-            processed_count = 0
-            tools_promoted_item_ids = set()
-            for _, row in df.iterrows():
-                item_name = str(row["物品"]).strip()
-                brand = str(row["品牌"]).strip()
-                spec = str(row["规格"]).strip()
-                quantity = int(row["数量"]) if not pd.isna(row["数量"]) else 0
-                price = Decimal(row["单价"]) if not pd.isna(row["单价"]) else Decimal(0)
-
-                if (
-                    not item_name
-                    or not brand
-                    or not spec
-                    or item_name == "样例-LED长方形灯"
-                ):
-                    continue  # Skip incomplete rows
-
-                # Find or create item
-                item = db.session.execute(
-                    db.select(Item).filter_by(name=item_name)
-                ).scalar_one_or_none()
-
-                if not item:
-                    item = Item(name=item_name, is_tool=tools_only)
-                    db.session.add(item)
-                    db.session.flush()  # To get the item ID
-                elif tools_only and not item.is_tool:
-                    if item.id not in tools_promoted_item_ids:
-                        set_item_tool_status(item, True)
-                        tools_promoted_item_ids.add(item.id)
-
-                # Find or create item SKU
-                item_sku = db.session.execute(
-                    db.select(ItemSKU).filter_by(
-                        item_id=item.id, brand=brand, spec=spec
-                    )
-                ).scalar_one_or_none()
-
-                if not item_sku:
-                    item_sku = ItemSKU(item_id=item.id, brand=brand, spec=spec)
-                    db.session.add(item_sku)
-                    db.session.flush()  # To get the SKU ID
-
-                # Create transaction even if quantity=0
-                transaction = Transaction(
-                    itemSKU_id=item_sku.id,
-                    count=quantity,
-                    price=price,
-                    receipt_id=receipt.id,
+            # Parse the whole sheet before taking the write lock
+            rows = _stockin_rows(df)
+        except Exception as e:
+            flash(f"处理文件时出错: {str(e)}", "error")
+            current_app.logger.error(f"Batch stockin error: {e}")
+            return redirect(url_for("batch_stockin"))
+
+        try:
+            with posting() as wait:
+                # Generate refcode for this batch operation
+                refcode = f"IM-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+                # Create the receipt for this batch operation
+                receipt = Receipt(
+                    operator=current_user,
+                    refcode=refcode,
+                    warehouse_id=warehouse.id,
+                    type=ReceiptType.STOCKIN,
                 )
-                db.session.add(transaction)
-                processed_count += 1
+                db.session.add(receipt)
+                db.session.flush()  # Flush to get receipt ID
 
-            # Commit transactions
-            try:
-                db.session.commit()
-                # Update warehouse inventory
-                receipt.update_warehouse_item_skus()
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                flash(f"处理库存更新时出错: {e}", "error")
-                current_app.logger.error(f"Batch stockin update error: {e}")
-                return redirect(url_for("batch_stockin"))
-
-            # Sync tool inventory for tool items
-            tool_owner_id = _tool_inventory_owner_id(warehouse)
-            for transaction in receipt.transactions:
-                sku = db.session.get(ItemSKU, transaction.itemSKU_id)
-                if sku and sku.item.is_tool and tool_owner_id is not None:
-                    ti = ToolInventory.query.filter_by(
-                        user_id=tool_owner_id, itemSKU_id=sku.id
-                    ).first()
-                    if ti is None:
-                        ti = ToolInventory(
-                            user_id=tool_owner_id,
-                            itemSKU_id=sku.id,
-                            count=0,
-                            pending_scrap=0,
+                # Process each row
+                processed_count = 0
+                tools_promoted_item_ids = set()
+                for item_name, brand, spec, quantity, price in rows:
+                    # Find or create item
+                    item = db.session.execute(
+                        db.select(Item).filter_by(name=item_name)
+                    ).scalar_one_or_none()
+
+                    if not item:
+                        item = Item(name=item_name, is_tool=tools_only)
+                        db.session.add(item)
+                        db.session.flush()  # To get the item ID
+                    elif tools_only and not item.is_tool:
+                        if item.id not in tools_promoted_item_ids:
+                            set_item_tool_status(item, True)
+                            tools_promoted_item_ids.add(item.id)
+
+                    # Find or create item SKU
+                    item_sku = db.session.execute(
+                        db.select(ItemSKU).filter_by(
+                            item_id=item.id, brand=brand, spec=spec
                         )
-                        db.session.add(ti)
-                    ti.count += transaction.count
-            db.session.commit()
+                    ).scalar_one_or_none()
 
-            flash(f"成功处理 {processed_count} 条记录", "success")
+                    if not item_sku:
+                        item_sku = ItemSKU(item_id=item.id, brand=brand, spec=spec)
+                        db.session.add(item_sku)
+                        db.session.flush()  # To get the SKU ID
+
+                    # Create transaction even if quantity=0
+                    transaction = Transaction(
+                        itemSKU_id=item_sku.id,
+                        count=quantity,
+                        price=price,
+                        receipt_id=receipt.id,
+                    )
+                    db.session.add(transaction)
+                    processed_count += 1
+
+                # Commit transactions
+                try:
+                    db.session.commit()
+                    # Update warehouse inventory
+                    receipt.update_warehouse_item_skus()
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    flash(f"处理库存更新时出错: {e}", "error")
+                    current_app.logger.error(f"Batch stockin update error: {e}")
+                    return redirect(url_for("batch_stockin"))
+
+                # Sync tool inventory for tool items
+                tool_owner_id = _tool_inventory_owner_id(warehouse)
+                for transaction in receipt.transactions:
+                    sku = db.session.get(ItemSKU, transaction.itemSKU_id)
+                    if sku and sku.item.is_tool and tool_owner_id is not None:
+                        ti = ToolInventory.query.filter_by(
+                            user_id=tool_owner_id, itemSKU_id=sku.id
+                        ).first()
+                        if ti is None:
+                            ti = ToolInventory(
+                                user_id=tool_owner_id,
+                                itemSKU_id=sku.id,
+                                count=0,
+                                pending_scrap=0,
+                            )
+                            db.session.add(ti)
+                        ti.count += transaction.count
+                db.session.commit()
+        except PostingBusyError:
+            flash("系统繁忙，请稍后重试。", "danger")
             return redirect(url_for("batch_stockin"))
         except Exception as e:
             db.session.rollback()
@@ -192,6 +221,9 @@ def batch_stockin():
             current_app.logger.error(f"Batch stockin error: {e}")
             return redirect(url_for("batch_stockin"))
 
+        flash(f"成功处理 {processed_count} 条记录", "success")
+        return add_lock_wait_timing(redirect(url_for("batch_stockin")), wait)
+
     return render_template("batch_stockin.html.jinja", form=form)
 
 
@@ -223,6 +255,7 @@ def stockin_template():
 
 @app.route("/batch_takestock", methods=["GET", "POST"])
 @login_required
+@heavy_request
 def batch_takestock():
     """Batch take stock page"""
     if current_user.is_auditor:
@@ -282,112 +315,114 @@ def batch_takestock():
                         flash(f"文件缺少必要的列: {col}", "error")
                         return redirect(url_for("batch_takestock"))
 
-                # Generate refcode for this batch operation
-                refcode = f"TAKESTOCK-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-                # Create the receipt for this batch operation
-                receipt = Receipt(
-                    operator=current_user,
-                    refcode=refcode,
-                    warehouse_id=warehouse.id,
-                    type=ReceiptType.TAKESTOCK,
-                    note=form.note.data,
-                )
-                db.session.add(receipt)
-                db.session.flush()  # Flush to get receipt ID
+                # Parse the whole sheet before taking the write lock
+                rows = _takestock_rows(df)
+            except Exception as e:  # pragma: no cover
+                flash(f"处理文件时出错: {str(e)}", "error")
+                current_app.logger.error(f"Batch take stock error: {e}")
+                return redirect(url_for("batch_takestock"))
 
-                # Process each row
-                processed_count = 0
-                for _, row in df.iterrows():
-                    item_name = str(row["物品"]).strip()
-                    brand = str(row["品牌"]).strip()
-                    spec = str(row["规格"]).strip()
-                    actual_count = (
-                        int(row["实际库存"]) if not pd.isna(row["实际库存"]) else 0
+            try:
+                with posting() as wait:
+                    # Generate refcode for this batch operation
+                    refcode = f"TAKESTOCK-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+                    # Create the receipt for this batch operation
+                    receipt = Receipt(
+                        operator=current_user,
+                        refcode=refcode,
+                        warehouse_id=warehouse.id,
+                        type=ReceiptType.TAKESTOCK,
+                        note=form.note.data,
                     )
-
-                    if not item_name or not brand or not spec:
-                        continue  # Skip incomplete rows  # pragma: no cover
-
-                    # Find item and SKU first
-                    item = db.session.execute(
-                        db.select(Item).filter_by(name=item_name)
-                    ).scalar_one_or_none()
-
-                    item_sku = None  # Initialize item_sku outside the if-else blocks
-
-                    if not item:
-                        item = Item(name=item_name)
-                        db.session.add(item)
-                        db.session.flush()
-                        system_count = 0  # New item, so system count is 0
-                    else:
-                        # Find existing SKU
-                        item_sku = db.session.execute(
-                            db.select(ItemSKU).filter_by(
-                                item_id=item.id, brand=brand, spec=spec
-                            )
+                    db.session.add(receipt)
+                    db.session.flush()  # Flush to get receipt ID
+
+                    # Process each row
+                    processed_count = 0
+                    for item_name, brand, spec, actual_count in rows:
+                        # Find item and SKU first
+                        item = db.session.execute(
+                            db.select(Item).filter_by(name=item_name)
                         ).scalar_one_or_none()
 
-                        if item_sku:
-                            # Get current system count from warehouse_item_sku
-                            wis = db.session.execute(
-                                db.select(WarehouseItemSKU).filter_by(
-                                    warehouse_id=warehouse.id, itemSKU_id=item_sku.id
-                                )
-                            ).scalar_one_or_none()
-                            system_count = wis.count if wis else 0
-                        else:
-                            system_count = 0  # New SKU, so system count is 0
-
-                    # Create item SKU if it doesn't exist
-                    if not item_sku:
-                        item_sku = ItemSKU(item_id=item.id, brand=brand, spec=spec)
-                        db.session.add(item_sku)
-                        db.session.flush()  # To get the SKU ID
-
-                    # Calculate the adjustment needed (actual - system)
-                    delta_count = actual_count - system_count
-
-                    # Create transaction only if there's a change in count
-                    if delta_count != 0:
-                        transaction = Transaction(
-                            itemSKU_id=item_sku.id,
-                            price=0,
-                            count=delta_count,
-                            receipt_id=receipt.id,
+                        item_sku = (
+                            None  # Initialize item_sku outside the if-else blocks
                         )
-                        db.session.add(transaction)
-                        processed_count += 1
-
-                # Commit transactions
-                db.session.commit()
 
-                # Update warehouse inventory
-                receipt.update_warehouse_item_skus()
-                db.session.commit()
+                        if not item:
+                            item = Item(name=item_name)
+                            db.session.add(item)
+                            db.session.flush()
+                            system_count = 0  # New item, so system count is 0
+                        else:
+                            # Find existing SKU
+                            item_sku = db.session.execute(
+                                db.select(ItemSKU).filter_by(
+                                    item_id=item.id, brand=brand, spec=spec
+                                )
+                            ).scalar_one_or_none()
 
-                # Sync tool inventory for tool items when TAKESTOCK affects tools
-                tool_owner_id = _tool_inventory_owner_id(warehouse)
-                for transaction in receipt.transactions:
-                    sku = db.session.get(ItemSKU, transaction.itemSKU_id)
-                    if sku and sku.item.is_tool and tool_owner_id is not None:
-                        ti = ToolInventory.query.filter_by(
-                            user_id=tool_owner_id, itemSKU_id=sku.id
-                        ).first()
-                        if ti is None:
-                            ti = ToolInventory(
-                                user_id=tool_owner_id,
-                                itemSKU_id=sku.id,
-                                count=0,
-                                pending_scrap=0,
+                            if item_sku:
+                                # Get current system count from warehouse_item_sku
+                                wis = db.session.execute(
+                                    db.select(WarehouseItemSKU).filter_by(
+                                        warehouse_id=warehouse.id,
+                                        itemSKU_id=item_sku.id,
+                                    )
+                                ).scalar_one_or_none()
+                                system_count = wis.count if wis else 0
+                            else:
+                                system_count = 0  # New SKU, so system count is 0
+
+                        # Create item SKU if it doesn't exist
+                        if not item_sku:
+                            item_sku = ItemSKU(item_id=item.id, brand=brand, spec=spec)
+                            db.session.add(item_sku)
+                            db.session.flush()  # To get the SKU ID
+
+                        # Calculate the adjustment needed (actual - system)
+                        delta_count = actual_count - system_count
+
+                        # Create transaction only if there's a change in count
+                        if delta_count != 0:
+                            transaction = Transaction(
+                                itemSKU_id=item_sku.id,
+                                price=0,
+                                count=delta_count,
+                                receipt_id=receipt.id,
                             )
-                            db.session.add(ti)
-                        # For TAKESTOCK, transaction.count is the delta (actual - system)
-                        ti.count += transaction.count
-                db.session.commit()
-
-                flash(f"成功处理 {processed_count} 条记录", "success")
+                            db.session.add(transaction)
+                            processed_count += 1
+
+                    # Commit transactions
+                    db.session.commit()
+
+                    # Update warehouse inventory
+                    receipt.update_warehouse_item_skus()
+                    db.session.commit()
+
+                    # Sync tool inventory for tool items when TAKESTOCK affects tools
+                    tool_owner_id = _tool_inventory_owner_id(warehouse)
+                    for transaction in receipt.transactions:
+                        sku = db.session.get(ItemSKU, transaction.itemSKU_id)
+                        if sku and sku.item.is_tool and tool_owner_id is not None:
+                            ti = ToolInventory.query.filter_by(
+                                user_id=tool_owner_id, itemSKU_id=sku.id
+                            ).first()
+                            if ti is None:
+                                ti = ToolInventory(
+                                    user_id=tool_owner_id,
+                                    itemSKU_id=sku.id,
+                                    count=0,
+                                    pending_scrap=0,
+                                )
+                                db.session.add(ti)
+                            # For TAKESTOCK, transaction.count is the delta (actual - system)
+                            ti.count += transaction.count
+                    db.session.commit()
+            except PostingBusyError:
+                flash("系统繁忙，请稍后重试。", "danger")
                 return redirect(url_for("batch_takestock"))
             except Exception as e:  # pragma: no cover
                 db.session.rollback()
@@ -395,6 +430,9 @@ def batch_takestock():
                 current_app.logger.error(f"Batch take stock error: {e}")
                 return redirect(url_for("batch_takestock"))
 
+            flash(f"成功处理 {processed_count} 条记录", "success")
+            return add_lock_wait_timing(redirect(url_for("batch_takestock")), wait)
+
     return render_template("batch_takestock.html.jinja", form=form)
 
 
@@ -1,8 +1,9 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from wms import app, db
-from wms.models import Employee, User, EmployeeToolHolding
+from wms.models import Employee, User, EmployeeToolHolding, ToolReceipt
 from wms.forms import EmployeeCreateForm
+from sqlalchemy import func, select
 
 
 def _employee_queryset():
@@ -14,6 +15,51 @@ def _employee_queryset():
     return q
 
 
+def _holding_totals():
+    """Per-employee totals of tools currently held: pieces and distinct SKUs."""
+    return (
+        select(
+            EmployeeToolHolding.employee_id,
+            func.sum(EmployeeToolHolding.count).label("held_count"),
+            func.count(EmployeeToolHolding.itemSKU_id).label("held_skus"),
+        )
+        .where(EmployeeToolHolding.count > 0)
+        .group_by(EmployeeToolHolding.employee_id)
+    )
+
+
+def _employee_roster(query):
+    """Return ``query``'s employees with their crew name and tool summaries.
+
+    One row per employee as (employee, group_name, held_count, held_skus,
+    last_moved), read in a single query instead of per-employee lookups.
+    """
+    held = _holding_totals().subquery()
+    moved = (
+        select(
+            ToolReceipt.employee_id,
+            func.max(ToolReceipt.date).label("last_moved"),
+        )
+        .where(ToolReceipt.employee_id.is_not(None))
+        .group_by(ToolReceipt.employee_id)
+        .subquery()
+    )
+    return (
+        query.outerjoin(User, Employee.user_id == User.id)
+        .outerjoin(held, held.c.employee_id == Employee.id)
+        .outerjoin(moved, moved.c.employee_id == Employee.id)
+        .with_entities(
+            Employee,
+            User.nickname.label("group_name"),
+            func.coalesce(held.c.held_count, 0).label("held_count"),
+            func.coalesce(held.c.held_skus, 0).label("held_skus"),
+            moved.c.last_moved,
+        )
+        .order_by(Employee.employee_id)
+        .all()
+    )
+
+
 def _check_employee_access(emp: Employee) -> bool:
     """Return True if current user may manage this employee."""
     if current_user.is_admin:
@@ -65,7 +111,7 @@ def employees():
     query = _employee_queryset()
     if not include_resigned:
         query = query.filter(Employee.is_resigned.is_(False))
-    employee_list = query.order_by(Employee.employee_id).all()
+    employee_list = _employee_roster(query)
 
     return render_template(
         "employees.html.jinja",
@@ -87,11 +133,9 @@ def employee_resign(employee_id):
     if not emp or not _check_employee_access(emp):
         return redirect(url_for("employees"))
 
-    holdings = (
-        EmployeeToolHolding.query.filter_by(employee_id=emp.id)
-        .filter(EmployeeToolHolding.count > 0)
-        .all()
-    )
+    holdings = db.session.execute(
+        _holding_totals().where(EmployeeToolHolding.employee_id == emp.id)
+    ).first()
     if holdings:
         tool_url = url_for("tool_employee_detail", employee_id=emp.id)
         flash(
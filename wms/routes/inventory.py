@@ -2,6 +2,11 @@ from flask import render_template, url_for, redirect, flash, request, send_file,
 from flask_login import login_required, current_user
 from wms import app, db
 from wms.utils import admin_required
+from wms.posting import PostingBusyError
+from wms.readonly import read_only_view
+from wms.admission import heavy_request
+from wms.budget import query_budget
+from wms.writer import posting_job, submit
 from wms.models import (
     ItemSKU,
     Item,
@@ -24,7 +29,7 @@ from wtforms.validators import Length
 
 
 def _sync_tool_inventory_stockin(receipt: Receipt):
-    """After a STOCKIN receipt is committed, update ToolInventory counts for tool SKUs."""
+    """After a STOCKIN receipt is flushed, update ToolInventory counts for tool SKUs."""
     if not receipt.warehouse or receipt.warehouse.owner_id is None:
         return
 
@@ -44,7 +49,6 @@ def _sync_tool_inventory_stockin(receipt: Receipt):
                 )
                 db.session.add(ti)
             ti.count += transaction.count
-    db.session.commit()
 
 
 def _escape_like(val: str) -> str:
@@ -57,6 +61,10 @@ def _generate_stockin_refcode() -> str:
     return f"STOCKIN-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
 
 
+def _duplicate_refcode_message(refcode: str) -> str:
+    return f"入库单号 '{refcode}' 已存在，请使用不同的入库单号。"
+
+
 def _build_receipt_datetime(selected_date: date | None) -> datetime:
     target_date = selected_date or date.today()
     return datetime.combine(target_date, time(12, 0))
@@ -243,10 +251,7 @@ def stockin():
         # Check if the refcode already exists
         existing_receipt = Receipt.query.filter_by(refcode=form.refcode.data).first()
         if existing_receipt:
-            flash(
-                f"入库单号 '{form.refcode.data}' 已存在，请使用不同的入库单号。",
-                "danger",
-            )
+            flash(_duplicate_refcode_message(form.refcode.data), "danger")
             return render_template(
                 "inventory_stockin.html.jinja",
                 form=form,
@@ -255,64 +260,27 @@ def stockin():
                 manual_receipt_date=manual_receipt_date,
             )
 
-        receipt = Receipt(
-            operator=current_user,
-            refcode=form.refcode.data,
-            warehouse_id=form.warehouse.data,
-            type=ReceiptType.STOCKIN,
-        )
-        if manual_receipt_date and form.op_date.data:
-            receipt.date = _build_receipt_datetime(form.op_date.data)
-
-        try:
-            db.session.add(receipt)
-            db.session.flush()
-
-            for item_form in form.items:
-                try:
-                    # Use the hidden item_sku_id field instead of item_id text field
-                    item_sku_id = item_form.item_sku_id.data
-                    if not item_sku_id:
-                        # Fallback to the old method if hidden field is not populated
-                        item_sku_id = item_form.item_id.data
-
-                    item_id = int(item_sku_id)
-
-                    # Validate the item exists and is not disabled
-                    item = db.session.get(ItemSKU, item_id)
-                    if not item:
-                        raise ValueError("Invalid item ID")
-                    if item.disabled:
-                        raise ValueError("This item is disabled")
-
-                    transaction = Transaction(
-                        itemSKU_id=item_id,
-                        count=item_form.quantity.data,
-                        price=item_form.price.data,
-                        receipt_id=receipt.id,
-                    )
-                    db.session.add(transaction)
-                except ValueError as e:
-                    flash(f"无效的物品: {str(e)}", "danger")
-                    db.session.rollback()
-                    return render_template(
-                        "inventory_stockin.html.jinja",
-                        form=form,
-                        items=items,
-                        auto_generate_stockin_refcode=auto_generate_refcode,
-                        manual_receipt_date=manual_receipt_date,
-                    )
-
-            db.session.commit()
+        lines = []
+        for item_form in form.items:
             try:
-                receipt.update_warehouse_item_skus()
-                db.session.commit()
-                _sync_tool_inventory_stockin(receipt)
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                # If inventory update fails, roll back the whole operation to avoid inconsistency
-                flash(f"处理库存更新时出错: {e}", "danger")
+                # Use the hidden item_sku_id field instead of item_id text field
+                item_sku_id = item_form.item_sku_id.data
+                if not item_sku_id:
+                    # Fallback to the old method if hidden field is not populated
+                    item_sku_id = item_form.item_id.data
+
+                item_id = int(item_sku_id)
+
+                # Validate the item exists and is not disabled
+                item = db.session.get(ItemSKU, item_id)
+                if not item:
+                    raise ValueError("Invalid item ID")
+                if item.disabled:
+                    raise ValueError("This item is disabled")
+
+                lines.append((item_id, item_form.quantity.data, item_form.price.data))
+            except ValueError as e:
+                flash(f"无效的物品: {str(e)}", "danger")
                 return render_template(
                     "inventory_stockin.html.jinja",
                     form=form,
@@ -321,21 +289,23 @@ def stockin():
                     manual_receipt_date=manual_receipt_date,
                 )
 
-            # Save the selected warehouse to session
-            session["last_warehouse_id"] = form.warehouse.data
-
-            flash("入库成功。", "success")
-            return redirect(url_for("inventory", warehouse=form.warehouse.data))
-        except Exception as e:
-            db.session.rollback()
-            # Check if it's a unique constraint error
-            if "UNIQUE constraint failed: receipt.refcode" in str(e):
-                flash(
-                    f"入库单号 '{form.refcode.data}' 已存在，请使用不同的入库单号。",
-                    "danger",
-                )
-            else:
-                flash(f"处理过程中出现错误: {str(e)}", "danger")
+        try:
+            submit(
+                "stockin",
+                {
+                    "operator_id": current_user.id,
+                    "refcode": form.refcode.data,
+                    "warehouse_id": form.warehouse.data,
+                    "date": (
+                        _build_receipt_datetime(form.op_date.data)
+                        if manual_receipt_date and form.op_date.data
+                        else None
+                    ),
+                    "lines": lines,
+                },
+            )
+        except (ValueError, PostingBusyError) as e:
+            flash(str(e), "danger")
             return render_template(
                 "inventory_stockin.html.jinja",
                 form=form,
@@ -343,6 +313,12 @@ def stockin():
                 auto_generate_stockin_refcode=auto_generate_refcode,
                 manual_receipt_date=manual_receipt_date,
             )
+
+        # Save the selected warehouse to session
+        session["last_warehouse_id"] = form.warehouse.data
+
+        flash("入库成功。", "success")
+        return redirect(url_for("inventory", warehouse=form.warehouse.data))
     else:
         if request.method == "POST":
             for field, errors in form.errors.items():  # pragma: no cover
@@ -358,6 +334,74 @@ def stockin():
     )
 
 
+@posting_job("stockin")
+def _post_stockin(payload: dict) -> dict:
+    """Write a stock-in receipt; the refcode is checked again under the write lock."""
+    if Receipt.query.filter_by(refcode=payload["refcode"]).first():
+        raise ValueError(_duplicate_refcode_message(payload["refcode"]))
+    receipt = Receipt(
+        operator_id=payload["operator_id"],
+        refcode=payload["refcode"],
+        warehouse_id=payload["warehouse_id"],
+        type=ReceiptType.STOCKIN,
+    )
+    if payload["date"]:
+        receipt.date = payload["date"]
+    db.session.add(receipt)
+    for sku_id, quantity, price in payload["lines"]:
+        db.session.add(
+            Transaction(itemSKU_id=sku_id, count=quantity, price=price, receipt=receipt)
+        )
+    db.session.flush()
+    receipt.update_warehouse_item_skus(commit=False)
+    _sync_tool_inventory_stockin(receipt)
+    return {"receipt_id": receipt.id}
+
+
+@posting_job("stockout")
+def _post_stockout(payload: dict) -> dict:
+    """Write a stock-out receipt; stock and prices are read under the write lock."""
+    warehouse_id = payload["warehouse_id"]
+    stock = {
+        row.itemSKU_id: row
+        for row in WarehouseItemSKU.query.filter(
+            WarehouseItemSKU.warehouse_id == warehouse_id,
+            WarehouseItemSKU.itemSKU_id.in_([sku_id for sku_id, _ in payload["lines"]]),
+        )
+    }
+    receipt = Receipt(
+        refcode=f"SO-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}",
+        operator_id=payload["operator_id"],
+        warehouse_id=warehouse_id,
+        type=ReceiptType.STOCKOUT,
+        area_id=payload["area_id"],
+        department_id=payload["department_id"],
+        location=payload["location"],
+        note=payload["note"],
+    )
+    if payload["date"]:
+        receipt.date = payload["date"]
+    db.session.add(receipt)
+
+    for sku_id, quantity in payload["lines"]:
+        warehouse_item = stock.get(sku_id)
+        if warehouse_item is None or warehouse_item.count < quantity:
+            sku = db.session.get(ItemSKU, sku_id)
+            raise ValueError(f"库存不足: {sku.item.name} - {sku.brand} - {sku.spec}")
+        # Always use server-side average price to prevent client tampering
+        db.session.add(
+            Transaction(
+                itemSKU_id=sku_id,
+                count=-quantity,  # Negative for stock out
+                price=warehouse_item.average_price,
+                receipt=receipt,
+            )
+        )
+    db.session.flush()
+    receipt.update_warehouse_item_skus(commit=False)
+    return {"receipt_id": receipt.id}
+
+
 @app.route("/stockout", methods=["GET", "POST"])
 @login_required
 def stockout():
@@ -513,21 +557,7 @@ def stockout():
                 manual_receipt_date=manual_receipt_date,
             )
 
-        receipt = Receipt(
-            refcode=f"SO-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}",
-            operator=current_user,
-            warehouse_id=selected_warehouse.id,
-            type=ReceiptType.STOCKOUT,
-            area=area,
-            department=department,
-            location=form.location.data,
-            note=None if not form.note.data else form.note.data,
-        )
-        if manual_receipt_date and form.op_date.data:
-            receipt.date = _build_receipt_datetime(form.op_date.data)
-        db.session.add(receipt)
-        db.session.flush()
-
+        lines = []
         seen_item_ids = set()
 
         for item_form in form.items:
@@ -559,46 +589,7 @@ def stockout():
                 quantity = item_form.quantity.data
                 if quantity <= 0:
                     continue
-
-                # Check if there's enough stock in the selected warehouse
-                available_stock = (
-                    db.session.query(WarehouseItemSKU.count)
-                    .filter(
-                        WarehouseItemSKU.itemSKU_id == item_id,
-                        WarehouseItemSKU.warehouse_id == selected_warehouse.id,
-                    )
-                    .scalar()
-                    or 0
-                )
-
-                if available_stock < quantity:
-                    item_name = items_dict.get(item_id, {}).get("name", "Unknown Item")
-                    flash(f"库存不足: {item_name}", "danger")
-                    return render_template(
-                        "inventory_stockout.html.jinja",
-                        form=form,
-                        items=items,
-                        manual_receipt_date=manual_receipt_date,
-                    )
-
-                # Always use server-side average price to prevent client tampering
-                average_price = (
-                    db.session.query(WarehouseItemSKU.average_price)
-                    .filter(
-                        WarehouseItemSKU.itemSKU_id == item_id,
-                        WarehouseItemSKU.warehouse_id == selected_warehouse.id,
-                    )
-                    .scalar()
-                    or 0
-                )
-
-                transaction = Transaction(
-                    itemSKU_id=item_id,
-                    count=-quantity,  # Negative for stock out
-                    price=average_price,
-                    receipt_id=receipt.id,
-                )
-                db.session.add(transaction)
+                lines.append((item_id, quantity))
             except ValueError as e:
                 flash(str(e), "danger")
                 return render_template(
@@ -608,9 +599,33 @@ def stockout():
                     manual_receipt_date=manual_receipt_date,
                 )
 
-        db.session.commit()
-        receipt.update_warehouse_item_skus()
-        db.session.commit()
+        # Stock and prices are checked by the posting job under the write lock
+        try:
+            submit(
+                "stockout",
+                {
+                    "operator_id": current_user.id,
+                    "warehouse_id": selected_warehouse.id,
+                    "area_id": area.id,
+                    "department_id": department.id,
+                    "location": form.location.data,
+                    "note": form.note.data or None,
+                    "date": (
+                        _build_receipt_datetime(form.op_date.data)
+                        if manual_receipt_date and form.op_date.data
+                        else None
+                    ),
+                    "lines": lines,
+                },
+            )
+        except (ValueError, PostingBusyError) as e:
+            flash(str(e), "danger")
+            return render_template(
+                "inventory_stockout.html.jinja",
+                form=form,
+                items=items,
+                manual_receipt_date=manual_receipt_date,
+            )
 
         # Save selected warehouse to session
         session["last_warehouse_id"] = selected_warehouse.id
@@ -628,6 +643,9 @@ def stockout():
 
 @app.route("/inventory/export")
 @login_required
+@heavy_request
+@read_only_view
+@query_budget
 def inventory_export():
     # Admin can see inventory of all warehouses
     if current_user.can_view_all_warehouses:
@@ -1,7 +1,14 @@
 from flask import render_template, request, redirect, url_for, send_file, flash
 from flask_login import login_required, current_user
 from wms import app, db
-from wms.utils import admin_or_auditor_required
+from wms.utils import Deferred, admin_or_auditor_required, stream_page
+from wms.cache import cached_document, cached_report
+from wms.posting import PostingBusyError
+from wms.writer import posting_job, submit
+from wms.readonly import read_only_view
+from wms.admission import heavy_request
+from wms.budget import query_budget
+from wms.statistics import USAGE_TABS, summarize, usage_frame
 from wms.models import (
     Receipt,
     ReceiptType,
@@ -17,10 +24,13 @@ from wms.models import (
 )
 from datetime import datetime, timedelta
 from sqlalchemy.orm import joinedload
-from sqlalchemy import func, and_, select, distinct
+from sqlalchemy import func, and_, select, distinct, null
 from io import BytesIO
+from dataclasses import dataclass
 from decimal import Decimal
+from types import SimpleNamespace
 import pandas as pd
+from wms.money import from_units, units
 
 
 def _escape_like(val: str) -> str:
@@ -29,6 +39,145 @@ def _escape_like(val: str) -> str:
     return val.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
+@dataclass(slots=True, frozen=True)
+class RecordRow:
+    """One line of the /records list, read as plain columns."""
+
+    id: int
+    receipt_id: int
+    date: datetime
+    type: ReceiptType
+    revoked: bool
+    count: int
+    price: Decimal
+    refcode: str | None
+    location: str | None
+    note: str | None
+    warehouse_id: int
+    warehouse_name: str
+    operator_name: str | None
+    area_name: str | None
+    department_name: str | None
+    sku_id: int
+    brand: str
+    spec: str
+    item_id: int
+    item_name: str
+
+
+def _record_rows_query():
+    """Select the RecordRow columns, in field order, for the /records list."""
+    return (
+        db.session.query(
+            Transaction.id,
+            Transaction.receipt_id,
+            Transaction.date,
+            Transaction.type,
+            Transaction.revoked,
+            Transaction.count,
+            Transaction.price,
+            Receipt.refcode,
+            Receipt.location,
+            Receipt.note,
+            Transaction.warehouse_id,
+            Warehouse.name,
+            User.nickname,
+            Area.name,
+            Department.name,
+            ItemSKU.id,
+            ItemSKU.brand,
+            ItemSKU.spec,
+            Item.id,
+            Item.name,
+        )
+        .select_from(Transaction)
+        .join(Receipt, Transaction.receipt_id == Receipt.id)
+        .join(Warehouse, Receipt.warehouse_id == Warehouse.id)
+        .join(ItemSKU, Transaction.itemSKU_id == ItemSKU.id)
+        .join(Item, ItemSKU.item_id == Item.id)
+        .outerjoin(User, Receipt.operator_id == User.id)
+        .outerjoin(Area, Receipt.area_id == Area.id)
+        .outerjoin(Department, Receipt.department_id == Department.id)
+    )
+
+
+def _filter_records(query, filters: dict):
+    """Apply the /records filters to a query joined with Receipt, Warehouse,
+    ItemSKU and Item, and outer-joined with Area and Department."""
+    record_type = filters["record_type"]
+    warehouse_id = filters["warehouse_id"]
+    start_date = filters["start_date"]
+    end_date = filters["end_date"]
+    refcode = filters["refcode"]
+    location_info = filters["location_info"]
+    item_name = filters["item_name"]
+    sku_desc = filters["sku_desc"]
+    item_id = filters["item_id"]
+    sku_id = filters["sku_id"]
+
+    # Filter by user's warehouse access if not admin
+    if not current_user.can_view_all_warehouses:
+        query = query.filter(
+            (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
+        )
+
+    # Apply filters
+    if record_type == "stockin":
+        query = query.filter(Transaction.type == ReceiptType.STOCKIN)
+    elif record_type == "stockout":
+        query = query.filter(Transaction.type == ReceiptType.STOCKOUT)
+    elif record_type == "takestock":
+        query = query.filter(Transaction.type == ReceiptType.TAKESTOCK)
+    # If record_type == "all", don't filter by type - show all records
+
+    # Location info filter only applies to specific searches or all records
+    if location_info:
+        # Search area or department name if provided
+        esc = _escape_like(location_info)
+        query = query.filter(
+            (Area.name.ilike(f"%{esc}%", escape="\\"))
+            | (Department.name.ilike(f"%{esc}%", escape="\\"))
+            | (Receipt.location.ilike(f"%{esc}%", escape="\\"))
+        )
+
+    if warehouse_id:
+        query = query.filter(Transaction.warehouse_id == warehouse_id)
+
+    if start_date:
+        start_datetime = datetime.strptime(
+            f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
+        )
+        query = query.filter(Transaction.date >= start_datetime)
+
+    if end_date:
+        end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
+        query = query.filter(Transaction.date <= end_datetime)
+
+    if refcode and (record_type == "stockin" or record_type == "all"):
+        query = query.filter(Receipt.refcode.ilike(f"%{refcode}%"))
+
+    # Add new filters for item name and SKU description
+    if item_name:
+        esc = _escape_like(item_name)
+        query = query.filter(Item.name.ilike(f"%{esc}%", escape="\\"))
+
+    if sku_desc:
+        esc = _escape_like(sku_desc)
+        query = query.filter(
+            (ItemSKU.brand.ilike(f"%{esc}%", escape="\\"))
+            | (ItemSKU.spec.ilike(f"%{esc}%", escape="\\"))
+        )
+
+    # Add precise filters for item_id and sku_id
+    if item_id:
+        query = query.filter(Item.id == item_id)
+
+    if sku_id:
+        query = query.filter(ItemSKU.id == sku_id)
+
+    return query
+
+
 @app.route("/records", methods=["GET"])
 @login_required
 def records():
@@ -52,6 +201,7 @@ def records():
     sku_desc = request.args.get("sku_desc")
     item_id = request.args.get("item_id", type=int)
     sku_id = request.args.get("sku_id", type=int)
+    view = request.args.get("view", "lines")  # lines or receipts
     page = request.args.get("page", 1, type=int)
     per_page = 20
     manual_receipt_date = app.config.get("MANUAL_RECEIPT_DATE", False)
@@ -88,6 +238,7 @@ def records():
                     sku_desc=sku_desc,
                     item_id=item_id,
                     sku_id=sku_id,
+                    view=view if view == "receipts" else None,
                 )
             )
 
@@ -119,100 +270,96 @@ def records():
                 .all()
             )
 
-    # Query base - join necessary relationships
-    query = (
-        db.session.query(Transaction)
-        .join(Receipt)
-        .join(Warehouse)
-        .join(ItemSKU)
-        .join(Item)
-        .options(
-            joinedload(Transaction.receipt).joinedload(Receipt.warehouse),
-            joinedload(Transaction.receipt).joinedload(Receipt.operator),
-            joinedload(Transaction.receipt).joinedload(Receipt.area),
-            joinedload(Transaction.receipt).joinedload(Receipt.department),
-            joinedload(Transaction.itemSKU).joinedload(ItemSKU.item),
-        )
-        .order_by(Receipt.date.desc(), Transaction.id.asc())
-    )
-
-    # Filter by user's warehouse access if not admin
-    if not current_user.can_view_all_warehouses:
-        query = query.filter(
-            (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
-        )
-
-    # Apply filters
-    if record_type == "stockin":
-        query = query.filter(Receipt.type == ReceiptType.STOCKIN)
-    elif record_type == "stockout":
-        query = query.filter(Receipt.type == ReceiptType.STOCKOUT)
-    elif record_type == "takestock":
-        query = query.filter(Receipt.type == ReceiptType.TAKESTOCK)
-    # If record_type == "all", don't filter by type - show all records
+    # For non-admins, ensure they can only access their warehouse or public warehouses
+    if warehouse_id and not current_user.can_view_all_warehouses:
+        allowed_warehouse_ids = [w.id for w in warehouses]
+        if int(warehouse_id) not in allowed_warehouse_ids:
+            warehouse_id = None
+
+    filters = {
+        "record_type": record_type,
+        "warehouse_id": warehouse_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "refcode": refcode,
+        "location_info": location_info,
+        "item_name": item_name,
+        "sku_desc": sku_desc,
+        "item_id": item_id,
+        "sku_id": sku_id,
+    }
 
-    # Location info filter only applies to specific searches or all records
-    if location_info:
-        # Search area or department name if provided
-        esc = _escape_like(location_info)
-        query = (
-            query.outerjoin(Area)
-            .outerjoin(Department)
-            .filter(
-                (Area.name.ilike(f"%{esc}%", escape="\\"))
-                | (Department.name.ilike(f"%{esc}%", escape="\\"))
-                | (Receipt.location.ilike(f"%{esc}%", escape="\\"))
+    receipt_rows = []
+    record_rows = []
+    if view == "receipts":
+        # One row per receipt, aggregated in SQL; lines are fetched on demand
+        query = _filter_records(
+            db.session.query(
+                Transaction.receipt_id,
+                func.count(Transaction.id).label("line_count"),
+                func.sum(Transaction.count).label("total_count"),
+                func.sum(Transaction.count * units(Transaction.price)).label(
+                    "total_value"
+                ),
             )
+            .select_from(Transaction)
+            .join(Receipt, Transaction.receipt_id == Receipt.id)
+            .join(Warehouse, Receipt.warehouse_id == Warehouse.id)
+            .join(ItemSKU, Transaction.itemSKU_id == ItemSKU.id)
+            .join(Item, ItemSKU.item_id == Item.id)
+            .outerjoin(Area, Receipt.area_id == Area.id)
+            .outerjoin(Department, Receipt.department_id == Department.id),
+            filters,
         )
-
-    if warehouse_id:
-        # For non-admins, ensure they can only access their warehouse or public warehouses
-        if not current_user.can_view_all_warehouses:
-            allowed_warehouse_ids = [w.id for w in warehouses]
-            if int(warehouse_id) not in allowed_warehouse_ids:
-                warehouse_id = None
-
-        if warehouse_id:
-            query = query.filter(Receipt.warehouse_id == warehouse_id)
-
-    if start_date:
-        start_datetime = datetime.strptime(
-            f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
+        query = query.group_by(Transaction.receipt_id).order_by(
+            func.max(Transaction.date).desc(), Transaction.receipt_id.desc()
         )
-        query = query.filter(Receipt.date >= start_datetime)
-
-    if end_date:
-        end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
-        query = query.filter(Receipt.date <= end_datetime)
-
-    if refcode and (record_type == "stockin" or record_type == "all"):
-        query = query.filter(Receipt.refcode.ilike(f"%{refcode}%"))
-
-    # Add new filters for item name and SKU description
-    if item_name:
-        esc = _escape_like(item_name)
-        query = query.filter(Item.name.ilike(f"%{esc}%", escape="\\"))
-
-    if sku_desc:
-        esc = _escape_like(sku_desc)
-        query = query.filter(
-            (ItemSKU.brand.ilike(f"%{esc}%", escape="\\"))
-            | (ItemSKU.spec.ilike(f"%{esc}%", escape="\\"))
+        # Queries run while the page renders, after its head has been sent; a
+        # page past the end renders empty since a 404 could no longer be sent
+        pagination = Deferred(
+            lambda: query.paginate(page=page, per_page=per_page, error_out=False)
         )
 
-    # Add precise filters for item_id and sku_id
-    if item_id:
-        query = query.filter(Item.id == item_id)
-
-    if sku_id:
-        query = query.filter(ItemSKU.id == sku_id)
+        def _receipt_rows():
+            receipts = {
+                receipt.id: receipt
+                for receipt in Receipt.query.options(
+                    joinedload(Receipt.warehouse),
+                    joinedload(Receipt.operator),
+                    joinedload(Receipt.area),
+                    joinedload(Receipt.department),
+                ).filter(Receipt.id.in_([row.receipt_id for row in pagination.items]))
+            }
+            return [
+                SimpleNamespace(
+                    receipt=receipts[row.receipt_id],
+                    line_count=row.line_count,
+                    total_count=row.total_count or 0,
+                    total_value=from_units(row.total_value),
+                )
+                for row in pagination.items
+            ]
 
-    # Paginate results - now based on transactions
-    pagination = query.paginate(page=page, per_page=per_page)
+        receipt_rows = Deferred(_receipt_rows)
+    else:
+        # Flat projection of the displayed columns; no ORM entities are built
+        query = _filter_records(_record_rows_query(), filters)
+        query = query.order_by(Transaction.date.desc(), Transaction.id.asc())
+
+        # Paginate results - now based on transactions. Queries run while the
+        # page renders, after its head has been sent; a page past the end
+        # renders empty since a 404 could no longer be sent
+        pagination = Deferred(
+            lambda: query.paginate(page=page, per_page=per_page, error_out=False)
+        )
+        record_rows = Deferred(lambda: [RecordRow(*row) for row in pagination.items])
 
-    return render_template(
+    return stream_page(
         "records.html.jinja",
         pagination=pagination,
+        view=view,
+        record_rows=record_rows,
+        receipt_rows=receipt_rows,
         warehouses=warehouses,
         record_type=record_type,
         warehouse_id=warehouse_id,
@@ -233,9 +380,68 @@ def records():
     )
 
 
+# Lines shown per page on receipt detail and in the expanded records rows
+RECEIPT_LINES_PER_PAGE = 100
+
+
+def _can_view_receipt(receipt) -> bool:
+    return (
+        current_user.can_view_all_warehouses
+        or receipt.warehouse.is_public
+        or receipt.warehouse.owner_id == current_user.id
+    )
+
+
+def _receipt_lines_page(receipt_id: int, after: int = 0):
+    """Return one keyset page of a receipt's lines and the cursor for the next.
+
+    Lines are ordered by id and only those with ``id > after`` are read, so
+    every page costs the same however deep into the receipt it is. The cursor
+    is None on the last page.
+    """
+    transactions = (
+        db.session.query(Transaction)
+        .options(joinedload(Transaction.itemSKU).joinedload(ItemSKU.item))
+        .filter(Transaction.receipt_id == receipt_id, Transaction.id > after)
+        .order_by(Transaction.id)
+        .limit(RECEIPT_LINES_PER_PAGE + 1)
+        .all()
+    )
+    if len(transactions) > RECEIPT_LINES_PER_PAGE:
+        transactions = transactions[:RECEIPT_LINES_PER_PAGE]
+        return transactions, transactions[-1].id
+    return transactions, None
+
+
+@app.route("/records/receipt/<int:receipt_id>/lines")
+@login_required
+def records_receipt_lines(receipt_id):
+    """Render the lines of one receipt for the receipt-grouped records view."""
+    receipt = (
+        db.session.query(Receipt)
+        .options(joinedload(Receipt.warehouse))
+        .filter(Receipt.id == receipt_id)
+        .first_or_404()
+    )
+    if not _can_view_receipt(receipt):
+        return "您没有权限查看此单据", 403
+
+    transactions, next_after = _receipt_lines_page(receipt_id)
+    return render_template(
+        "records_receipt_lines.html.jinja",
+        receipt=receipt,
+        transactions=transactions,
+        has_more=next_after is not None,
+    )
+
+
 @app.route("/statistics_fee", methods=["GET"])
 @login_required
 @admin_or_auditor_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
 def statistics_fee():
     # Get current year and month for default date range
     today = datetime.now()
@@ -300,116 +506,123 @@ def statistics_fee():
 
     # Process filter date range
     filter_conditions = [
-        Receipt.type == ReceiptType.STOCKOUT,
-        Receipt.revoked.is_(False),
+        Transaction.type == ReceiptType.STOCKOUT,
+        Transaction.revoked.is_(False),
     ]
 
     if tool_only:
-        filter_conditions.append(Receipt.is_tool.is_(True))
+        filter_conditions.append(Transaction.is_tool.is_(True))
 
     if start_date:
         start_datetime = datetime.strptime(
             f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
         )
-        filter_conditions.append(Receipt.date >= start_datetime)
+        filter_conditions.append(Transaction.date >= start_datetime)
 
     if end_date:
         end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
-        filter_conditions.append(Receipt.date <= end_datetime)
+        filter_conditions.append(Transaction.date <= end_datetime)
 
-    # Query aggregating transactions by warehouse, area, and department
-    results = (
-        db.session.query(
-            Receipt.warehouse_id,
-            Receipt.area_id,
-            Receipt.department_id,
-            func.sum(Transaction.count * Transaction.price * Decimal("-1")).label(
-                "total_value"
-            ),
+    # The aggregate runs while the page renders, after its head has been sent
+    def _fill_stats():
+        # Query aggregating transactions by warehouse, area, and department; the
+        # ledger columns on Transaction let ix_transaction_ledger_report cover it
+        results = (
+            db.session.query(
+                Transaction.warehouse_id,
+                Transaction.area_id,
+                Transaction.department_id,
+                func.sum(Transaction.count * units(Transaction.price) * -1).label(
+                    "total_value"
+                ),
+            )
+            .filter(and_(*filter_conditions))
+            .filter(
+                Transaction.count < 0
+            )  # Only include negative counts which are real stockouts
+            .group_by(
+                Transaction.warehouse_id, Transaction.area_id, Transaction.department_id
+            )
+            .all()
         )
-        .join(Transaction)
-        .filter(and_(*filter_conditions))
-        .filter(
-            Transaction.count < 0
-        )  # Only include negative counts which are real stockouts
-        .group_by(Receipt.warehouse_id, Receipt.area_id, Receipt.department_id)
-        .all()
-    )
 
-    # Populate the statistics data structure
-    for warehouse_id, area_id, department_id, total_value in results:
-        # Skip entries with no area or department
-        if not area_id or not department_id:
-            continue
+        # Populate the statistics data structure
+        for warehouse_id, area_id, department_id, total_value in results:
+            # Skip entries with no area or department
+            if not area_id or not department_id:
+                continue
 
-        # Keep as Decimal for precision
-        value = total_value
+            # Summed in cents; keep as Decimal for the template
+            value = from_units(total_value)
 
-        # Update values in the nested structure
-        stats_data["warehouses"][warehouse_id]["areas"][area_id]["departments"][
-            department_id
-        ] = value
+            # Update values in the nested structure
+            stats_data["warehouses"][warehouse_id]["areas"][area_id]["departments"][
+                department_id
+            ] = value
 
-        # Update area total for this warehouse
-        stats_data["warehouses"][warehouse_id]["areas"][area_id]["total"] += value
+            # Update area total for this warehouse
+            stats_data["warehouses"][warehouse_id]["areas"][area_id]["total"] += value
 
-        # Update warehouse total
-        stats_data["total_by_warehouse"][warehouse_id] += value
+            # Update warehouse total
+            stats_data["total_by_warehouse"][warehouse_id] += value
 
-        # Update area total
-        stats_data["areas"][area_id]["total"] += value
+            # Update area total
+            stats_data["areas"][area_id]["total"] += value
 
-        # Update department total
-        stats_data["departments"][department_id]["total"] += value
+            # Update department total
+            stats_data["departments"][department_id]["total"] += value
 
-        # Update area total
-        if area_id not in stats_data["areas"]:
-            stats_data["areas"][area_id] = {
-                "total": Decimal("0"),
-                "departments": {},
-            }
-        if department_id not in stats_data["areas"][area_id]["departments"]:
-            stats_data["areas"][area_id]["departments"][department_id] = Decimal("0")
-        stats_data["areas"][area_id]["departments"][department_id] += value
+            # Update area total
+            if area_id not in stats_data["areas"]:
+                stats_data["areas"][area_id] = {
+                    "total": Decimal("0"),
+                    "departments": {},
+                }
+            if department_id not in stats_data["areas"][area_id]["departments"]:
+                stats_data["areas"][area_id]["departments"][department_id] = Decimal(
+                    "0"
+                )
+            stats_data["areas"][area_id]["departments"][department_id] += value
 
-        # Update grand total
-        stats_data["grand_total"] += value
+            # Update grand total
+            stats_data["grand_total"] += value
+        return stats_data
 
-    return render_template(
+    return stream_page(
         "statistics_fee.html.jinja",
         start_date=start_date,
         end_date=end_date,
         warehouses=warehouses,
         areas=areas,
         departments=departments,
-        stats_data=stats_data,
+        stats_data=Deferred(_fill_stats),
         current_year=current_year,
         current_month=current_month,
         tool_only=tool_only,
     )
 
 
-@app.route("/statistics_usage", methods=["GET"])
-@login_required
-def statistics_usage():
-    # Get current year and month for default date range
+def _usage_filters(warehouses) -> dict:
+    """Parse the filters shared by the usage statistics page and its tabs."""
     today = datetime.now()
     current_year = today.year
     current_month = today.month
-
-    # Get filter parameters from request
-    start_date = request.args.get("start_date", "")
-    end_date = request.args.get("end_date", "")
-    warehouse_id = request.args.get("warehouse")
-    item_name = request.args.get("item_name", "")
-    brand = request.args.get("brand", "")
-    spec = request.args.get("spec", "")
-    tool_only = request.args.get("tool_only") == "1"
+    filters = {
+        "start_date": request.args.get("start_date", ""),
+        "end_date": request.args.get("end_date", ""),
+        "warehouse_id": request.args.get("warehouse"),
+        "item_name": request.args.get("item_name", ""),
+        "brand": request.args.get("brand", ""),
+        "spec": request.args.get("spec", ""),
+        "tool_only": request.args.get("tool_only") == "1",
+        "current_year": current_year,
+        "current_month": current_month,
+    }
 
     # If no dates are provided, default to current month
-    if not start_date and not end_date:
+    if not filters["start_date"] and not filters["end_date"]:
         # First day of current month
-        start_date = f"{current_year}-{current_month:02d}-01"
+        filters["start_date"] = f"{current_year}-{current_month:02d}-01"
 
         # Last day of current month
         if current_month == 12:
@@ -420,405 +633,210 @@ def statistics_usage():
             next_month = current_month + 1
         next_month_first = datetime(next_month_year, next_month, 1)
         last_day = (next_month_first - timedelta(days=1)).day
-        end_date = f"{current_year}-{current_month:02d}-{last_day}"
+        filters["end_date"] = f"{current_year}-{current_month:02d}-{last_day}"
 
-    # Get warehouses accessible by the current user
-    if current_user.can_view_all_warehouses:
-        warehouses = Warehouse.query.all()
-    else:
-        warehouses = Warehouse.query.filter(
-            (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
-        ).all()
+    # Non-admins may only filter on warehouses they can see
+    if filters["warehouse_id"] and not current_user.can_view_all_warehouses:
+        allowed_warehouse_ids = [w.id for w in warehouses]
+        if int(filters["warehouse_id"]) not in allowed_warehouse_ids:
+            filters["warehouse_id"] = None
 
-    # For regular users, ensure a warehouse is selected
-    if not current_user.can_view_all_warehouses and not warehouse_id and warehouses:
-        user_warehouse = next(
-            (w for w in warehouses if w.owner_id == current_user.id), None
-        )
-        default_warehouse = user_warehouse or warehouses[0] if warehouses else None
-        if default_warehouse:
-            return redirect(
-                url_for(
-                    "statistics_usage",
-                    warehouse=default_warehouse.id,
-                    start_date=start_date,
-                    end_date=end_date,
-                )
-            )
+    return filters
 
-    # Get all unique item names for datalist
-    item_names = (
-        db.session.execute(select(distinct(Item.name)).order_by(Item.name))
-        .scalars()
-        .all()
-    )
 
-    # Query base - aggregate transactions by ItemSKU using Transaction.price
-    # Calculate total value and weighted average price from transactions
-    if warehouse_id:
-        # For specific warehouse
-        query = (
-            db.session.query(
-                ItemSKU,
-                Item,
-                func.sum(Transaction.count * -1).label("total_usage"),
-                (
-                    func.sum(Transaction.count * Transaction.price * Decimal("-1"))
-                    / func.nullif(func.sum(Transaction.count * -1), 0)
-                ).label("average_price"),
-                func.sum(Transaction.count * Transaction.price * Decimal("-1")).label(
-                    "total_value"
-                ),
-            )
-            .join(Transaction)
-            .join(Receipt)
-            .join(Item)
-            .filter(Receipt.type == ReceiptType.STOCKOUT)
-            .filter(Receipt.revoked.is_(False))
-            .filter(
-                Transaction.count < 0
-            )  # Only include negative counts which are real stockouts
-            .group_by(ItemSKU.id, Item.id)
-            .order_by(Item.name, ItemSKU.brand, ItemSKU.spec)
-        )
-    else:
-        # For all warehouses, calculate weighted average price from transactions
-        query = (
-            db.session.query(
-                ItemSKU,
-                Item,
-                func.sum(Transaction.count * -1).label("total_usage"),
-                (
-                    func.sum(Transaction.count * Transaction.price * Decimal("-1"))
-                    / func.nullif(func.sum(Transaction.count * -1), 0)
-                ).label("average_price"),
-                func.sum(Transaction.count * Transaction.price * Decimal("-1")).label(
-                    "total_value"
-                ),
-            )
-            .join(Transaction)
-            .join(Receipt)
-            .join(Item)
-            .filter(Receipt.type == ReceiptType.STOCKOUT)
-            .filter(Receipt.revoked.is_(False))
-            .filter(
-                Transaction.count < 0
-            )  # Only include negative counts which are real stockouts
-            .group_by(ItemSKU.id, Item.id)
-            .order_by(Item.name, ItemSKU.brand, ItemSKU.spec)
+def _usage_rows(filters: dict, by_area: bool = True, by_department: bool = True):
+    """Run the aggregated stock-out query behind the usage statistics views.
+
+    Returns one row per (SKU, area, department) group in ``USAGE_COLUMNS``
+    order. Dimensions that are not requested are left NULL so the query only
+    groups by what the caller renders.
+    """
+    area_column = Transaction.area_id if by_area else null()
+    department_column = Transaction.department_id if by_department else null()
+    group_by = [ItemSKU.id, Item.id]
+    if by_area:
+        group_by.append(Transaction.area_id)
+    if by_department:
+        group_by.append(Transaction.department_id)
+
+    # Values are summed in cents so the pivot in wms.statistics runs on integers
+    query = (
+        db.session.query(
+            ItemSKU.id.label("sku_id"),
+            Item.id.label("item_id"),
+            Item.name.label("item_name"),
+            ItemSKU.brand,
+            ItemSKU.spec,
+            area_column.label("area_id"),
+            department_column.label("department_id"),
+            func.sum(Transaction.count * -1).label("usage"),
+            func.sum(Transaction.count * units(Transaction.price) * -1).label("cents"),
         )
+        .select_from(Transaction)
+        .join(ItemSKU, Transaction.itemSKU_id == ItemSKU.id)
+        .join(Item, ItemSKU.item_id == Item.id)
+        .filter(Transaction.type == ReceiptType.STOCKOUT)
+        .filter(Transaction.revoked.is_(False))
+        .filter(
+            Transaction.count < 0
+        )  # Only include negative counts which are real stockouts
+        .group_by(*group_by)
+    )
 
     # Filter by warehouse access if not admin
     if not current_user.can_view_all_warehouses:
-        query = query.join(Receipt.warehouse).filter(
+        query = query.join(Warehouse, Transaction.warehouse_id == Warehouse.id).filter(
             (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
         )
 
-    # Apply filters
-    if warehouse_id:
-        if not current_user.can_view_all_warehouses:
-            allowed_warehouse_ids = [w.id for w in warehouses]
-            if int(warehouse_id) not in allowed_warehouse_ids:
-                warehouse_id = None
-
-        if warehouse_id:
-            query = query.filter(Receipt.warehouse_id == warehouse_id)
+    if filters["warehouse_id"]:
+        query = query.filter(Transaction.warehouse_id == filters["warehouse_id"])
 
-    if start_date:
+    if filters["start_date"]:
         start_datetime = datetime.strptime(
-            f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
+            f"{filters['start_date']} 00:00:00", "%Y-%m-%d %H:%M:%S"
         )
-        query = query.filter(Receipt.date >= start_datetime)
+        query = query.filter(Transaction.date >= start_datetime)
 
-    if end_date:
-        end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
-        query = query.filter(Receipt.date <= end_datetime)
+    if filters["end_date"]:
+        end_datetime = datetime.strptime(
+            f"{filters['end_date']} 23:59:59", "%Y-%m-%d %H:%M:%S"
+        )
+        query = query.filter(Transaction.date <= end_datetime)
 
     # Apply item filters
-    if item_name:
-        query = query.filter(Item.name.ilike(f"%{item_name}%"))
-    if brand:
-        query = query.filter(ItemSKU.brand.ilike(f"%{brand}%"))
-    if spec:
-        query = query.filter(ItemSKU.spec.ilike(f"%{spec}%"))
-    if tool_only:
+    if filters["item_name"]:
+        query = query.filter(Item.name.ilike(f"%{filters['item_name']}%"))
+    if filters["brand"]:
+        query = query.filter(ItemSKU.brand.ilike(f"%{filters['brand']}%"))
+    if filters["spec"]:
+        query = query.filter(ItemSKU.spec.ilike(f"%{filters['spec']}%"))
+    if filters["tool_only"]:
         query = query.filter(Item.is_tool.is_(True))
 
-    # Get results
-    usage_data = query.all()
+    return query.all()
 
-    # Calculate totals
-    total_quantity = sum(data.total_usage for data in usage_data)
-    total_value = sum((data.total_value or 0) for data in usage_data)
 
-    # Get areas and departments for detailed view
-    areas = Area.query.order_by(Area.id).all()
-    departments = Department.query.order_by(Department.id).all()
-
-    # Build base map from main query results
-    sku_base = {}
-    for data in usage_data:
-        sku, item = data[0], data[1]
-        sku_base[(sku.id, item.id)] = {
-            "itemsku": sku,
-            "item": item,
-            "total_usage": data.total_usage,
-            "average_price": data.average_price,
-            "total_value": data.total_value or Decimal("0"),
-        }
-
-    # Prepare detailed query with area + department breakdown
-    detailed_query = (
-        db.session.query(
-            ItemSKU,
-            Item,
-            Area.id.label("area_id"),
-            Department.id.label("dept_id"),
-            func.sum(Transaction.count * -1).label("usage"),
-            func.sum(Transaction.count * Transaction.price * Decimal("-1")).label(
-                "value"
-            ),
-        )
-        .join(Transaction)
-        .join(Receipt)
-        .join(Item)
-        .outerjoin(Area, Receipt.area_id == Area.id)
-        .outerjoin(Department, Receipt.department_id == Department.id)
-        .filter(Receipt.type == ReceiptType.STOCKOUT)
-        .filter(Receipt.revoked.is_(False))
-        .filter(Transaction.count < 0)
-        .group_by(ItemSKU.id, Item.id, Area.id, Department.id)
-    )
-
-    # Apply same filters to detailed query
-    if not current_user.can_view_all_warehouses:
-        detailed_query = detailed_query.join(Receipt.warehouse).filter(
-            (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
-        )
-
-    if warehouse_id:
-        if not current_user.can_view_all_warehouses:
-            allowed_warehouse_ids = [w.id for w in warehouses]
-            if int(warehouse_id) not in allowed_warehouse_ids:
-                warehouse_id = None
-        if warehouse_id:
-            detailed_query = detailed_query.filter(Receipt.warehouse_id == warehouse_id)
-
-    if start_date:
-        start_datetime = datetime.strptime(
-            f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
-        )
-        detailed_query = detailed_query.filter(Receipt.date >= start_datetime)
+def _usage_warehouses():
+    # Get warehouses accessible by the current user
+    if current_user.can_view_all_warehouses:
+        return Warehouse.query.all()
+    return Warehouse.query.filter(
+        (Warehouse.is_public.is_(True)) | (Warehouse.owner_id == current_user.id)
+    ).all()
 
-    if end_date:
-        end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
-        detailed_query = detailed_query.filter(Receipt.date <= end_datetime)
 
-    if item_name:
-        detailed_query = detailed_query.filter(Item.name.ilike(f"%{item_name}%"))
-    if brand:
-        detailed_query = detailed_query.filter(ItemSKU.brand.ilike(f"%{brand}%"))
-    if spec:
-        detailed_query = detailed_query.filter(ItemSKU.spec.ilike(f"%{spec}%"))
-    if tool_only:
-        detailed_query = detailed_query.filter(Item.is_tool.is_(True))
-
-    # Aggregate raw detailed data
-    raw_rows = detailed_query.all()
-
-    # Build per-area and per-dept aggregations
-    # key: (sku_id, item_id) -> area_id -> [usage, value]
-    sku_area_agg = {}
-    # key: (sku_id, item_id) -> dept_id -> [usage, value]
-    sku_dept_agg = {}
-    # key: (sku_id, item_id) -> dept_id -> area_id -> [usage, value]
-    sku_dept_area_agg = {}
-
-    for row in raw_rows:
-        key = (row.ItemSKU.id, row.Item.id)
-        area_id = row.area_id
-        dept_id = row.dept_id
-        usage = row.usage or 0
-        value = row.value or Decimal("0")
-
-        if key not in sku_area_agg:
-            sku_area_agg[key] = {}
-        if area_id:
-            if area_id not in sku_area_agg[key]:
-                sku_area_agg[key][area_id] = [0, Decimal("0")]
-            sku_area_agg[key][area_id][0] += usage
-            sku_area_agg[key][area_id][1] += value
-
-        if key not in sku_dept_agg:
-            sku_dept_agg[key] = {}
-        if dept_id:
-            if dept_id not in sku_dept_agg[key]:
-                sku_dept_agg[key][dept_id] = [0, Decimal("0")]
-            sku_dept_agg[key][dept_id][0] += usage
-            sku_dept_agg[key][dept_id][1] += value
-
-        if key not in sku_dept_area_agg:
-            sku_dept_area_agg[key] = {}
-        if dept_id and area_id:
-            if dept_id not in sku_dept_area_agg[key]:
-                sku_dept_area_agg[key][dept_id] = {}
-            if area_id not in sku_dept_area_agg[key][dept_id]:
-                sku_dept_area_agg[key][dept_id][area_id] = [0, Decimal("0")]
-            sku_dept_area_agg[key][dept_id][area_id][0] += usage
-            sku_dept_area_agg[key][dept_id][area_id][1] += value
-
-    # Build area_list (for "按区域" tab)
-    area_list = []
-    for key, base in sku_base.items():
-        area_usage = {}
-        area_value = {}
-        sku_usage_total = 0
-        sku_value_total = Decimal("0")
-
-        area_data = sku_area_agg.get(key, {})
-        for area in areas:
-            a_data = area_data.get(area.id, [0, Decimal("0")])
-            area_usage[area.id] = a_data[0]
-            area_value[area.id] = a_data[1]
-            sku_usage_total += a_data[0]
-            sku_value_total += a_data[1]
-
-        sku_avg = (
-            sku_value_total / sku_usage_total
-            if sku_usage_total > 0
-            else base["average_price"]
-        )
+@app.route("/statistics_usage", methods=["GET"])
+@login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
+def statistics_usage():
+    warehouses = _usage_warehouses()
+    filters = _usage_filters(warehouses)
 
-        area_list.append(
-            {
-                "itemsku": base["itemsku"],
-                "item": base["item"],
-                "area_usage": area_usage,
-                "area_value": area_value,
-                "total_usage": sku_usage_total,
-                "average_price": sku_avg,
-                "total_value": sku_value_total,
-            }
+    # For regular users, ensure a warehouse is selected
+    if (
+        not current_user.can_view_all_warehouses
+        and not request.args.get("warehouse")
+        and warehouses
+    ):
+        user_warehouse = next(
+            (w for w in warehouses if w.owner_id == current_user.id), None
         )
+        default_warehouse = user_warehouse or warehouses[0] if warehouses else None
+        if default_warehouse:
+            return redirect(
+                url_for(
+                    "statistics_usage",
+                    warehouse=default_warehouse.id,
+                    start_date=filters["start_date"],
+                    end_date=filters["end_date"],
+                )
+            )
 
-    area_list.sort(
-        key=lambda x: (x["item"].name, x["itemsku"].brand, x["itemsku"].spec)
+    # Get all unique item names for datalist
+    item_names = (
+        db.session.execute(select(distinct(Item.name)).order_by(Item.name))
+        .scalars()
+        .all()
     )
 
-    # Build dept_list (for "按部门" tab)
-    dept_list = []
-    for key, base in sku_base.items():
-        dept_usage = {}
-        dept_value = {}
-        sku_usage_total = 0
-        sku_value_total = Decimal("0")
-
-        dept_data = sku_dept_agg.get(key, {})
-        for dept in departments:
-            d_data = dept_data.get(dept.id, [0, Decimal("0")])
-            dept_usage[dept.id] = d_data[0]
-            dept_value[dept.id] = d_data[1]
-            sku_usage_total += d_data[0]
-            sku_value_total += d_data[1]
-
-        sku_avg = (
-            sku_value_total / sku_usage_total
-            if sku_usage_total > 0
-            else base["average_price"]
-        )
-
-        dept_list.append(
-            {
-                "itemsku": base["itemsku"],
-                "item": base["item"],
-                "dept_usage": dept_usage,
-                "dept_value": dept_value,
-                "total_usage": sku_usage_total,
-                "average_price": sku_avg,
-                "total_value": sku_value_total,
-            }
+    # First paint only pays for the per-SKU summary; the breakdown tabs are
+    # fetched from statistics_usage_tab when opened. The summary query runs
+    # while the page renders, after its head has been sent
+    def _summary():
+        summary = summarize(
+            usage_frame(_usage_rows(filters, by_area=False, by_department=False))
         )
+        summary.pop("skus")
+        return summary
+
+    tab_args = {
+        "warehouse": filters["warehouse_id"],
+        "start_date": filters["start_date"],
+        "end_date": filters["end_date"],
+        "item_name": filters["item_name"] or None,
+        "brand": filters["brand"] or None,
+        "spec": filters["spec"] or None,
+        "tool_only": "1" if filters["tool_only"] else None,
+    }
 
-    dept_list.sort(
-        key=lambda x: (x["item"].name, x["itemsku"].brand, x["itemsku"].spec)
+    return stream_page(
+        "statistics_usage.html.jinja",
+        warehouses=warehouses,
+        item_names=item_names,
+        tab_args=tab_args,
+        summary=Deferred(_summary),
+        **filters,
     )
 
-    # Build detailed_by_dept (for "详细" tab)
-    # dept_id -> list of item rows with per-area breakdown
-    detailed_by_dept = {}
-    for dept in departments:
-        dept_items = []
-        for key, base in sku_base.items():
-            area_usage = {}
-            area_value = {}
-            item_usage_total = 0
-            item_value_total = Decimal("0")
-
-            dept_area_data = sku_dept_area_agg.get(key, {}).get(dept.id, {})
-            for area in areas:
-                a_data = dept_area_data.get(area.id, [0, Decimal("0")])
-                area_usage[area.id] = a_data[0]
-                area_value[area.id] = a_data[1]
-                item_usage_total += a_data[0]
-                item_value_total += a_data[1]
-
-            if item_usage_total == 0:
-                continue
-
-            item_avg = (
-                item_value_total / item_usage_total
-                if item_usage_total > 0
-                else Decimal("0")
-            )
 
-            dept_items.append(
-                {
-                    "itemsku": base["itemsku"],
-                    "item": base["item"],
-                    "area_usage": area_usage,
-                    "area_value": area_value,
-                    "total_usage": item_usage_total,
-                    "average_price": item_avg,
-                    "total_value": item_value_total,
-                }
+@app.route("/statistics_usage/<any(area, department, detailed):tab>")
+@login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
+def statistics_usage_tab(tab):
+    """Render one breakdown tab of the usage statistics page as a fragment."""
+    filters = _usage_filters(_usage_warehouses())
+
+    # Runs while the fragment streams, so a query over budget ends the tab
+    # with the notice instead of redirecting the fetch to a full page
+    def _view():
+        frame = usage_frame(
+            _usage_rows(
+                filters,
+                by_area=tab in ("area", "detailed"),
+                by_department=tab in ("department", "detailed"),
             )
+        )
+        return USAGE_TABS[tab](frame, summarize(frame)["skus"])
 
-        if dept_items:
-            dept_items.sort(
-                key=lambda x: (
-                    x["item"].name,
-                    x["itemsku"].brand,
-                    x["itemsku"].spec,
-                )
-            )
-            detailed_by_dept[dept.id] = dept_items
+    areas = Area.query.order_by(Area.id).all() if tab in ("area", "detailed") else []
+    departments = (
+        Department.query.order_by(Department.id).all()
+        if tab in ("department", "detailed")
+        else []
+    )
 
-    return render_template(
-        "statistics_usage.html.jinja",
-        warehouses=warehouses,
-        warehouse_id=warehouse_id,
-        start_date=start_date,
-        end_date=end_date,
-        usage_data=usage_data,
-        current_year=current_year,
-        current_month=current_month,
-        item_names=item_names,
-        item_name=item_name,
-        brand=brand,
-        spec=spec,
-        total_quantity=total_quantity,
-        total_value=total_value,
-        tool_only=tool_only,
+    return stream_page(
+        "statistics_usage_tab.html.jinja",
+        tab=tab,
         areas=areas,
         departments=departments,
-        area_list=area_list,
-        dept_list=dept_list,
-        detailed_by_dept=detailed_by_dept,
+        view=Deferred(_view),
     )
 
 
 @app.route("/records/export")
 @login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
 def records_export():
     # Get filter parameters from request - same as records route
     record_type = request.args.get("type", "stockout")
@@ -872,14 +890,14 @@ def records_export():
         )
 
     # Filter out revoked receipts
-    query = query.filter(Receipt.revoked.is_(False))
+    query = query.filter(Transaction.revoked.is_(False))
 
     if record_type == "stockin":
-        query = query.filter(Receipt.type == ReceiptType.STOCKIN)
+        query = query.filter(Transaction.type == ReceiptType.STOCKIN)
     elif record_type == "takestock":
-        query = query.filter(Receipt.type == ReceiptType.TAKESTOCK)
+        query = query.filter(Transaction.type == ReceiptType.TAKESTOCK)
     else:
-        query = query.filter(Receipt.type == ReceiptType.STOCKOUT)
+        query = query.filter(Transaction.type == ReceiptType.STOCKOUT)
         if location_info:
             query = query.filter(
                 (Area.name.ilike(f"%{location_info}%"))
@@ -894,17 +912,17 @@ def records_export():
                 warehouse_id = None
 
         if warehouse_id:
-            query = query.filter(Receipt.warehouse_id == warehouse_id)
+            query = query.filter(Transaction.warehouse_id == warehouse_id)
 
     if start_date:
         start_datetime = datetime.strptime(
             f"{start_date} 00:00:00", "%Y-%m-%d %H:%M:%S"
         )
-        query = query.filter(Receipt.date >= start_datetime)
+        query = query.filter(Transaction.date >= start_datetime)
 
     if end_date:
         end_datetime = datetime.strptime(f"{end_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
-        query = query.filter(Receipt.date <= end_datetime)
+        query = query.filter(Transaction.date <= end_datetime)
 
     if refcode and record_type == "stockin":
         query = query.filter(Receipt.refcode.ilike(f"%{refcode}%"))
@@ -918,17 +936,22 @@ def records_export():
             | (ItemSKU.spec.ilike(f"%{sku_desc}%"))
         )
 
-    # Execute query and convert to pandas DataFrame
+    # Execute query and load the row tuples straight into a DataFrame
     results = query.all()
-    df = pd.DataFrame([r._asdict() for r in results])
+    df = (
+        pd.DataFrame.from_records(
+            results, columns=[c["name"] for c in query.column_descriptions]
+        )
+        if results
+        else pd.DataFrame()
+    )
 
     if not df.empty:
-        # Format the data
+        # Format the data, column at a time
         df["date"] = df["date"].dt.strftime("%Y-%m-%d %H:%M")
-        df["count"] = df.apply(
-            lambda x: x["count"] if record_type == "stockin" else -x["count"], axis=1
-        )
-        df["price"] = df["price"].apply(lambda x: "{:.2f}".format(float(x)))
+        if record_type != "stockin":
+            df["count"] = -df["count"]
+        df["price"] = df["price"].map("{:.2f}".format)
 
         # Select and rename columns based on record type
         if record_type == "stockin":
@@ -997,17 +1020,62 @@ def records_export():
     )
 
 
+def _can_revoke_receipt(warehouse_owner_id: int, receipt_date: datetime) -> bool:
+    # Admin can revoke any receipt
+    if current_user.is_admin:
+        return True
+    # Regular users can only revoke receipts in their warehouse and within 24h
+    time_limit = datetime.now() - timedelta(hours=24)
+    return warehouse_owner_id == current_user.id and receipt_date >= time_limit
+
+
+def _receipt_detail_state(receipt_id):
+    """Mutable fields the receipt detail page depends on, read in one query.
+
+    Returns None when the receipt is missing or hidden from the current user,
+    so the view itself answers with the 404 or the access-denied redirect.
+    """
+    row = (
+        db.session.query(
+            Receipt.revoked,
+            Receipt.note,
+            Receipt.line_count,
+            Receipt.total_value,
+            Receipt.date,
+            Warehouse.is_public,
+            Warehouse.owner_id,
+        )
+        .join(Warehouse, Receipt.warehouse_id == Warehouse.id)
+        .filter(Receipt.id == receipt_id)
+        .first()
+    )
+    if row is None:
+        return None
+    revoked, note, line_count, total_value, date, is_public, owner_id = row
+    if not (
+        current_user.can_view_all_warehouses or is_public or owner_id == current_user.id
+    ):
+        return None
+    return [
+        revoked,
+        note,
+        line_count,
+        str(total_value),
+        # The revoke button disappears once the 24h window has passed
+        _can_revoke_receipt(owner_id, date),
+        app.config.get("MANUAL_RECEIPT_DATE", False),
+    ]
+
+
 @app.route("/receipt/<int:receipt_id>")
 @login_required
+@cached_document(_receipt_detail_state)
 def receipt_detail(receipt_id):
     """Show receipt details and provide revocation interface if applicable"""
-    # Get receipt with all relationships loaded
+    # Get the receipt header; lines are paged separately
     receipt = (
         db.session.query(Receipt)
         .options(
-            joinedload(Receipt.transactions)
-            .joinedload(Transaction.itemSKU)
-            .joinedload(ItemSKU.item),
             joinedload(Receipt.warehouse),
             joinedload(Receipt.operator),
             joinedload(Receipt.area),
@@ -1018,27 +1086,16 @@ def receipt_detail(receipt_id):
     )
 
     # Check if user has access to this receipt's warehouse
-    if not current_user.can_view_all_warehouses:
-        warehouse_accessible = (
-            receipt.warehouse.is_public or receipt.warehouse.owner_id == current_user.id
-        )
-        if not warehouse_accessible:
-            flash("您没有权限查看此单据", "danger")
-            return redirect(url_for("records"))
+    if not _can_view_receipt(receipt):
+        flash("您没有权限查看此单据", "danger")
+        return redirect(url_for("records"))
 
-    # Check if user can revoke this receipt
-    can_revoke = False
-    is_admin = current_user.is_admin
+    # Totals come from Receipt.line_count and Receipt.total_value, which are
+    # kept up to date as lines are added
+    transactions, next_after = _receipt_lines_page(receipt_id)
 
-    # Admin can revoke any receipt
-    if is_admin:
-        can_revoke = True
-    else:
-        # Regular users can only revoke receipts in their warehouse and within 24h
-        time_limit = datetime.now() - timedelta(hours=24)
-        warehouse_owned = receipt.warehouse.owner_id == current_user.id
-        recent_enough = receipt.date >= time_limit
-        can_revoke = warehouse_owned and recent_enough
+    can_revoke = _can_revoke_receipt(receipt.warehouse.owner_id, receipt.date)
+    is_admin = current_user.is_admin
 
     # Create revoke form
     from wms.forms import RevokeReceiptForm
@@ -1049,6 +1106,8 @@ def receipt_detail(receipt_id):
     return render_template(
         "receipt_detail.html.jinja",
         receipt=receipt,
+        transactions=transactions,
+        next_after=next_after,
         can_revoke=can_revoke,
         is_admin=is_admin,
         revoke_form=revoke_form,
@@ -1056,6 +1115,102 @@ def receipt_detail(receipt_id):
     )
 
 
+@app.route("/receipt/<int:receipt_id>/lines")
+@login_required
+def receipt_detail_lines(receipt_id):
+    """Render the next page of receipt detail lines as table rows."""
+    receipt = (
+        db.session.query(Receipt)
+        .options(joinedload(Receipt.warehouse))
+        .filter(Receipt.id == receipt_id)
+        .first_or_404()
+    )
+    if not _can_view_receipt(receipt):
+        return "您没有权限查看此单据", 403
+
+    after = request.args.get("after", 0, type=int)
+    transactions, next_after = _receipt_lines_page(receipt_id, after)
+    return render_template(
+        "receipt_detail_lines.html.jinja",
+        receipt=receipt,
+        transactions=transactions,
+        next_after=next_after,
+    )
+
+
+@posting_job("revoke_receipt")
+def _post_revoke_receipt(payload: dict) -> dict:
+    """Revoke a receipt by posting a counter receipt with opposite lines."""
+    receipt = db.session.get(Receipt, payload["receipt_id"])
+    # Checked again under the write lock so a receipt is never revoked twice
+    if receipt.revoked:
+        raise ValueError("此单据已被撤销")
+    reason = payload["reason"]
+
+    # Prepare the note with revocation reason and operator info
+    revoke_note = f"已撤销：{reason} (由 {payload['operator_nickname']} 操作)"
+    if receipt.note:
+        # Append to existing note if there is one
+        receipt.note = f"{receipt.note}； {revoke_note}"
+    else:
+        receipt.note = revoke_note
+
+    # Mark as revoked
+    receipt.revoked = True
+
+    # Revert inventory changes by creating a counter receipt
+    # Creating a new receipt with opposite transactions for inventory
+    counter_receipt = Receipt(
+        operator_id=payload["operator_id"],
+        warehouse_id=receipt.warehouse_id,
+        type=receipt.type,  # Same type as original
+        area_id=receipt.area_id,
+        department_id=receipt.department_id,
+        location=receipt.location,
+        note=f"撤销单据 {receipt.refcode} 的库存变更：{reason}",
+    )
+
+    if receipt.refcode:
+        counter_receipt.refcode = f"RV-{receipt.refcode}"
+
+    db.session.add(counter_receipt)
+
+    # Create opposite transactions
+    for transaction in receipt.transactions:
+        db.session.add(
+            Transaction(
+                itemSKU_id=transaction.itemSKU_id,
+                count=-transaction.count,  # Opposite of original
+                price=transaction.price,
+                receipt=counter_receipt,
+            )
+        )
+    db.session.flush()
+
+    # Update warehouse inventory with the counter transactions
+    counter_receipt.update_warehouse_item_skus(commit=False)
+    # Mirror the stockin/takestock tool inventory sync for tool SKUs only.
+    if receipt.type in (ReceiptType.STOCKIN, ReceiptType.TAKESTOCK):
+        tool_owner_id = receipt.warehouse.owner_id
+        if tool_owner_id is not None:
+            for transaction in counter_receipt.transactions:
+                sku = db.session.get(ItemSKU, transaction.itemSKU_id)
+                if sku and sku.item.is_tool:
+                    ti = ToolInventory.query.filter_by(
+                        user_id=tool_owner_id, itemSKU_id=sku.id
+                    ).first()
+                    if ti is None:
+                        ti = ToolInventory(
+                            user_id=tool_owner_id,
+                            itemSKU_id=sku.id,
+                            count=0,
+                            pending_scrap=0,
+                        )
+                        db.session.add(ti)
+                    ti.count += transaction.count
+    return {"receipt_id": counter_receipt.id}
+
+
 @app.route("/receipt/<int:receipt_id>/revoke", methods=["POST"])
 @login_required
 def revoke_receipt(receipt_id):
@@ -1095,72 +1250,20 @@ def revoke_receipt(receipt_id):
         flash("请提供撤销原因", "danger")
         return redirect(url_for("receipt_detail", receipt_id=receipt_id))
 
-    # Prepare the note with revocation reason and operator info
-    revoke_note = f"已撤销：{reason} (由 {current_user.nickname} 操作)"
-    if receipt.note:
-        # Append to existing note if there is one
-        receipt.note = f"{receipt.note}； {revoke_note}"
-    else:
-        receipt.note = revoke_note
-
-    # Mark as revoked
-    receipt.revoked = True
-
-    # Revert inventory changes by creating a counter receipt
-    # Creating a new receipt with opposite transactions for inventory
-    counter_receipt = Receipt(
-        operator=current_user,
-        warehouse_id=receipt.warehouse_id,
-        type=receipt.type,  # Same type as original
-        area_id=receipt.area_id,
-        department_id=receipt.department_id,
-        location=receipt.location,
-        note=f"撤销单据 {receipt.refcode} 的库存变更：{reason}",
-    )
-
-    if receipt.refcode:
-        counter_receipt.refcode = f"RV-{receipt.refcode}"
-
-    db.session.add(counter_receipt)
-    db.session.flush()  # To get the counter receipt ID
-
-    # Create opposite transactions
-    for transaction in receipt.transactions:
-        counter_transaction = Transaction(
-            itemSKU_id=transaction.itemSKU_id,
-            count=-transaction.count,  # Opposite of original
-            price=transaction.price,
-            receipt_id=counter_receipt.id,
-        )
-        db.session.add(counter_transaction)
-
     try:
-        db.session.commit()
-        # Update warehouse inventory with the counter transactions
-        counter_receipt.update_warehouse_item_skus()
-        # Mirror the stockin/takestock tool inventory sync for tool SKUs only.
-        if receipt.type in (ReceiptType.STOCKIN, ReceiptType.TAKESTOCK):
-            tool_owner_id = receipt.warehouse.owner_id
-            if tool_owner_id is not None:
-                for transaction in counter_receipt.transactions:
-                    sku = db.session.get(ItemSKU, transaction.itemSKU_id)
-                    if sku and sku.item.is_tool:
-                        ti = ToolInventory.query.filter_by(
-                            user_id=tool_owner_id, itemSKU_id=sku.id
-                        ).first()
-                        if ti is None:
-                            ti = ToolInventory(
-                                user_id=tool_owner_id,
-                                itemSKU_id=sku.id,
-                                count=0,
-                                pending_scrap=0,
-                            )
-                            db.session.add(ti)
-                        ti.count += transaction.count
-        db.session.commit()
+        submit(
+            "revoke_receipt",
+            {
+                "receipt_id": receipt_id,
+                "operator_id": current_user.id,
+                "operator_nickname": current_user.nickname,
+                "reason": reason,
+            },
+        )
         flash("单据已成功撤销", "success")
-    except Exception as e:
-        db.session.rollback()
+    except PostingBusyError as e:
+        flash(str(e), "danger")
+    except ValueError as e:
         flash(f"撤销单据时出错: {str(e)}", "danger")
 
     return redirect(url_for("receipt_detail", receipt_id=receipt_id))
@@ -1,14 +1,15 @@
 """Tool management routes: requisition, exchange/return, scrap, and print confirmation."""
 
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, send_file
 from flask_login import login_required, current_user
 from wms import app, db
-from sqlalchemy import or_, and_
-from sqlalchemy.orm import joinedload
+from sqlalchemy import case, func, insert, or_, and_
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 from wms.models import (
     Employee,
     EmployeeToolHolding,
     ToolInventory,
+    ToolExchangeRollup,
     ToolReceipt,
     ToolReceiptType,
     ToolTransaction,
@@ -23,9 +24,24 @@ from wms.models import (
     Department,
     User,
 )
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from io import BytesIO
 from types import SimpleNamespace
-from wms.utils import tool_receipt_view_required
+from wms.utils import stream_page, tool_receipt_view_required
+from wms.cache import cached_document, cached_report
+from wms.posting import posting_view
+from wms.readonly import read_only_view
+from wms.admission import heavy_request
+from wms.budget import query_budget
+from wms.tool_statistics import (
+    MOVEMENT_TYPES,
+    OUTLIER_FACTOR,
+    OUTLIER_MIN_PIECES,
+    exchange_frequency,
+    tool_report_frame,
+    tool_report_totals,
+    write_tool_report_xlsx,
+)
 
 
 def _get_or_create_area(name: str) -> Area:
@@ -128,6 +144,40 @@ def _get_tool_inv(user_id: int, sku_id: int) -> "ToolInventory | None":
     """Return ToolInventory row for the given group user and SKU, or None."""
     return ToolInventory.query.filter_by(user_id=user_id, itemSKU_id=sku_id).first()
 
+
+def _tool_inv_map(user_id: int, sku_ids) -> "dict[int, ToolInventory]":
+    """Return the group's ToolInventory rows for ``sku_ids`` keyed by SKU id."""
+    if not sku_ids:
+        return {}
+    rows = ToolInventory.query.filter(
+        ToolInventory.user_id == user_id, ToolInventory.itemSKU_id.in_(set(sku_ids))
+    ).all()
+    return {row.itemSKU_id: row for row in rows}
+
+
+def _holding_map(employee_id: int, sku_ids) -> "dict[int, EmployeeToolHolding]":
+    """Return the employee's holdings for ``sku_ids`` keyed by SKU id."""
+    if not sku_ids:
+        return {}
+    rows = EmployeeToolHolding.query.filter(
+        EmployeeToolHolding.employee_id == employee_id,
+        EmployeeToolHolding.itemSKU_id.in_(set(sku_ids)),
+    ).all()
+    return {row.itemSKU_id: row for row in rows}
+
+
+def _sku_map(sku_ids) -> "dict[int, ItemSKU]":
+    """Return ItemSKU rows with their items for ``sku_ids`` keyed by id."""
+    if not sku_ids:
+        return {}
+    rows = (
+        ItemSKU.query.options(joinedload(ItemSKU.item))
+        .filter(ItemSKU.id.in_(set(sku_ids)))
+        .all()
+    )
+    return {row.id: row for row in rows}
+
+
 # use centralized helpers in `wms.utils` (user_can_view_tool_receipt, tool_receipt_view_required)
 
 
@@ -144,11 +194,19 @@ def _tool_receipt_scope_query(query, user_id: int):
     )
 
 
+def _mark_tool_receipts_printed(receipt_ids, scope_user_id: int) -> int:
+    """Mark the selected slips of the scoped user printed; returns the count."""
+    return _tool_receipt_scope_query(
+        ToolReceipt.query.filter(ToolReceipt.id.in_(receipt_ids)), scope_user_id
+    ).update({"printed": True}, synchronize_session="fetch")
+
+
 # ---------------------------------------------------------------------------
 # Tool requisition (工具领用)
 # ---------------------------------------------------------------------------
 @app.route("/tools/requisition", methods=["GET", "POST"])
 @login_required
+@posting_view
 def tool_requisition():
     """Issue tools to an employee."""
     scope_users, scope_user_id = _resolve_scope_user_id(
@@ -183,19 +241,24 @@ def tool_requisition():
             flash("所选员工不属于当前查看用户，请切换用户后再提交。", "danger")
             return redirect(url_for("tool_requisition", user_id=scope_user_id))
 
+        # Prefetch inventory, holdings and SKUs for every selected tool
+        ti_map = _tool_inv_map(scope_user_id, selected_skus)
+        holding_map = _holding_map(employee_id, selected_skus)
+        sku_map = _sku_map(selected_skus)
+
         # Validate quantities and check stock
         errors = []
         for sku_id in selected_skus:
             qty = quantities.get(sku_id, 1)
             if qty <= 0:
-                sku = db.session.get(ItemSKU, sku_id)
+                sku = sku_map[sku_id]
                 errors.append(
                     f"{sku.item.name} {sku.spec} 领用数量必须大于 0（当前: {qty}）"
                 )
                 continue
-            ti = _get_tool_inv(scope_user_id, sku_id)
+            ti = ti_map.get(sku_id)
             if not ti or ti.count < qty:
-                sku = db.session.get(ItemSKU, sku_id)
+                sku = sku_map[sku_id]
                 errors.append(
                     f"{sku.item.name} {sku.spec} 库内余量不足（余量: {ti.count if ti else 0}，申领: {qty}）"
                 )
@@ -216,13 +279,11 @@ def tool_requisition():
 
         for sku_id in selected_skus:
             qty = quantities.get(sku_id, 1)
-            ti = _get_tool_inv(scope_user_id, sku_id)
+            ti = ti_map[sku_id]
             # Deduct from tool inventory
             ti.count -= qty
             # Update employee holdings
-            holding = EmployeeToolHolding.query.filter_by(
-                employee_id=employee_id, itemSKU_id=sku_id
-            ).first()
+            holding = holding_map.get(sku_id)
             if holding:
                 holding.count += qty
             else:
@@ -230,6 +291,7 @@ def tool_requisition():
                     employee_id=employee_id, itemSKU_id=sku_id, count=qty
                 )
                 db.session.add(holding)
+                holding_map[sku_id] = holding
             # Add transaction line
             db.session.add(
                 ToolTransaction(
@@ -263,11 +325,151 @@ def tool_requisition():
     )
 
 
+# Cells accepted by one bulk issuance (employees × tools)
+TOOL_BULK_ISSUE_LIMIT = 2000
+
+
+def _bulk_issue_quantities() -> tuple[dict[tuple[int, int], int], list[str]]:
+    """Parse the ``qty_<employee>_<sku>`` cells of the bulk issuance matrix."""
+    quantities: dict[tuple[int, int], int] = {}
+    errors = []
+    for key, value in request.form.items():
+        parts = key.split("_")
+        if len(parts) != 3 or parts[0] != "qty" or not value.strip():
+            continue
+        try:
+            employee_id, sku_id, qty = int(parts[1]), int(parts[2]), int(value)
+        except ValueError:
+            errors.append(f"领用数量无效：{value}")
+            continue
+        if qty < 0:
+            errors.append(f"领用数量不能为负数（当前: {qty}）")
+        elif qty:
+            quantities[(employee_id, sku_id)] = qty
+    return quantities, errors
+
+
+@app.route("/tools/requisition/bulk", methods=["GET", "POST"])
+@login_required
+@posting_view
+def tool_requisition_bulk():
+    """Issue tools to many employees of one group at once."""
+    scope_users, scope_user_id = _resolve_scope_user_id(
+        "form" if request.method == "POST" else "args"
+    )
+
+    if request.method == "POST":
+        if current_user.is_auditor:
+            flash("审核员仅可按用户查看工具领用数据，不可提交。", "danger")
+            return redirect(url_for("tool_requisition_bulk", user_id=scope_user_id))
+
+        quantities, errors = _bulk_issue_quantities()
+        if not errors and not quantities:
+            errors.append("请至少填写一个领用数量。")
+        if len(quantities) > TOOL_BULK_ISSUE_LIMIT:
+            errors.append(f"一次最多办理 {TOOL_BULK_ISSUE_LIMIT} 项领用。")
+        if errors:
+            for e in errors:
+                flash(e, "danger")
+            return redirect(url_for("tool_requisition_bulk", user_id=scope_user_id))
+
+        # Prefetch the employees and the group's inventory for the whole matrix
+        employee_ids = {employee_id for employee_id, _ in quantities}
+        sku_ids = {sku_id for _, sku_id in quantities}
+        employees = Employee.query.filter(
+            Employee.id.in_(employee_ids),
+            Employee.user_id == scope_user_id,
+            Employee.is_resigned.is_(False),
+        ).all()
+        if len(employees) != len(employee_ids):
+            flash("所选员工不属于当前查看用户或已离职，请刷新后重试。", "danger")
+            return redirect(url_for("tool_requisition_bulk", user_id=scope_user_id))
+        ti_map = _tool_inv_map(scope_user_id, sku_ids)
+        sku_map = _sku_map(sku_ids)
+
+        # Check stock against the total issued per tool
+        totals: dict[int, int] = {}
+        for (_, sku_id), qty in quantities.items():
+            totals[sku_id] = totals.get(sku_id, 0) + qty
+        for sku_id, total in totals.items():
+            ti = ti_map.get(sku_id)
+            if not ti or ti.count < total:
+                sku = sku_map.get(sku_id)
+                name = f"{sku.item.name} {sku.spec}" if sku else f"工具 {sku_id}"
+                errors.append(
+                    f"{name} 库内余量不足（余量: {ti.count if ti else 0}，申领合计: {total}）"
+                )
+        if errors:
+            for e in errors:
+                flash(e, "danger")
+            return redirect(url_for("tool_requisition_bulk", user_id=scope_user_id))
+
+        # One slip per employee, all written with bulk inserts
+        now = datetime.now()
+        ordered = sorted(employees, key=lambda e: e.employee_id)
+        receipt_ids = db.session.scalars(
+            insert(ToolReceipt).returning(ToolReceipt.id, sort_by_parameter_order=True),
+            [
+                {
+                    "type": ToolReceiptType.REQUISITION,
+                    "employee_id": emp.id,
+                    "operator_id": current_user.id,
+                    "date": now,
+                    "printed": False,
+                }
+                for emp in ordered
+            ],
+        ).all()
+        receipt_map = {emp.id: rid for emp, rid in zip(ordered, receipt_ids)}
+        db.session.execute(
+            insert(ToolTransaction),
+            [
+                {
+                    "tool_receipt_id": receipt_map[employee_id],
+                    "itemSKU_id": sku_id,
+                    "count": qty,
+                    "employee_id": employee_id,
+                }
+                for (employee_id, sku_id), qty in sorted(quantities.items())
+            ],
+        )
+        EmployeeToolHolding.add_counts(quantities)
+        for sku_id, total in totals.items():
+            ti_map[sku_id].count -= total
+
+        db.session.commit()
+        flash(f"已成功为 {len(ordered)} 名员工办理工具领用。", "success")
+        return redirect(url_for("tool_print", user_id=scope_user_id))
+
+    tool_inventory = (
+        ToolInventory.query.join(ItemSKU)
+        .join(Item)
+        .options(contains_eager(ToolInventory.itemSKU).contains_eager(ItemSKU.item))
+        .filter(ToolInventory.user_id == scope_user_id, ToolInventory.count > 0)
+        .order_by(Item.name)
+        .all()
+    )
+    employees = (
+        Employee.query.filter_by(user_id=scope_user_id, is_resigned=False)
+        .order_by(Employee.employee_id)
+        .all()
+    )
+    return render_template(
+        "tool_requisition_bulk.html.jinja",
+        tool_inventory=tool_inventory,
+        employees=employees,
+        can_operate=not current_user.is_auditor,
+        scope_users=scope_users,
+        selected_scope_user_id=scope_user_id,
+    )
+
+
 # ---------------------------------------------------------------------------
 # Tool exchange / return for a specific employee (工具更换/归还)
 # ---------------------------------------------------------------------------
 @app.route("/tools/employee/<int:employee_id>", methods=["GET", "POST"])
 @login_required
+@posting_view
 def tool_employee_detail(employee_id):
     """Exchange or return tools for a specific employee."""
     emp = db.session.get(Employee, employee_id)
@@ -295,23 +497,26 @@ def tool_employee_detail(employee_id):
             flash("请至少选择一种工具。", "danger")
             return redirect(url_for("tool_employee_detail", employee_id=employee_id))
 
-        # Validate quantities against holdings
+        # Prefetch inventory, holdings and SKUs for every selected tool
         inv_user_id = emp.user_id
+        ti_map = _tool_inv_map(inv_user_id, selected_skus)
+        holding_map = _holding_map(employee_id, selected_skus)
+        sku_map = _sku_map(selected_skus)
+
+        # Validate quantities against holdings
         errors = []
         for sku_id in selected_skus:
             qty = quantities.get(sku_id, 1)
-            holding = EmployeeToolHolding.query.filter_by(
-                employee_id=employee_id, itemSKU_id=sku_id
-            ).first()
+            holding = holding_map.get(sku_id)
             if not holding or holding.count < qty:
-                sku = db.session.get(ItemSKU, sku_id)
+                sku = sku_map[sku_id]
                 errors.append(
                     f"{sku.item.name} {sku.spec} 员工持有数量不足（持有: {holding.count if holding else 0}，操作: {qty}）"
                 )
             if action == "exchange":
-                ti = _get_tool_inv(inv_user_id, sku_id)
+                ti = ti_map.get(sku_id)
                 if not ti or ti.count < qty:
-                    sku = db.session.get(ItemSKU, sku_id)
+                    sku = sku_map[sku_id]
                     errors.append(
                         f"{sku.item.name} {sku.spec} 库内余量不足，无法更换（余量: {ti.count if ti else 0}，申请: {qty}）"
                     )
@@ -335,10 +540,8 @@ def tool_employee_detail(employee_id):
 
         for sku_id in selected_skus:
             qty = quantities.get(sku_id, 1)
-            ti = _get_tool_inv(inv_user_id, sku_id)
-            holding = EmployeeToolHolding.query.filter_by(
-                employee_id=employee_id, itemSKU_id=sku_id
-            ).first()
+            ti = ti_map.get(sku_id)
+            holding = holding_map[sku_id]
 
             if action == "return":
                 # Return to inventory, decrease employee holding
@@ -359,6 +562,12 @@ def tool_employee_detail(employee_id):
                 )
             )
 
+        if action == "exchange":
+            exchanged: dict[int, int] = {}
+            for sku_id in selected_skus:
+                exchanged[sku_id] = exchanged.get(sku_id, 0) + quantities.get(sku_id, 1)
+            ToolExchangeRollup.record(employee_id, tool_receipt.date.date(), exchanged)
+
         db.session.commit()
         flash(
             f"已成功为员工 {emp.name} 办理工具{'更换' if action == 'exchange' else '归还'}。",
@@ -398,8 +607,168 @@ def tool_employee_detail(employee_id):
 # ---------------------------------------------------------------------------
 # Tool scrap (工具报废)
 # ---------------------------------------------------------------------------
+def _confirm_scrap_requests(request_ids: list[int]) -> tuple[int, list[str]]:
+    """Post the stock-outs for a batch of scrap requests and confirm them.
+
+    Requests, tool inventory, warehouse stock and SKUs for the whole batch are
+    loaded up front. Each request is validated against that in-memory state
+    (including what earlier requests in the batch already took) before any of
+    it is applied, so a failing request is skipped without touching the
+    others, and the batch is committed once. Returns the number of confirmed
+    requests and the error messages of the skipped ones.
+    """
+    requests = (
+        ToolReceipt.query.options(selectinload(ToolReceipt.transactions))
+        .filter(
+            ToolReceipt.id.in_(request_ids),
+            ToolReceipt.type == ToolReceiptType.SCRAP,
+            ToolReceipt.receipt_id.is_(None),
+        )
+        .order_by(ToolReceipt.id)
+        .all()
+    )
+    if not requests:
+        return 0, []
+
+    target_ids = {req.target_user_id or req.operator_id for req in requests}
+    sku_ids = {tx.itemSKU_id for req in requests for tx in req.transactions}
+    users = {u.id: u for u in User.query.filter(User.id.in_(target_ids)).all()}
+    ti_map = (
+        {
+            (ti.user_id, ti.itemSKU_id): ti
+            for ti in ToolInventory.query.filter(
+                ToolInventory.user_id.in_(target_ids),
+                ToolInventory.itemSKU_id.in_(sku_ids),
+            ).all()
+        }
+        if sku_ids
+        else {}
+    )
+    # Stock rows in every warehouse, updated in memory as requests are applied
+    stock: dict[tuple[int, int], WarehouseItemSKU] = {}
+    stock_by_sku: dict[int, list[WarehouseItemSKU]] = {}
+    if sku_ids:
+        for wis in (
+            WarehouseItemSKU.query.options(joinedload(WarehouseItemSKU.warehouse))
+            .filter(WarehouseItemSKU.itemSKU_id.in_(sku_ids))
+            .order_by(WarehouseItemSKU.warehouse_id)
+            .all()
+        ):
+            stock[(wis.warehouse_id, wis.itemSKU_id)] = wis
+            stock_by_sku.setdefault(wis.itemSKU_id, []).append(wis)
+    sku_map = _sku_map(sku_ids)
+    # Used when no warehouse holds a SKU: current user's warehouse or public
+    fallback_warehouse = (
+        current_user.warehouse or Warehouse.query.filter_by(is_public=True).first()
+    )
+    area = _get_or_create_area("班组")
+    dept = _get_or_create_department("设备管理科")
+    batch_start = datetime.now()
+    posted = 0
+
+    def resolve_warehouse(sku_id: int, target_user_id: int) -> Warehouse | None:
+        # Prefer the target user's own warehouse among those holding stock
+        candidates = [w for w in stock_by_sku.get(sku_id, []) if w.count > 0]
+        for c in candidates:
+            if c.warehouse and c.warehouse.owner_id == target_user_id:
+                return c.warehouse
+        if candidates:
+            return candidates[0].warehouse
+        return fallback_warehouse
+
+    def stock_error(warehouse: Warehouse, sku_id: int, count: int) -> str | None:
+        sku = sku_map.get(sku_id)
+        label = f"{sku.item.name} {sku.brand} {sku.spec}" if sku else "Unknown"
+        wis = stock.get((warehouse.id, sku_id))
+        if wis is None:
+            return f"物品不存在于仓库: {label} 不在 {warehouse.name} 仓库中"
+        if wis.count < count:
+            return (
+                f"库存不足: {label} 在 {warehouse.name} 仓库中库存为 {wis.count}, "
+                f"无法扣减 {count} 件"
+            )
+        return None
+
+    confirmed = 0
+    errors: list[str] = []
+    for req in requests:
+        target_user_id = req.target_user_id or req.operator_id
+        target_user = users.get(target_user_id)
+        if not target_user:
+            continue
+
+        # Validate every line before applying anything
+        warehouses: dict[int, Warehouse] = {}
+        warehouse_transactions: dict[int, dict[int, int]] = {}
+        error = None
+        for tx in req.transactions:
+            ti = ti_map.get((target_user_id, tx.itemSKU_id))
+            if not ti or ti.pending_scrap < tx.count:
+                error = f"申请单 #{req.id} 的待报废数量发生变化，请让班组重新提交。"
+                break
+            warehouse = resolve_warehouse(tx.itemSKU_id, target_user_id)
+            if not warehouse:
+                error = f"申请单 #{req.id} 无法定位仓库。"
+                break
+            warehouses[warehouse.id] = warehouse
+            items = warehouse_transactions.setdefault(warehouse.id, {})
+            items[tx.itemSKU_id] = items.get(tx.itemSKU_id, 0) + int(tx.count)
+        if error is None:
+            for warehouse_id, items in warehouse_transactions.items():
+                for sku_id, scrap_count in items.items():
+                    reason = stock_error(warehouses[warehouse_id], sku_id, scrap_count)
+                    if reason:
+                        error = f"申请单 #{req.id} 确认失败: {reason}"
+                        break
+                if error:
+                    break
+        if error:
+            errors.append(error)
+            continue
+
+        last_receipt = None
+        for warehouse_id, items in warehouse_transactions.items():
+            # Offset the batch timestamp so refcodes stay unique within a batch
+            refcode_time = batch_start + timedelta(microseconds=posted)
+            posted += 1
+            wh_receipt = Receipt(
+                operator_id=current_user.id,
+                refcode=f"SCRAP-{refcode_time.strftime('%Y%m%d%H%M%S%f')}",
+                warehouse_id=warehouse_id,
+                type=ReceiptType.STOCKOUT,
+                area_id=area.id,
+                department_id=dept.id,
+                location=target_user.nickname,
+                note=f"工具报废（审核确认，申请单#{req.id}）",
+                is_tool=True,
+            )
+            for sku_id, scrap_count in items.items():
+                wis = stock[(warehouse_id, sku_id)]
+                wh_receipt.transactions.append(
+                    Transaction(
+                        itemSKU_id=sku_id,
+                        count=-scrap_count,
+                        price=wis.average_price,
+                    )
+                )
+                wis.count -= scrap_count
+                ti_map[(target_user_id, sku_id)].pending_scrap -= scrap_count
+            db.session.add(wh_receipt)
+            last_receipt = wh_receipt
+
+        req.receipt = last_receipt
+        req.confirmed_by_id = current_user.id
+        req.confirmed_at = datetime.now()
+        req.printed = True
+        confirmed += 1
+
+    db.session.commit()
+    return confirmed, errors
+
+
 @app.route("/tools/scrap", methods=["GET", "POST"])
 @login_required
+@posting_view
 def tool_scrap():
     """Users submit scrap requests; auditors/admins review and confirm them."""
     # Auditor/admin review queue
@@ -412,145 +781,9 @@ def tool_scrap():
                 flash("请至少选择一张报废申请单。", "danger")
                 return redirect(url_for("tool_scrap"))
 
-            confirmed = 0
-            for request_id in selected_request_ids:
-                req = db.session.get(ToolReceipt, request_id)
-                if (
-                    not req
-                    or req.type != ToolReceiptType.SCRAP
-                    or req.receipt_id is not None
-                ):
-                    continue
-
-                target_user_id = req.target_user_id or req.operator_id
-                target_user = db.session.get(User, target_user_id)
-                if not target_user:
-                    continue
-
-                area = _get_or_create_area("班组")
-                dept = _get_or_create_department("设备管理科")
-                location = target_user.nickname
-
-                warehouse_transactions: dict[int, list[tuple[int, int]]] = {}
-                valid = True
-                # Prefetch ToolInventory and WarehouseItemSKU rows to avoid N+1 queries
-                sku_ids = [tx.itemSKU_id for tx in req.transactions]
-                ti_rows = (
-                    ToolInventory.query.filter(
-                        ToolInventory.user_id == target_user_id,
-                        ToolInventory.itemSKU_id.in_(sku_ids),
-                    ).all()
-                    if sku_ids
-                    else []
-                )
-                ti_map = {t.itemSKU_id: t for t in ti_rows}
-
-                # Prefetch WarehouseItemSKU rows (include warehouse relationship)
-                wis_rows = (
-                    WarehouseItemSKU.query.options(
-                        joinedload(WarehouseItemSKU.warehouse)
-                    )
-                    .filter(
-                        WarehouseItemSKU.itemSKU_id.in_(sku_ids),
-                        WarehouseItemSKU.count > 0,
-                    )
-                    .all()
-                    if sku_ids
-                    else []
-                )
-                wis_map: dict[int, list[WarehouseItemSKU]] = {}
-                for w in wis_rows:
-                    wis_map.setdefault(w.itemSKU_id, []).append(w)
-
-                for tx in req.transactions:
-                    ti = ti_map.get(tx.itemSKU_id)
-                    if not ti or ti.pending_scrap < tx.count:
-                        flash(
-                            f"申请单 #{req.id} 的待报废数量发生变化，请让班组重新提交。",
-                            "danger",
-                        )
-                        valid = False
-                        break
-
-                    # Resolve warehouse preferring user's owned warehouse
-                    selected_wh = None
-                    candidates = wis_map.get(tx.itemSKU_id, [])
-                    for c in candidates:
-                        if c.warehouse and c.warehouse.owner_id == target_user_id:
-                            selected_wh = c.warehouse
-                            break
-                    if not selected_wh and candidates:
-                        selected_wh = candidates[0].warehouse
-                    if not selected_wh:
-                        # fallback to current user's warehouse or public warehouse
-                        if current_user.warehouse:
-                            selected_wh = current_user.warehouse
-                        else:
-                            selected_wh = Warehouse.query.filter_by(
-                                is_public=True
-                            ).first()
-
-                    if not selected_wh:
-                        flash(f"申请单 #{req.id} 无法定位仓库。", "danger")
-                        valid = False
-                        break
-
-                    warehouse_transactions.setdefault(selected_wh.id, []).append(
-                        (tx.itemSKU_id, int(tx.count))
-                    )
-
-                if not valid:
-                    continue
-
-                last_receipt_id = None
-                try:
-                    for warehouse_id, items in warehouse_transactions.items():
-                        refcode = f"SCRAP-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-                        wh_receipt = Receipt(
-                            operator_id=current_user.id,
-                            refcode=refcode,
-                            warehouse_id=warehouse_id,
-                            type=ReceiptType.STOCKOUT,
-                            area_id=area.id,
-                            department_id=dept.id,
-                            location=location,
-                            note=f"工具报废（审核确认，申请单#{req.id}）",
-                            is_tool=True,
-                        )
-                        db.session.add(wh_receipt)
-                        db.session.flush()
-                        last_receipt_id = wh_receipt.id
-
-                        for sku_id, scrap_count in items:
-                            wis = WarehouseItemSKU.query.filter_by(
-                                warehouse_id=warehouse_id, itemSKU_id=sku_id
-                            ).first()
-                            price = wis.average_price if wis else 0
-                            db.session.add(
-                                Transaction(
-                                    itemSKU_id=sku_id,
-                                    count=-scrap_count,
-                                    price=price,
-                                    receipt_id=wh_receipt.id,
-                                )
-                            )
-                            ti = _get_tool_inv(target_user_id, sku_id)
-                            ti.pending_scrap -= scrap_count
-
-                        db.session.commit()
-                        wh_receipt.update_warehouse_item_skus()
-                        db.session.commit()
-
-                    req.receipt_id = last_receipt_id
-                    req.confirmed_by_id = current_user.id
-                    req.confirmed_at = datetime.now()
-                    req.printed = True
-                    db.session.commit()
-                    confirmed += 1
-                except ValueError as e:
-                    db.session.rollback()
-                    flash(f"申请单 #{req.id} 确认失败: {e}", "danger")
-
+            confirmed, errors = _confirm_scrap_requests(selected_request_ids)
+            for error in errors:
+                flash(error, "danger")
             if confirmed:
                 flash(f"已确认 {confirmed} 张报废申请单。", "success")
             return redirect(url_for("tool_scrap"))
@@ -664,6 +897,7 @@ def tool_scrap():
 # ---------------------------------------------------------------------------
 @app.route("/tools/print", methods=["GET", "POST"])
 @login_required
+@posting_view
 def tool_print():
     """View and print tool confirmation slips."""
     scope_users, scope_user_id = _resolve_scope_user_id(
@@ -678,11 +912,7 @@ def tool_print():
 
         selected_ids = request.form.getlist("receipt_ids[]", type=int)
         if selected_ids:
-            q = _tool_receipt_scope_query(
-                ToolReceipt.query.filter(ToolReceipt.id.in_(selected_ids)),
-                scope_user_id,
-            )
-            q.update({"printed": True}, synchronize_session="fetch")
+            _mark_tool_receipts_printed(selected_ids, scope_user_id)
             db.session.commit()
             flash(f"已将 {len(selected_ids)} 张单据标记为已打印。", "success")
         return redirect(url_for("tool_print", user_id=scope_user_id))
@@ -691,7 +921,10 @@ def tool_print():
     # Build the scope filter: receipts initiated by or targeted at the scoped user
     scope_filter = or_(
         ToolReceipt.operator_id == scope_user_id,
-        and_(ToolReceipt.type == ToolReceiptType.SCRAP, ToolReceipt.target_user_id == scope_user_id),
+        and_(
+            ToolReceipt.type == ToolReceiptType.SCRAP,
+            ToolReceipt.target_user_id == scope_user_id,
+        ),
     )
 
     # Auditors should also see scrap receipts they personally confirmed
@@ -700,19 +933,101 @@ def tool_print():
     else:
         final_filter = scope_filter
 
-    q = ToolReceipt.query.filter(final_filter)
+    q = ToolReceipt.query.filter(final_filter).options(
+        joinedload(ToolReceipt.employee),
+        joinedload(ToolReceipt.operator),
+        joinedload(ToolReceipt.target_user),
+    )
     pagination = q.order_by(ToolReceipt.date.desc()).paginate(page=page, per_page=20)
+    # Line counts for the whole page in one grouped query
+    page_ids = [tr.id for tr in pagination.items]
+    line_counts = dict(
+        db.session.query(ToolTransaction.tool_receipt_id, func.count())
+        .filter(ToolTransaction.tool_receipt_id.in_(page_ids))
+        .group_by(ToolTransaction.tool_receipt_id)
+        .all()
+    )
     return render_template(
         "tool_print.html.jinja",
         pagination=pagination,
+        line_counts=line_counts,
         scope_users=scope_users,
         selected_scope_user_id=scope_user_id,
     )
 
 
+# Upper bound on slips rendered into one batch print document
+TOOL_PRINT_BATCH_LIMIT = 100
+
+
+@app.route("/tools/batch-print", methods=["GET", "POST"])
+@login_required
+@posting_view
+def tool_print_batch():
+    """Render several tool confirmation slips as one print document.
+
+    Slips, lines, SKUs and people are loaded in a fixed number of queries.
+    A POST with ``mark_printed`` also marks the slips printed in one UPDATE.
+    """
+    source = request.form if request.method == "POST" else request.args
+    selected_ids = list(dict.fromkeys(source.getlist("receipt_ids[]", type=int)))
+    if not selected_ids:
+        flash("请选择要打印的单据。", "warning")
+        return redirect(url_for("tool_print"))
+    if len(selected_ids) > TOOL_PRINT_BATCH_LIMIT:
+        flash(f"一次最多打印 {TOOL_PRINT_BATCH_LIMIT} 张单据。", "warning")
+        return redirect(url_for("tool_print"))
+
+    # Same visibility rule as user_can_view_tool_receipt, applied in SQL
+    visible = ToolReceipt.query.filter(ToolReceipt.id.in_(selected_ids))
+    if not current_user.can_view_all_tool_groups:
+        visible = visible.filter(
+            or_(
+                ToolReceipt.operator_id == current_user.id,
+                ToolReceipt.target_user_id == current_user.id,
+            )
+        )
+
+    if request.method == "POST" and request.form.get("mark_printed"):
+        if current_user.is_auditor:
+            flash("审核员无权修改打印状态。", "danger")
+            return redirect(url_for("tool_print"))
+        # Same rule as marking slips on the tool_print page
+        _, scope_user_id = _resolve_scope_user_id("form", include_current_user=True)
+        marked = _mark_tool_receipts_printed(selected_ids, scope_user_id)
+        db.session.commit()
+        flash(f"已将 {marked} 张单据标记为已打印。", "success")
+
+    tool_receipts = (
+        visible.options(
+            joinedload(ToolReceipt.employee).joinedload(Employee.user),
+            joinedload(ToolReceipt.operator),
+            joinedload(ToolReceipt.target_user),
+            selectinload(ToolReceipt.transactions)
+            .joinedload(ToolTransaction.itemSKU)
+            .joinedload(ItemSKU.item),
+        )
+        .order_by(ToolReceipt.date.desc(), ToolReceipt.id.desc())
+        .all()
+    )
+    return render_template("tool_print_batch.html.jinja", tool_receipts=tool_receipts)
+
+
+def _tool_print_detail_state(receipt_id):
+    """Fields of a posted tool slip that can still change."""
+    # Already loaded by tool_receipt_view_required
+    tool_receipt = db.session.get(ToolReceipt, receipt_id)
+    return [
+        tool_receipt.printed,
+        tool_receipt.confirmed_by_id,
+        tool_receipt.confirmed_at,
+    ]
+
+
 @app.route("/tools/print/<int:receipt_id>")
 @login_required
 @tool_receipt_view_required
+@cached_document(_tool_print_detail_state)
 def tool_print_detail(receipt_id):
     """Preview a single tool confirmation slip."""
     tool_receipt = db.session.get(ToolReceipt, receipt_id)
@@ -721,6 +1036,7 @@ def tool_print_detail(receipt_id):
 
 @app.route("/tools/print/<int:receipt_id>/toggle-printed", methods=["POST"])
 @login_required
+@posting_view
 def tool_print_toggle_printed(receipt_id):
     """Toggle printed status for a single tool confirmation slip."""
     if current_user.is_auditor:
@@ -750,3 +1066,208 @@ def tool_print_toggle_printed(receipt_id):
     else:
         flash("已取消“已打印”状态。", "success")
     return redirect(url_for("tool_print_detail", receipt_id=tool_receipt.id))
+
+
+# ---------------------------------------------------------------------------
+# Tool holdings and consumption report (工具持有/消耗统计)
+# ---------------------------------------------------------------------------
+def _tool_report_filters() -> dict:
+    """Parse the period and crew filters of the tool report."""
+    start_date = request.args.get("start_date", "")
+    end_date = request.args.get("end_date", "")
+    # Default to the current month so far
+    if not start_date and not end_date:
+        today = datetime.now()
+        start_date = today.replace(day=1).strftime("%Y-%m-%d")
+        end_date = today.strftime("%Y-%m-%d")
+    # Crew leaders only see their own crew; others may pick one or all
+    crew_id = request.args.get("user_id", type=int)
+    if not current_user.can_view_all_tool_groups:
+        crew_id = current_user.id
+    return {"start_date": start_date, "end_date": end_date, "crew_id": crew_id}
+
+
+def _tool_report(filters: dict):
+    """Query grouped holdings and movements and pivot them into the report."""
+    holdings = db.session.query(
+        EmployeeToolHolding.employee_id,
+        EmployeeToolHolding.itemSKU_id,
+        EmployeeToolHolding.count,
+    ).filter(EmployeeToolHolding.count > 0)
+    movements = (
+        db.session.query(
+            ToolTransaction.employee_id,
+            ToolTransaction.itemSKU_id,
+            ToolReceipt.type,
+            func.sum(ToolTransaction.count),
+        )
+        .join(ToolReceipt, ToolTransaction.tool_receipt_id == ToolReceipt.id)
+        .filter(
+            ToolReceipt.type.in_([ToolReceiptType[name] for name in MOVEMENT_TYPES])
+        )
+        .group_by(
+            ToolTransaction.employee_id,
+            ToolTransaction.itemSKU_id,
+            ToolReceipt.type,
+        )
+    )
+    if filters["start_date"]:
+        start = datetime.strptime(filters["start_date"], "%Y-%m-%d")
+        movements = movements.filter(ToolReceipt.date >= start)
+    if filters["end_date"]:
+        end = datetime.strptime(filters["end_date"], "%Y-%m-%d") + timedelta(days=1)
+        movements = movements.filter(ToolReceipt.date < end)
+    if filters["crew_id"]:
+        holdings = holdings.join(
+            Employee, EmployeeToolHolding.employee_id == Employee.id
+        ).filter(Employee.user_id == filters["crew_id"])
+        movements = movements.join(
+            Employee, ToolTransaction.employee_id == Employee.id
+        ).filter(Employee.user_id == filters["crew_id"])
+
+    holding_rows = holdings.all()
+    movement_rows = movements.all()
+    return tool_report_frame(
+        holding_rows,
+        movement_rows,
+        *_report_labels(
+            {row[0] for row in holding_rows} | {row[0] for row in movement_rows},
+            {row[1] for row in holding_rows} | {row[1] for row in movement_rows},
+        ),
+    )
+
+
+def _report_labels(employee_ids: set, sku_ids: set) -> tuple[list, list]:
+    """Label rows for the employees and SKUs occurring in a tool report."""
+    employee_rows = (
+        db.session.query(
+            Employee.id, Employee.employee_id, Employee.name, User.nickname
+        )
+        .outerjoin(User, Employee.user_id == User.id)
+        .filter(Employee.id.in_(employee_ids))
+        .all()
+        if employee_ids
+        else []
+    )
+    sku_rows = (
+        db.session.query(ItemSKU.id, Item.name, ItemSKU.brand, ItemSKU.spec)
+        .join(Item, ItemSKU.item_id == Item.id)
+        .filter(ItemSKU.id.in_(sku_ids))
+        .all()
+        if sku_ids
+        else []
+    )
+    return employee_rows, sku_rows
+
+
+@app.route("/tools/report")
+@login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
+def tool_report():
+    """Tool holdings and requisition/exchange/return totals per employee."""
+    filters = _tool_report_filters()
+    frame = _tool_report(filters)
+    return stream_page(
+        "tool_report.html.jinja",
+        rows=frame.itertuples(index=False),
+        row_count=len(frame),
+        totals=tool_report_totals(frame),
+        crews=_tool_scope_users(),
+        **filters,
+    )
+
+
+@app.route("/tools/report/export")
+@login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
+def tool_report_export():
+    """Download the tool report as an Excel file."""
+    filters = _tool_report_filters()
+    frame = _tool_report(filters)
+
+    excel_file = BytesIO()
+    write_tool_report_xlsx(frame, excel_file)
+    excel_file.seek(0)
+    filename = f"tool_report_{filters['start_date']}_{filters['end_date']}.xlsx"
+    return send_file(
+        excel_file,
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        as_attachment=True,
+        download_name=filename,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tool exchange analytics (工具更换频率)
+# ---------------------------------------------------------------------------
+# Rolling windows offered on the page, in days
+EXCHANGE_WINDOWS = (30, 90, 180, 365)
+# Ranking rows shown on the page
+EXCHANGE_RANKING_LIMIT = 100
+
+
+@app.route("/tools/exchanges")
+@login_required
+@cached_report
+@heavy_request
+@read_only_view
+@query_budget
+def tool_exchange_stats():
+    """Exchange frequency per employee and tool, ranked against crew medians."""
+    window = request.args.get("window", 90, type=int)
+    if window not in EXCHANGE_WINDOWS:
+        window = 90
+    crew_id = request.args.get("user_id", type=int)
+    if not current_user.can_view_all_tool_groups:
+        crew_id = current_user.id
+
+    # The window ends today; the one before it is used for the trend
+    since = date.today() - timedelta(days=window - 1)
+    in_window = ToolExchangeRollup.day >= since
+    rows = (
+        db.session.query(
+            ToolExchangeRollup.employee_id,
+            ToolExchangeRollup.itemSKU_id,
+            func.sum(case((in_window, ToolExchangeRollup.pieces), else_=0)),
+            func.sum(case((in_window, ToolExchangeRollup.exchanges), else_=0)),
+            func.sum(case((in_window, 0), else_=ToolExchangeRollup.pieces)),
+        )
+        .filter(ToolExchangeRollup.day >= since - timedelta(days=window))
+        .group_by(ToolExchangeRollup.employee_id, ToolExchangeRollup.itemSKU_id)
+    )
+    roster = db.session.query(Employee.id, Employee.user_id).filter(
+        Employee.is_resigned.is_(False)
+    )
+    if crew_id:
+        rows = rows.join(Employee, ToolExchangeRollup.employee_id == Employee.id)
+        rows = rows.filter(Employee.user_id == crew_id)
+        roster = roster.filter(Employee.user_id == crew_id)
+    rows = rows.all()
+
+    stats = exchange_frequency(
+        rows,
+        roster.all(),
+        *_report_labels({row[0] for row in rows}, {row[1] for row in rows}),
+        window,
+    )
+    ranking = stats["ranking"]
+    return stream_page(
+        "tool_exchange_stats.html.jinja",
+        ranking=ranking.head(EXCHANGE_RANKING_LIMIT).itertuples(index=False),
+        ranking_count=len(ranking),
+        outlier_count=int(ranking["outlier"].sum()),
+        by_tool=stats["by_tool"].itertuples(index=False),
+        window=window,
+        windows=EXCHANGE_WINDOWS,
+        crew_id=crew_id,
+        crews=_tool_scope_users(),
+        ranking_limit=EXCHANGE_RANKING_LIMIT,
+        outlier_factor=OUTLIER_FACTOR,
+        outlier_min_pieces=OUTLIER_MIN_PIECES,
+    )
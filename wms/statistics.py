@@ -0,0 +1,188 @@
+"""Aggregation engine for the usage statistics page.
+
+The page shows the same stock-out data as a per-SKU summary, per-area and
+per-department pivots, and a department × area breakdown. All four views are
+derived from one grouped query returning a row per non-empty
+(SKU, area, department) cell, and pandas does the pivoting, so the work grows
+with the number of cells that actually have data rather than with
+SKUs × areas × departments.
+
+Monetary values are carried as integer cents and only turned back into
+``Decimal`` for the template.
+"""
+
+from decimal import Decimal
+from types import SimpleNamespace
+import pandas as pd
+
+# Column order of the rows passed to usage_frame()
+USAGE_COLUMNS = [
+    "sku_id",
+    "item_id",
+    "item_name",
+    "brand",
+    "spec",
+    "area_id",
+    "department_id",
+    "usage",
+    "cents",
+]
+
+
+def _money(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _average(cents, usage, fallback=None):
+    if usage > 0:
+        return Decimal(int(cents)) / Decimal(int(usage)) / 100
+    return fallback
+
+
+def usage_frame(rows) -> pd.DataFrame:
+    """Load aggregated query rows into a normalized DataFrame."""
+    frame = pd.DataFrame.from_records(list(rows), columns=USAGE_COLUMNS)
+    # NULL area/department become 0, which no real primary key uses
+    for column in ("area_id", "department_id"):
+        frame[column] = frame[column].fillna(0).astype("int64")
+    frame["usage"] = frame["usage"].fillna(0).astype("int64")
+    frame["cents"] = frame["cents"].fillna(0).astype("int64")
+    return frame
+
+
+def _sparse_cells(frame: pd.DataFrame, keys: list[str]) -> dict:
+    """Sum usage per ``keys`` and nest the last key: {(*outer): {last: usage}}."""
+    grouped = frame.groupby(keys, sort=False)["usage"].sum().reset_index()
+    cells: dict = {}
+    outer = zip(*(grouped[k].tolist() for k in keys[:-1]))
+    for prefix, inner, usage in zip(
+        outer, grouped[keys[-1]].tolist(), grouped["usage"].tolist()
+    ):
+        cells.setdefault(prefix, {})[inner] = usage
+    return cells
+
+
+def _totals(frame: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    return frame.groupby(keys, sort=False)[["usage", "cents"]].sum().reset_index()
+
+
+def _pivot_rows(skus, frame, column, usage_key):
+    """Yield one row per SKU broken down by ``column`` (area or department)."""
+    located = frame[frame[column] > 0]
+    cells = _sparse_cells(located, ["sku_id", column])
+    totals = _totals(located, ["sku_id"])
+    totals_map = dict(
+        zip(
+            totals["sku_id"].tolist(),
+            zip(totals["usage"].tolist(), totals["cents"].tolist()),
+        )
+    )
+
+    for sku_id, itemsku, item, average_price in skus:
+        usage, cents = totals_map.get(sku_id, (0, 0))
+        yield {
+            "itemsku": itemsku,
+            "item": item,
+            usage_key: cells.get((sku_id,), {}),
+            "total_usage": usage,
+            "average_price": _average(cents, usage, average_price),
+            "total_value": _money(cents),
+        }
+
+
+def summarize(frame: pd.DataFrame) -> dict:
+    """Per-SKU summary in display order with the overall totals.
+
+    The ``skus`` entry lists ``(sku_id, itemsku, item, average_price)`` in
+    display order and is consumed by the breakdown views below. ``usage_data``
+    is a generator so a streamed page formats rows as it sends them.
+    """
+    summary = (
+        frame.drop_duplicates("sku_id")[
+            ["sku_id", "item_id", "item_name", "brand", "spec"]
+        ]
+        .merge(_totals(frame, ["sku_id"]), on="sku_id")
+        .sort_values(["item_name", "brand", "spec"])
+    )
+    usages = summary["usage"].tolist()
+    cents_list = summary["cents"].tolist()
+    skus = [
+        (
+            sku_id,
+            SimpleNamespace(id=sku_id, brand=brand, spec=spec),
+            SimpleNamespace(id=item_id, name=name),
+            _average(cents, usage),
+        )
+        for sku_id, item_id, name, brand, spec, usage, cents in zip(
+            summary["sku_id"].tolist(),
+            summary["item_id"].tolist(),
+            summary["item_name"].tolist(),
+            summary["brand"].tolist(),
+            summary["spec"].tolist(),
+            usages,
+            cents_list,
+        )
+    ]
+    usage_data = (
+        (itemsku, item, usage, average_price, _money(cents))
+        for (_, itemsku, item, average_price), usage, cents in zip(
+            skus, usages, cents_list
+        )
+    )
+    return {
+        "usage_data": usage_data,
+        "total_quantity": int(summary["usage"].sum()),
+        "total_value": _money(summary["cents"].sum()),
+        "skus": skus,
+    }
+
+
+def area_view(frame: pd.DataFrame, skus: list) -> dict:
+    return {"area_list": _pivot_rows(skus, frame, "area_id", "area_usage")}
+
+
+def department_view(frame: pd.DataFrame, skus: list) -> dict:
+    return {"dept_list": _pivot_rows(skus, frame, "department_id", "dept_usage")}
+
+
+def detailed_view(frame: pd.DataFrame, skus: list) -> dict:
+    """Per-department lists of SKUs broken down by area."""
+    rank = {sku[0]: position for position, sku in enumerate(skus)}
+    sku_by_id = {sku[0]: sku for sku in skus}
+
+    # Department × area cells need both keys
+    located = frame[(frame["area_id"] > 0) & (frame["department_id"] > 0)]
+    cells = _sparse_cells(located, ["department_id", "sku_id", "area_id"])
+    dept_totals = _totals(located, ["department_id", "sku_id"])
+    dept_totals = dept_totals[dept_totals["usage"] != 0]
+    dept_totals = dept_totals.assign(rank=dept_totals["sku_id"].map(rank)).sort_values(
+        ["department_id", "rank"]
+    )
+
+    detailed_by_dept: dict[int, list[dict]] = {}
+    for dept_id, sku_id, usage, cents in zip(
+        dept_totals["department_id"].tolist(),
+        dept_totals["sku_id"].tolist(),
+        dept_totals["usage"].tolist(),
+        dept_totals["cents"].tolist(),
+    ):
+        _, itemsku, item, _ = sku_by_id[sku_id]
+        detailed_by_dept.setdefault(dept_id, []).append(
+            {
+                "itemsku": itemsku,
+                "item": item,
+                "area_usage": cells[(dept_id, sku_id)],
+                "total_usage": usage,
+                "average_price": _average(cents, usage, Decimal("0")),
+                "total_value": _money(cents),
+            }
+        )
+    return {"detailed_by_dept": detailed_by_dept}
+
+
+# Breakdown tabs of the usage page and the view each one renders
+USAGE_TABS = {
+    "area": area_view,
+    "department": department_view,
+    "detailed": detailed_view,
+}
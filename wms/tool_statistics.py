@@ -0,0 +1,205 @@
+"""Aggregation engines for the tool report and the exchange analytics.
+
+The report has one row per (employee, tool SKU) with the pieces currently held
+and the requisitions, exchanges and returns posted in the selected period.
+Holdings and movements arrive as already-grouped query rows, and pandas pivots
+the movement types into columns and lines them up with the holdings, so the
+work grows with the number of (employee, SKU) pairs rather than with the
+number of tool transactions.
+
+The exchange analytics read the daily ToolExchangeRollup and compare each
+employee's exchanges of a tool with the median of their crew.
+"""
+
+from openpyxl import Workbook
+import pandas as pd
+
+# Column order of the rows passed to tool_report_frame()
+HOLDING_COLUMNS = ["employee_id", "sku_id", "held"]
+MOVEMENT_COLUMNS = ["employee_id", "sku_id", "type", "count"]
+EMPLOYEE_COLUMNS = ["employee_id", "employee_no", "employee_name", "crew"]
+SKU_COLUMNS = ["sku_id", "item_name", "brand", "spec"]
+
+# Report column for each ToolReceiptType name that moves tools
+MOVEMENT_TYPES = {
+    "REQUISITION": "requisitioned",
+    "EXCHANGE": "exchanged",
+    "RETURN": "returned",
+}
+QUANTITY_COLUMNS = ["held", *MOVEMENT_TYPES.values()]
+
+TOOL_REPORT_COLUMNS = [
+    "crew",
+    "employee_no",
+    "employee_name",
+    "item_name",
+    "brand",
+    "spec",
+    *QUANTITY_COLUMNS,
+]
+
+# Spreadsheet headers for the XLSX export
+TOOL_REPORT_HEADERS = {
+    "crew": "班组",
+    "employee_no": "工号",
+    "employee_name": "姓名",
+    "item_name": "工具",
+    "brand": "品牌",
+    "spec": "规格",
+    "held": "当前持有",
+    "requisitioned": "领用",
+    "exchanged": "更换",
+    "returned": "归还",
+}
+
+_KEYS = ["employee_id", "sku_id"]
+
+
+def _movement_pivot(movement_rows) -> pd.DataFrame:
+    movements = pd.DataFrame.from_records(list(movement_rows), columns=MOVEMENT_COLUMNS)
+    # Enum members from the query become their names
+    movements["type"] = [getattr(t, "name", t) for t in movements["type"]]
+    pivot = movements.pivot_table(
+        index=_KEYS, columns="type", values="count", aggfunc="sum", fill_value=0
+    )
+    return (
+        pivot.reindex(columns=list(MOVEMENT_TYPES), fill_value=0)
+        .rename(columns=MOVEMENT_TYPES)
+        .reset_index()
+        .rename_axis(columns=None)
+    )
+
+
+def tool_report_frame(
+    holding_rows, movement_rows, employee_rows, sku_rows
+) -> pd.DataFrame:
+    """Build the report from grouped query rows.
+
+    ``holding_rows`` and ``movement_rows`` are tuples in ``HOLDING_COLUMNS``
+    and ``MOVEMENT_COLUMNS`` order, with movements summed per employee, SKU
+    and receipt type. ``employee_rows`` and ``sku_rows`` label the ids that
+    occur. Returns a frame in ``TOOL_REPORT_COLUMNS`` order, sorted by crew,
+    employee and tool, without rows where every quantity is zero.
+    """
+    holdings = pd.DataFrame.from_records(list(holding_rows), columns=HOLDING_COLUMNS)
+    frame = holdings.merge(_movement_pivot(movement_rows), on=_KEYS, how="outer")
+    frame[QUANTITY_COLUMNS] = frame[QUANTITY_COLUMNS].fillna(0).astype("int64")
+    frame = frame[frame[QUANTITY_COLUMNS].ne(0).any(axis=1)]
+
+    employees = pd.DataFrame.from_records(list(employee_rows), columns=EMPLOYEE_COLUMNS)
+    skus = pd.DataFrame.from_records(list(sku_rows), columns=SKU_COLUMNS)
+    frame = frame.merge(employees, on="employee_id", how="left").merge(
+        skus, on="sku_id", how="left"
+    )
+    # Employees without a crew sort last
+    frame = frame.sort_values(["crew", "employee_no", "item_name", "brand", "spec"])
+    frame["crew"] = frame["crew"].fillna("—")
+    return frame[TOOL_REPORT_COLUMNS].reset_index(drop=True)
+
+
+def tool_report_totals(frame: pd.DataFrame) -> dict:
+    """Column totals of the quantity columns."""
+    return {column: int(frame[column].sum()) for column in QUANTITY_COLUMNS}
+
+
+def write_tool_report_xlsx(frame: pd.DataFrame, output) -> None:
+    """Write the report to ``output`` as an XLSX workbook.
+
+    Rows go through a write-only workbook one at a time, which skips the
+    per-cell objects of a regular workbook and is much faster for large
+    reports than ``DataFrame.to_excel``.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("工具统计")
+    sheet.append([TOOL_REPORT_HEADERS[column] for column in TOOL_REPORT_COLUMNS])
+    # tolist() turns numpy scalars into plain Python values
+    for row in zip(*(frame[column].tolist() for column in TOOL_REPORT_COLUMNS)):
+        sheet.append(row)
+    workbook.save(output)
+
+
+# Column order of the rows passed to exchange_frequency()
+EXCHANGE_COLUMNS = ["employee_id", "sku_id", "pieces", "exchanges", "previous"]
+ROSTER_COLUMNS = ["employee_id", "crew_id"]
+
+# Exchanges are reported per 30 days whatever the window
+RATE_DAYS = 30
+# Flag an employee's tool once they exchanged at least this many pieces and
+# at least OUTLIER_FACTOR times the crew median
+OUTLIER_MIN_PIECES = 3
+OUTLIER_FACTOR = 2.0
+
+
+def _crew_medians(frame: pd.DataFrame, roster: pd.DataFrame) -> pd.DataFrame:
+    """Median pieces per (crew, SKU), counting crew members with no exchanges."""
+    medians = []
+    for crew_id, crew in frame.groupby("crew_id", sort=False):
+        members = roster.loc[roster["crew_id"] == crew_id, "employee_id"]
+        grid = crew.pivot_table(
+            index="employee_id", columns="sku_id", values="pieces", aggfunc="sum"
+        ).reindex(members, fill_value=0)
+        median = grid.fillna(0).median().rename("crew_median").reset_index()
+        medians.append(median.assign(crew_id=crew_id))
+    if not medians:
+        return pd.DataFrame(columns=["crew_id", "sku_id", "crew_median"])
+    return pd.concat(medians, ignore_index=True)
+
+
+def exchange_frequency(
+    rows, roster_rows, employee_rows, sku_rows, window_days: int
+) -> dict:
+    """Rank employees' tool exchanges against their crew and sum them per tool.
+
+    ``rows`` are rollup totals in ``EXCHANGE_COLUMNS`` order: pieces and
+    exchange receipts in the window plus pieces in the window before it.
+    ``roster_rows`` lists the active employees in ``ROSTER_COLUMNS`` order;
+    exchanges of anyone else are ignored. ``employee_rows`` and ``sku_rows``
+    label the ids as in tool_report_frame(). Returns ``ranking``
+    (employee × SKU, most abnormal first) and ``by_tool`` (per SKU, most
+    exchanged first).
+    """
+    frame = pd.DataFrame.from_records(list(rows), columns=EXCHANGE_COLUMNS)
+    roster = pd.DataFrame.from_records(list(roster_rows), columns=ROSTER_COLUMNS)
+    frame = frame.merge(roster, on="employee_id")
+    for column in ("pieces", "exchanges", "previous"):
+        frame[column] = frame[column].fillna(0).astype("int64")
+    current = frame[frame["pieces"] > 0]
+
+    ranking = current.merge(
+        _crew_medians(current, roster), on=["crew_id", "sku_id"], how="left"
+    )
+    ranking["crew_median"] = ranking["crew_median"].astype("float64").fillna(0)
+    ranking["rate"] = ranking["pieces"] * RATE_DAYS / window_days
+    ranking["ratio"] = ranking["pieces"] / ranking["crew_median"].clip(lower=1)
+    ranking["outlier"] = (ranking["pieces"] >= OUTLIER_MIN_PIECES) & (
+        ranking["pieces"] >= OUTLIER_FACTOR * ranking["crew_median"]
+    )
+    ranking = ranking.sort_values(
+        ["outlier", "ratio", "pieces"], ascending=False
+    ).reset_index(drop=True)
+
+    by_tool = (
+        frame.assign(active=frame["pieces"] > 0)
+        .groupby("sku_id")
+        .agg(
+            pieces=("pieces", "sum"),
+            exchanges=("exchanges", "sum"),
+            previous=("previous", "sum"),
+            employees=("active", "sum"),
+        )
+        .reset_index()
+    )
+    by_tool = by_tool[(by_tool["pieces"] > 0) | (by_tool["previous"] > 0)]
+    by_tool = by_tool.assign(rate=by_tool["pieces"] * RATE_DAYS / window_days)
+    by_tool = by_tool.sort_values(["pieces", "previous"], ascending=False)
+    by_tool = by_tool.reset_index(drop=True)
+    employees = pd.DataFrame.from_records(list(employee_rows), columns=EMPLOYEE_COLUMNS)
+    skus = pd.DataFrame.from_records(list(sku_rows), columns=SKU_COLUMNS)
+    ranking = ranking.merge(employees, on="employee_id", how="left").merge(
+        skus, on="sku_id", how="left"
+    )
+    ranking["crew"] = ranking["crew"].fillna("—")
+    return {
+        "ranking": ranking,
+        "by_tool": by_tool.merge(skus, on="sku_id", how="left"),
+    }
@@ -1,8 +1,19 @@
 from flask import flash, redirect, url_for
+from flask import Response, current_app, get_flashed_messages, stream_with_context
 from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
 from functools import wraps
+from itertools import chain
+from markupsafe import Markup
 from flask import request
 from wms import db
+from wms.budget import budgeted_stream
+
+# Bytes of rendered HTML collected before each write to the client
+STREAM_CHUNK_SIZE = 16 * 1024
+# Emitted by base.html.jinja after the navigation bar; stream_page sends the
+# page up to here as its first write
+STREAM_FLUSH = Markup("<!-- flush -->")
 
 
 def set_item_tool_status(item, is_tool: bool) -> bool:
@@ -131,6 +142,90 @@ def deny_auditor_write_required(f):
     return decorated_function
 
 
+def _buffered(chunks, size: int = STREAM_CHUNK_SIZE):
+    """Join Jinja's many small fragments into writes of roughly ``size`` chars."""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class Deferred:
+    """Stand-in for a value that is only computed when a template first uses it.
+
+    Pass the queries of a streamed page wrapped in ``Deferred`` so they run
+    while the page is rendered, after its head has already been sent.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, compute):
+        self._compute = compute
+        self._value = self._UNSET
+
+    @property
+    def value(self):
+        if self._value is self._UNSET:
+            self._value = self._compute()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __bool__(self):
+        return bool(self.value)
+
+
+def stream_page(template_name: str, **context) -> Response:
+    """Render a page as a streamed response.
+
+    The head and navigation bar are flushed first, then the filters and rows
+    follow in chunks as they are rendered, so only one chunk of HTML is held in
+    memory. Values wrapped in ``Deferred`` are computed during rendering.
+    The session cookie is sent before the body, so anything the template would
+    store in the session (flashed messages, the CSRF token) is resolved here.
+    """
+    get_flashed_messages()
+    generate_csrf()
+    template = current_app.jinja_env.get_or_select_template(template_name)
+    current_app.update_template_context(context)
+    fragments = template.generate(stream_flush=STREAM_FLUSH, **context)
+
+    # The head is rendered here, while the request context is active, so the
+    # first write does not leave the context pushed by a suspended generator
+    head = []
+    length = 0
+    for chunk in fragments:
+        if chunk == STREAM_FLUSH:
+            break
+        head.append(chunk)
+        length += len(chunk)
+        if length >= STREAM_CHUNK_SIZE:
+            break
+    return Response(
+        chain(
+            ["".join(head)], _buffered(stream_with_context(budgeted_stream(fragments)))
+        ),
+        mimetype="text/html",
+    )
+
+
 def _escape_like(val: str) -> str:
     if val is None:
         return val
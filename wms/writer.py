@@ -0,0 +1,209 @@
+"""Optional single-writer process for receipt posting.
+
+SQLite has one write lock, and with several gunicorn workers posting at the
+same time most of each request's time goes to waiting for it. When
+``POSTING_WRITER_SOCKET`` is set, routes hand their writes to one process
+(``flask posting-writer``) over a local Unix socket instead. The writer
+collects the jobs that arrive within ``POSTING_WRITER_WINDOW`` seconds (up to
+``POSTING_WRITER_BATCH`` of them), runs each in its own savepoint of a single
+``BEGIN IMMEDIATE`` transaction and commits once, so throughput grows with the
+batch size instead of collapsing under lock contention. A job that fails,
+whether on validation or with an unexpected error, only rolls back its
+savepoint.
+
+A request only waits ``POSTING_WRITER_TIMEOUT`` seconds for its job to be
+started. The writer tells the request when it starts a job and never starts
+one whose request has stopped waiting or has hung up, so a request that gave
+up with the busy message is never posted afterwards.
+
+Without the setting, ``submit()`` runs the job in the calling process as a
+batch of one, so routes use the same code either way.
+
+Stock-in, stock-out and receipt revocation are posting jobs. Batch imports
+and the tool routes still take the write lock in-process with ``posting()``:
+an import spends most of its time parsing the sheet rather than waiting for
+the lock, and tool slips are low-volume postings that do not compete with
+receipt posting.
+
+Jobs are plain functions registered with ``@posting_job(name)``. They take a
+picklable payload, write through ``db.session`` without committing, return a
+picklable result, and raise ``ValueError`` with a user-facing message to
+reject the submission.
+"""
+
+from multiprocessing.connection import Client, Listener
+import os
+import queue
+import threading
+import time
+
+from wms import app, db
+from wms.posting import PostingBusyError, posting
+
+# Registered posting jobs by name
+_JOBS: dict = {}
+
+
+def posting_job(name: str):
+    """Register a function as the posting job ``name``."""
+
+    def register(func):
+        _JOBS[name] = func
+        return func
+
+    return register
+
+
+def _authkey() -> bytes:
+    return str(app.secret_key).encode()
+
+
+# Seconds a request leaves for the writer's "started" message to reach it
+# before it stops waiting
+_START_MARGIN = 1.0
+
+_BUSY = "系统繁忙，请稍后重试。"
+_UNCONFIRMED = "过账结果未确认，请在操作记录中核对后再重新提交。"
+
+
+def run_batch(jobs: list, start=None) -> list:
+    """Run ``(name, payload)`` jobs in one transaction and return their replies.
+
+    Each reply is ``("ok", result)``, ``("error", message)`` or
+    ``("busy", message)``, in the order of ``jobs``. ``start``, if given, is
+    called with a job's index before the job runs; a job it returns False for
+    is skipped and answered with busy.
+    """
+    replies = []
+    try:
+        with posting():
+            session = db.session()
+            for index, (name, payload) in enumerate(jobs):
+                if start is not None and not start(index):
+                    replies.append(("busy", _BUSY))
+                    continue
+                try:
+                    with session.begin_nested():
+                        replies.append(("ok", _JOBS[name](payload)))
+                except ValueError as exc:
+                    replies.append(("error", str(exc)))
+                except Exception as exc:
+                    # Only this job's savepoint was rolled back; the rest of
+                    # the batch is still committed
+                    app.logger.exception("Posting job %s failed", name)
+                    replies.append(("error", f"处理过程中出现错误: {exc}"))
+            session.commit()
+    except PostingBusyError:
+        return [("busy", _BUSY)] * len(jobs)
+    except Exception as exc:
+        app.logger.exception("Posting batch of %d jobs failed", len(jobs))
+        return [("error", f"处理过程中出现错误: {exc}")] * len(jobs)
+    return replies
+
+
+def submit(name: str, payload):
+    """Run a posting job, through the writer process when one is configured.
+
+    Returns the job's result. Raises ``ValueError`` when the job rejected the
+    submission or its outcome is unknown, and ``PostingBusyError`` when it was
+    not written.
+    """
+    address = app.config["POSTING_WRITER_SOCKET"]
+    if not address:
+        status, value = run_batch([(name, payload)])[0]
+    else:
+        timeout = app.config["POSTING_WRITER_TIMEOUT"]
+        started = False
+        try:
+            with Client(address, authkey=_authkey()) as conn:
+                # The writer does not start the job after start_by, so giving
+                # up once the timeout has passed cannot leave it posted
+                start_by = time.time() + max(timeout - _START_MARGIN, 0)
+                conn.send((name, payload, start_by))
+                if not conn.poll(timeout):
+                    raise PostingBusyError("posting writer timed out")
+                status, value = conn.recv()
+                if status == "started":
+                    started = True
+                    if not conn.poll(timeout):
+                        raise EOFError("no reply after the job started")
+                    status, value = conn.recv()
+        except (OSError, EOFError) as exc:
+            if started:
+                app.logger.error("Posting job %s outcome unknown: %s", name, exc)
+                raise ValueError(_UNCONFIRMED) from exc
+            app.logger.error("Posting writer unavailable: %s", exc)
+            raise PostingBusyError("posting writer unavailable") from exc
+    if status == "ok":
+        return value
+    if status == "busy":
+        raise PostingBusyError(value)
+    raise ValueError(value)
+
+
+def _commit_loop(jobs: queue.Queue) -> None:
+    """Group the queued jobs into batches and commit each batch once."""
+    window = app.config["POSTING_WRITER_WINDOW"]
+    limit = app.config["POSTING_WRITER_BATCH"]
+    while True:
+        batch = [jobs.get()]
+        deadline = time.monotonic() + window
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        def start(index: int) -> bool:
+            # Only start jobs whose request is still waiting for them
+            _, _, conn, start_by = batch[index]
+            if time.time() >= start_by:
+                return False
+            try:
+                conn.send(("started", None))
+            except OSError:
+                return False  # The request hung up
+            return True
+
+        with app.app_context():
+            replies = run_batch(
+                [(name, payload) for name, payload, _, _ in batch], start
+            )
+        for (_, _, conn, _), reply in zip(batch, replies):
+            try:
+                conn.send(reply)
+            except OSError:
+                pass  # The request gave up waiting
+            finally:
+                conn.close()
+
+
+def _receive(conn, jobs: queue.Queue) -> None:
+    try:
+        name, payload, start_by = conn.recv()
+    except (OSError, EOFError):
+        conn.close()
+        return
+    if name not in _JOBS:
+        conn.send(("error", f"未知的过账操作: {name}"))
+        conn.close()
+        return
+    jobs.put((name, payload, conn, start_by))
+
+
+def serve(address: str) -> None:
+    """Accept posting jobs on ``address`` until the process is stopped."""
+    if os.path.exists(address):
+        os.unlink(address)
+    jobs: queue.Queue = queue.Queue()
+    threading.Thread(target=_commit_loop, args=(jobs,), daemon=True).start()
+    with Listener(address, family="AF_UNIX", authkey=_authkey()) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                continue  # Failed handshake, e.g. a wrong authkey
+            threading.Thread(target=_receive, args=(conn, jobs), daemon=True).start()